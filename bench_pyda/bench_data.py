@@ -0,0 +1,257 @@
+'''
+Purpose: Synthetic inputs for the benchmarks (bench_pyda.py), shaped like the
+         files the scripts read on /scratch1:
+            FV3 members   <casedir>/<cycle>/mem00NN/fcst_fv3lam/dynf003.nc (+ phyf003.nc)
+            UFO files     <var>@GsiHofX/@GsiHofXBc/@hofx/@ObsValue/... + MetaData
+            GSI diag      diag_conv_<var>_ges.<cycle>.nc4
+
+Input: none (fields and obs are drawn from a seeded random generator, so the
+       same arguments always give the same files)
+
+Output: the NetCDF files
+
+History Log:
+   2026.10.18: Created
+
+Usage:
+   python bench_data.py fv3  ROOT [--grid 13km|3km] [--cases 2] [--cycles 4] [--members 10]
+   python bench_data.py ufo  FILE NOBS [--variable air_temperature]
+   python bench_data.py diag FILE NOBS
+
+Note:
+   - the FV3 variables are chunked one layer per chunk and only the layers in
+     --layers (default: the bottom one, 65) are written; the other layers are
+     never allocated on disk, so a 3 km member stays small while the layer
+     the scripts read has the full size.  --full-column writes every layer
+   - obs files are written in blocks of BLOCK obs, so 10^7 obs need little memory
+'''
+
+import numpy as np
+import os
+import argparse
+from netCDF4 import Dataset
+
+
+# Horizontal grids (nx, ny) and number of layers
+GRIDS = {'13km': (393, 225), '3km': (1799, 1059)}
+NLAYER = 65
+
+# Obs written per block
+BLOCK = 1000000
+
+# ObsType codes drawn for the obs
+OBS_TYPES = [120, 126, 180, 181, 183, 187, 188, 193, 194, 195]
+
+CYCLE0 = np.datetime64('2021-09-15T00')
+
+
+#%%============================================================================
+#  FV3 members
+# =============================================================================
+def fv3_grid(grid):
+
+    # CONUS lat/lon and a smooth terrain on the grid
+    nx, ny = GRIDS[grid]
+    lon, lat = np.meshgrid(np.linspace(237.3, 299.0, nx), np.linspace(21.1, 52.6, ny))
+    hgt = np.maximum(0.0, 2500.0 * np.exp(-((lon - 250.0)/8.0)**2) * (0.6 + 0.4*np.cos(np.deg2rad(6*lat))))
+    land = ((lon < 290.0) & (lat > 25.0 + 0.1*(lon - 260.0))).astype(np.float32)
+    return lon, lat, hgt, land
+
+
+def write_member(fname, grid, cycle, layers, seed):
+
+    nx, ny = GRIDS[grid]
+    lon, lat, hgt = fv3_grid(grid)[0:3]
+    rng = np.random.default_rng(seed)
+
+    with Dataset(fname, 'w', format='NETCDF4') as f:
+        f.createDimension('time', 1)
+        f.createDimension('pfull', NLAYER)
+        f.createDimension('grid_yt', ny)
+        f.createDimension('grid_xt', nx)
+        f.createVariable('lon', 'f8', ('grid_yt','grid_xt'))[:] = lon
+        f.createVariable('lat', 'f8', ('grid_yt','grid_xt'))[:] = lat
+        f.createVariable('hgtsfc', 'f4', ('time','grid_yt','grid_xt'))[:] = hgt[None,:,:]
+
+        # temperature and humidity: a large-scale pattern that moves with the
+        # cycle, lapse rate over the terrain, member perturbations
+        pattern = np.sin(np.deg2rad(3*lon + 10*cycle)) * np.cos(np.deg2rad(2*lat))
+        for vname, base, scale, lapse in [('tmp', 288.0, 6.0, -0.0065), ('spfh', 0.010, 0.004, -2.0e-6)]:
+            var = f.createVariable(vname, 'f4', ('time','pfull','grid_yt','grid_xt'),
+                                   chunksizes=(1, 1, ny, nx))
+            for layer in layers:
+                depth = (NLAYER - layer) / NLAYER
+                field = base*(1.0 - 0.3*depth) + scale*pattern + lapse*hgt + \
+                        0.1*scale*rng.standard_normal((ny, nx))
+                var[0, layer-1, :, :] = field.astype(np.float32)
+
+
+def write_phy(fname, grid):
+
+    nx, ny = GRIDS[grid]
+    land = fv3_grid(grid)[3]
+    with Dataset(fname, 'w', format='NETCDF4') as f:
+        f.createDimension('time', 1)
+        f.createDimension('grid_yt', ny)
+        f.createDimension('grid_xt', nx)
+        f.createVariable('land', 'f4', ('time','grid_yt','grid_xt'))[:] = land[None,:,:]
+
+
+def cycle_names(ncycle):
+
+    # 3-hourly cycles from CYCLE0, as the scripts count them
+    return [str(CYCLE0 + np.timedelta64(3*cc, 'h')).replace('-','').replace('T','') for cc in range(ncycle)]
+
+
+def make_fv3_cases(root, grid='13km', ncase=2, ncycle=4, nmember=10, layers=[NLAYER]):
+    '''
+    Returns the case directories, <root>/<grid>_caseNN
+    '''
+    casedirs = []
+    for case in range(ncase):
+        casedir = os.path.join(root, grid + '_case' + str(case+1).zfill(2))
+        for cc, cycle in enumerate(cycle_names(ncycle)):
+            for mm in range(nmember):
+                memdir = os.path.join(casedir, cycle, 'mem00' + str(mm+1).zfill(2), 'fcst_fv3lam')
+                os.makedirs(memdir, exist_ok=True)
+                write_member(os.path.join(memdir, 'dynf003.nc'), grid, cc, layers,
+                             seed=(case*1000 + cc)*1000 + mm)
+                write_phy(os.path.join(memdir, 'phyf003.nc'), grid)
+        casedirs.append(casedir)
+    return casedirs
+
+
+#%%============================================================================
+#  Observation files
+# =============================================================================
+def _obs_block(rng, n):
+
+    # the MetaData of n obs: stations reporting at several levels/times
+    station = rng.integers(0, max(n // 20, 1), n)
+    obs = {}
+    obs['lat'] = (21.0 + 31.0 * ((station * 0.618034) % 1.0) + rng.normal(0.0, 0.01, n)).astype(np.float32)
+    obs['lon'] = (237.0 + 62.0 * ((station * 0.754878) % 1.0) + rng.normal(0.0, 0.01, n)).astype(np.float32)
+    obs['pressure'] = rng.uniform(10000.0, 105000.0, n).astype(np.float32)
+    obs['height'] = (44330.0 * (1.0 - (obs['pressure'] / 101325.0)**0.1903)).astype(np.float32)
+    obs['elevation'] = rng.uniform(0.0, 3000.0, n).astype(np.float32)
+    obs['time'] = rng.uniform(-3.0, 3.0, n).astype(np.float32)
+    obs['otype'] = rng.choice(OBS_TYPES, n).astype(np.int32)
+    obs['sid'] = np.char.ljust(np.char.mod('S%04d', station % 10000), 8).astype('S8')
+    return obs
+
+
+def make_ufo_file(fname, nobs, VarName='air_temperature', seed=0):
+
+    base, scale = {'specific_humidity': (0.008, 0.002)}.get(VarName, (285.0, 2.0))
+    rng = np.random.default_rng(seed)
+    with Dataset(fname, 'w', format='NETCDF4') as f:
+        f.createDimension('nlocs', nobs)
+        f.createDimension('nstring', 8)
+        meta = {'latitude': 'lat', 'longitude': 'lon', 'air_pressure': 'pressure', 'height': 'height',
+                'station_elevation': 'elevation', 'time': 'time'}
+        for name in meta:
+            f.createVariable(name + '@MetaData', 'f4', ('nlocs',))
+        f.createVariable('station_id@MetaData', 'S1', ('nlocs','nstring'))
+        for group in ['GsiHofX','GsiHofXBc','hofx','ObsValue','ombg','oman','EffectiveError','GsiFinalObsError']:
+            f.createVariable(VarName + '@' + group, 'f4', ('nlocs',))
+        for group in ['ObsType','GsiUseFlag','PreUseFlag','EffectiveQC']:
+            f.createVariable(VarName + '@' + group, 'i4', ('nlocs',))
+
+        for start in range(0, nobs, BLOCK):
+            n = min(BLOCK, nobs - start)
+            rows = slice(start, start + n)
+            obs = _obs_block(rng, n)
+            for name, key in meta.items():
+                f.variables[name + '@MetaData'][rows] = obs[key]
+            f.variables['station_id@MetaData'][rows] = obs['sid'].view('S1').reshape(n, 8)
+
+            # hofx of UFO equal to GSI's but for a few percent of the obs
+            gsi = (base + scale * rng.standard_normal(n)).astype(np.float32)
+            ufo = gsi - (0.3 * scale * rng.standard_normal(n) * (rng.random(n) < 0.05)).astype(np.float32)
+            value = gsi + scale * rng.standard_normal(n).astype(np.float32)
+            f.variables[VarName + '@GsiHofX'][rows] = gsi
+            f.variables[VarName + '@GsiHofXBc'][rows] = gsi + 0.1 * scale
+            f.variables[VarName + '@hofx'][rows] = ufo
+            f.variables[VarName + '@ObsValue'][rows] = value
+            f.variables[VarName + '@ombg'][rows] = value - ufo
+            f.variables[VarName + '@oman'][rows] = 0.7 * (value - ufo)
+            f.variables[VarName + '@EffectiveError'][rows] = np.full(n, scale, dtype=np.float32)
+            f.variables[VarName + '@GsiFinalObsError'][rows] = np.full(n, scale, dtype=np.float32)
+            f.variables[VarName + '@ObsType'][rows] = obs['otype']
+            f.variables[VarName + '@GsiUseFlag'][rows] = rng.choice([-1, 1], n).astype(np.int32)
+            f.variables[VarName + '@PreUseFlag'][rows] = rng.choice([0, 1, 9, 15], n).astype(np.int32)
+            f.variables[VarName + '@EffectiveQC'][rows] = rng.choice([0, 0, 0, 1, 10], n).astype(np.int32)
+
+
+def make_gsi_diag(fname, nobs, seed=0):
+
+    rng = np.random.default_rng(seed)
+    with Dataset(fname, 'w', format='NETCDF4') as f:
+        f.date_time = int(str(CYCLE0).replace('-','').replace('T',''))
+        f.createDimension('nobs', nobs)
+        f.createDimension('Station_ID_maxstrlen', 8)
+        names = ['Latitude','Longitude','Pressure','Height','Station_Elevation','Time','Prep_Use_Flag',
+                 'Analysis_Use_Flag','Observation','Obs_Minus_Forecast_adjusted',
+                 'Obs_Minus_Forecast_unadjusted','Errinv_Final','Prep_QC_Mark','Setup_QC_Mark']
+        for name in names:
+            f.createVariable(name, 'f4', ('nobs',))
+        f.createVariable('Observation_Type', 'i4', ('nobs',))
+        f.createVariable('Observation_Class', 'i4', ('nobs',))
+        f.createVariable('Station_ID', 'S1', ('nobs','Station_ID_maxstrlen'))
+
+        for start in range(0, nobs, BLOCK):
+            n = min(BLOCK, nobs - start)
+            rows = slice(start, start + n)
+            obs = _obs_block(rng, n)
+            omf = rng.standard_normal(n).astype(np.float32)
+            f.variables['Latitude'][rows] = obs['lat']
+            f.variables['Longitude'][rows] = obs['lon']
+            f.variables['Pressure'][rows] = obs['pressure'] / 100.0
+            f.variables['Height'][rows] = obs['height']
+            f.variables['Station_Elevation'][rows] = obs['elevation']
+            f.variables['Time'][rows] = obs['time']
+            f.variables['Prep_Use_Flag'][rows] = rng.choice([0, 1, 2, 3, 8, 9, 10, 15], n).astype(np.float32)
+            f.variables['Analysis_Use_Flag'][rows] = rng.choice([-1, 1], n).astype(np.float32)
+            f.variables['Observation'][rows] = 285.0 + 2.0 * rng.standard_normal(n).astype(np.float32)
+            f.variables['Obs_Minus_Forecast_adjusted'][rows] = omf - 0.1
+            f.variables['Obs_Minus_Forecast_unadjusted'][rows] = omf
+            f.variables['Errinv_Final'][rows] = np.full(n, 0.5, dtype=np.float32)
+            f.variables['Prep_QC_Mark'][rows] = np.zeros(n, dtype=np.float32)
+            f.variables['Setup_QC_Mark'][rows] = np.zeros(n, dtype=np.float32)
+            f.variables['Observation_Type'][rows] = obs['otype']
+            f.variables['Observation_Class'][rows] = np.zeros(n, dtype=np.int32)
+            f.variables['Station_ID'][rows] = obs['sid'].view('S1').reshape(n, 8)
+
+
+#=====================================================================
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Synthetic inputs for the pyda benchmarks')
+    sub = parser.add_subparsers(dest='kind', required=True)
+    p = sub.add_parser('fv3')
+    p.add_argument('root')
+    p.add_argument('--grid', choices=sorted(GRIDS), default='13km')
+    p.add_argument('--cases', type=int, default=2)
+    p.add_argument('--cycles', type=int, default=4)
+    p.add_argument('--members', type=int, default=10)
+    p.add_argument('--layers', type=int, nargs='+', default=[NLAYER])
+    p.add_argument('--full-column', action='store_true')
+    p = sub.add_parser('ufo')
+    p.add_argument('filename')
+    p.add_argument('nobs', type=float)
+    p.add_argument('--variable', default='air_temperature')
+    p = sub.add_parser('diag')
+    p.add_argument('filename')
+    p.add_argument('nobs', type=float)
+    args = parser.parse_args()
+
+    if args.kind == 'fv3':
+        layers = list(range(1, NLAYER+1)) if args.full_column else args.layers
+        for casedir in make_fv3_cases(args.root, args.grid, args.cases, args.cycles, args.members, layers):
+            print(casedir)
+    elif args.kind == 'ufo':
+        make_ufo_file(args.filename, int(args.nobs), args.variable)
+        print(args.filename)
+    else:
+        make_gsi_diag(args.filename, int(args.nobs))
+        print(args.filename)
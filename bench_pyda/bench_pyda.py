@@ -0,0 +1,302 @@
+'''
+Purpose: Benchmarks of the pyda scripts on synthetic inputs (bench_data.py),
+         so timings can be reproduced anywhere and compared between commits.
+
+         Every stage is run as its own process, the way it runs on the HPC,
+         and timed (wall, user and system CPU time) with its peak memory:
+            FV3 ensemble   data process (get_data), maps (plot_map), time series (plot_ts)
+            FV3 domain     data process (data_process), time series (plotting)
+            UFO            listing (list_ufo_omb), plotting (plt_ufo_omb)
+            JEDI obs       listing (list_jedi_obs_nc)
+            GSI diag       listing (list_gsi_diag_nc)
+            inventory      listing of the GSI diag + UFO files (list_obs_inventory)
+
+Input: none; the inputs are generated in WORKDIR/data on first use and reused
+
+Output: JSON file of the results (--output), and the table (stdout);
+        with --compare, the ratios to an earlier JSON file
+
+History Log:
+   2026.10.18: Created
+
+Usage:
+   python bench_pyda.py [--workdir DIR] [--suites fv3 obs] [--grids 13km 3km]
+                        [--sizes 1e3 1e4 1e5 1e6 1e7] [--members 10] [--cycles 4]
+                        [--repeat N] [--workers N] [--only PATTERN]
+                        [--output FILE.json] [--compare BASE.json]
+
+Note:
+   - peak_rss_mb is the peak resident memory of the stage process, or of the
+     largest of its worker processes (os.wait4)
+   - the times include starting Python and importing the modules, as on the HPC
+   - the output of each run is kept in WORKDIR/run/<benchmark>/bench.log
+   - 3km members and 10^7 obs take a few GB of disk in WORKDIR/data
+'''
+
+import numpy as np
+import sys
+import os
+import time
+import json
+import fnmatch
+import platform
+import argparse
+import subprocess
+import yaml
+import netCDF4
+
+import bench_data
+
+
+# Repository root (the scripts are run from their copies in the tree)
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# Defaults of the suites
+GRIDS   = ['13km']
+SIZES   = [1e3, 1e4, 1e5, 1e6]
+MEMBERS = 10
+CYCLES  = 4
+
+# Variable of the obs benchmarks
+VAR_NAME = 'air_temperature'
+
+
+def script(directory, name):
+
+    return os.path.abspath(os.path.join(REPO, directory, name))
+
+
+#%%============================================================================
+#  Running one stage
+# =============================================================================
+def run_stage(cmd, rundir):
+    '''
+    Runs cmd in rundir; returns wall/user/sys time [s], peak RSS [MB] and the
+    exit code
+    '''
+    os.makedirs(rundir, exist_ok=True)
+    with open(os.path.join(rundir, 'bench.log'), 'a') as log:
+        log.write('$ ' + ' '.join(cmd) + '\n')
+        log.flush()
+        start = time.perf_counter()
+        proc = subprocess.Popen(cmd, cwd=rundir, stdout=log, stderr=subprocess.STDOUT)
+        _, status, usage = os.wait4(proc.pid, 0)
+        wall = time.perf_counter() - start
+        proc.returncode = os.waitstatus_to_exitcode(status)
+
+    return {'wall_s': round(wall, 4),
+            'user_s': round(usage.ru_utime, 4),
+            'sys_s':  round(usage.ru_stime, 4),
+            'peak_rss_mb': round(usage.ru_maxrss / 1024.0, 1),
+            'returncode': proc.returncode}
+
+
+#%%============================================================================
+#  Benchmarks: (name, parameters, [(stage, command), ...], run directory)
+# =============================================================================
+def fv3_benchmarks(workdir, grid, members, cycles, workers):
+
+    datadir = os.path.join(workdir, 'data', 'fv3_' + grid + '_m' + str(members) + '_c' + str(cycles))
+    casedirs = [os.path.join(datadir, grid + '_case' + str(cc+1).zfill(2)) for cc in range(2)]
+    if not os.path.isdir(casedirs[-1]):
+        print('  generating FV3 members (' + grid + ') in ' + datadir)
+        bench_data.make_fv3_cases(datadir, grid, 2, cycles, members)
+
+    params = {'grid': grid, 'members': members, 'cycles': cycles, 'workers': workers}
+    benchmarks = []
+
+    # ensemble script: both cases
+    rundir = os.path.join(workdir, 'run', 'fv3_ens_' + grid)
+    config = write_config(rundir, 'ens', {
+        'size_cycle': cycles, 'caseid': [1, 2], 'case_label': ['case01', 'case02'], 'casedir': casedirs,
+        'size_member': members, 'variable_list': ['tmp', 'spfh']})
+    cmd = [sys.executable, script('plt_fv3_ens_mean_std', 'plt_fv3_ens_mean_std.py'), '--config', config]
+    benchmarks.append(('fv3_ens/' + grid, params,
+                       [('get_data', cmd + ['--stages', 'get_data', '--force', '--workers', str(workers)]),
+                        ('plot_map', cmd + ['--stages', 'plot_map', '--force']),
+                        ('plot_ts',  cmd + ['--stages', 'plot_ts', '--force'])], rundir))
+
+    # domain script: the first case
+    rundir = os.path.join(workdir, 'run', 'fv3_domain_' + grid)
+    config = write_config(rundir, 'domain', {
+        'caseid': 1, 'casedir': casedirs[0], 'size_cycle': cycles, 'size_member': members,
+        'variable_list': ['tmp', 'spfh']})
+    cmd = [sys.executable, script('plt_fv3_domain_mean_std', 'plt_fv3_domain_mean_std.py'), '--config', config]
+    benchmarks.append(('fv3_domain/' + grid, params,
+                       [('data_process', cmd + ['--stages', 'data_process', '--force', '--workers', str(workers)]),
+                        ('plotting',     cmd + ['--stages', 'plotting', '--force'])], rundir))
+    return benchmarks
+
+
+def write_config(rundir, kind, settings):
+
+    # the stages of the script's own config, with the benchmark settings
+    for sub in ['data_output', 'figures']:
+        os.makedirs(os.path.join(rundir, sub), exist_ok=True)
+    if kind == 'ens':
+        base = script('plt_fv3_ens_mean_std', 'plt_fv3_ens_mean_std.yaml')
+    else:
+        base = script('plt_fv3_domain_mean_std', 'plt_fv3_domain_mean_std.yaml')
+    with open(base) as f:
+        config = yaml.safe_load(f)
+    config['settings'] = settings
+    fname = os.path.join(rundir, 'bench_' + kind + '.yaml')
+    with open(fname, 'w') as f:
+        yaml.safe_dump(config, f, sort_keys=False)
+    return fname
+
+
+def obs_benchmarks(workdir, nobs, workers):
+
+    datadir = os.path.join(workdir, 'data', 'obs_' + str(nobs))
+    ufo  = os.path.join(datadir, 'ufo_bench_' + bench_data.cycle_names(1)[0] + '_t_0000.nc4')
+    diag = os.path.join(datadir, 'diag_conv_t_ges.' + bench_data.cycle_names(1)[0] + '.nc4')
+    os.makedirs(datadir, exist_ok=True)
+    if not os.path.exists(ufo):
+        print('  generating ' + ufo)
+        bench_data.make_ufo_file(ufo + '.tmp', nobs, VAR_NAME)
+        os.replace(ufo + '.tmp', ufo)
+    if not os.path.exists(diag):
+        print('  generating ' + diag)
+        bench_data.make_gsi_diag(diag + '.tmp', nobs)
+        os.replace(diag + '.tmp', diag)
+
+    params = {'nobs': nobs, 'workers': workers}
+    rundir = os.path.join(workdir, 'run', 'obs_' + str(nobs))
+    py = sys.executable
+    return [
+        ('list_ufo_omb/' + str(nobs), params,
+         [('listing', [py, script('list_jedi_ufo_omb', 'list_ufo_omb.py'), ufo, 'bench', VAR_NAME, 'bench'])], rundir),
+        ('plt_ufo_omb/' + str(nobs), params,
+         [('plotting', [py, script('plt_jedi_ufo_omb', 'plt_ufo_omb.py'), ufo, 'bench', VAR_NAME, 'bench'])], rundir),
+        ('list_jedi_obs_nc/' + str(nobs), params,
+         [('listing', [py, script('list_jedi_obs_nc', 'list_jedi_obs_nc.py'), ufo, '--variable', VAR_NAME])], rundir),
+        ('list_gsi_diag_nc/' + str(nobs), params,
+         [('listing', [py, script('list_gsi_diag_nc', 'list_gsi_diag_nc.py'), diag])], rundir),
+        ('list_obs_inventory/' + str(nobs), params,
+         [('listing', [py, script('list_obs_inventory', 'list_obs_inventory.py'), datadir,
+                       '--workers', str(workers)])], rundir)]
+
+
+#%%============================================================================
+#  Results
+# =============================================================================
+def git_commit():
+
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def metadata(args):
+
+    return {'commit': git_commit(),
+            'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'host': platform.node(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'netCDF4': netCDF4.__version__,
+            'args': vars(args)}
+
+
+def best(results):
+
+    # {(benchmark, stage): fastest successful run}
+    out = {}
+    for rr in results:
+        if rr['returncode'] != 0:
+            continue
+        key = (rr['benchmark'], rr['stage'])
+        if key not in out or rr['wall_s'] < out[key]['wall_s']:
+            out[key] = rr
+    return out
+
+
+def print_results(results):
+
+    print(" ")
+    print("  %-28s %-14s %10s %10s %10s %8s" % ('Benchmark', 'Stage', 'Wall [s]', 'CPU [s]', 'RSS [MB]', 'Status'))
+    for rr in results:
+        print("  %-28s %-14s %10.3f %10.3f %10.1f %8s" % (rr['benchmark'], rr['stage'], rr['wall_s'],
+              rr['user_s'] + rr['sys_s'], rr['peak_rss_mb'], 'ok' if rr['returncode'] == 0 else 'FAILED'))
+
+
+def print_compare(results, base):
+
+    # fastest runs of this and the base file side by side
+    now  = best(results)
+    then = best(base['results'])
+    print(" ")
+    print("--- Compared with " + base['meta']['commit'] + " (" + base['meta']['date'] + ") ---")
+    print("  %-28s %-14s %10s %10s %8s %10s" % ('Benchmark', 'Stage', 'Base [s]', 'Now [s]', 'Ratio', 'RSS ratio'))
+    for key in sorted(set(now) & set(then)):
+        print("  %-28s %-14s %10.3f %10.3f %8.2f %10.2f" % (key[0], key[1], then[key]['wall_s'], now[key]['wall_s'],
+              now[key]['wall_s'] / then[key]['wall_s'], now[key]['peak_rss_mb'] / then[key]['peak_rss_mb']))
+    for key in sorted(set(then) - set(now)):
+        print("  %-28s %-14s %10.3f %10s" % (key[0], key[1], then[key]['wall_s'], 'missing'))
+
+
+#=====================================================================
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Benchmarks of the pyda scripts on synthetic inputs')
+    parser.add_argument('--workdir', default='./bench_work',
+                        help='directory of the generated inputs and the runs')
+    parser.add_argument('--suites', nargs='+', choices=['fv3','obs'], default=['fv3','obs'])
+    parser.add_argument('--grids', nargs='+', choices=sorted(bench_data.GRIDS), default=GRIDS,
+                        help='FV3 grids (3km: 1799 x 1059)')
+    parser.add_argument('--sizes', type=float, nargs='+', default=SIZES,
+                        help='numbers of obs of the obs files')
+    parser.add_argument('--members', type=int, default=MEMBERS)
+    parser.add_argument('--cycles', type=int, default=CYCLES)
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='runs of each stage (the comparison takes the fastest)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='--workers of the scripts that have it')
+    parser.add_argument('--only', default=None,
+                        help='run only the benchmarks matching this glob, e.g. "list_ufo_omb/*"')
+    parser.add_argument('--output', default='bench_results.json',
+                        help='JSON file of the results')
+    parser.add_argument('--compare', default=None,
+                        help='JSON file of an earlier run to compare with')
+    args = parser.parse_args()
+
+    workdir = os.path.abspath(args.workdir)
+    print("--- Preparing the inputs in " + workdir + " ---")
+    benchmarks = []
+    if 'fv3' in args.suites:
+        for grid in args.grids:
+            benchmarks += fv3_benchmarks(workdir, grid, args.members, args.cycles, args.workers)
+    if 'obs' in args.suites:
+        for nobs in args.sizes:
+            benchmarks += obs_benchmarks(workdir, int(nobs), args.workers)
+    if args.only is not None:
+        benchmarks = [bb for bb in benchmarks if fnmatch.fnmatch(bb[0], args.only)]
+
+    print("--- Running " + str(len(benchmarks)) + " benchmark(s) ---")
+    results = []
+    for name, params, stages, rundir in benchmarks:
+        for repeat in range(args.repeat):
+            for stage, cmd in stages:
+                result = run_stage(cmd, rundir)
+                result.update({'benchmark': name, 'stage': stage, 'repeat': repeat}, **params)
+                results.append(result)
+                print("  -> " + name + " " + stage + ": " + str(result['wall_s']) + " s, " +
+                      str(result['peak_rss_mb']) + " MB" + ("" if result['returncode'] == 0 else "  FAILED"))
+
+    print_results(results)
+    with open(args.output, 'w') as f:
+        json.dump({'meta': metadata(args), 'results': results}, f, indent=1)
+    print(" ")
+    print("--- Results written to " + args.output + " ---")
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            print_compare(results, json.load(f))
+
+    if any([rr['returncode'] != 0 for rr in results]):
+        sys.exit(1)
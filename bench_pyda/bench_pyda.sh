@@ -0,0 +1,14 @@
+#module use -a /scratch2/NCEPDEV/marineda/Jong.Kim/save/modulefiles
+#module load anaconda/3.15.1
+
+# Inputs are generated once in $workdir/data and reused by later runs
+workdir=/scratch1/BMC/zrtrr/llin/bench_pyda
+commit=$(git -C .. rev-parse --short HEAD)
+
+python bench_pyda.py --workdir $workdir --output bench_${commit}.json >& bench_${commit}.log
+
+# Compare with an earlier commit:
+#python bench_pyda.py --workdir $workdir --output bench_${commit}.json --compare bench_<old commit>.json
+
+# 3 km grid and 10^7 obs:
+#python bench_pyda.py --workdir $workdir --grids 13km 3km --sizes 1e3 1e4 1e5 1e6 1e7 --output bench_${commit}_full.json
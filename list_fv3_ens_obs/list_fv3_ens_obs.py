@@ -0,0 +1,150 @@
+'''
+Purpose: Ensemble mean and spread of an FV3 field at the observation locations
+         of a UFO (JEDI) file, for spread-skill and rank-histogram checks.
+
+Input: FV3 dyn or phy forecast files of the members, and a UFO NetCDF file
+
+Output: spread-skill summary and rank histogram (stdout), and optionally a CSV
+        file of the ensemble mean, spread and rank at every obs (--output)
+
+History Log:
+   2026.10.18: Created
+
+Usage:
+   python list_fv3_ens_obs.py casedir time_str filename [--variable tmp] [--obs-var air_temperature]
+                              [--layer 65] [--members 20] [--file-type dyn] [--cache-dir DIR]
+                              [--prefetch K] [--output FILE.csv]
+                              [--instrument report.json|report.csv] [--cprofile FILE]
+
+Note:
+   - the bilinear weights from the FV3 lat/lon grid to latitude@MetaData and
+     longitude@MetaData (pyda_util/obs_interp.py) are saved in --cache-dir and
+     reused for the same grid and obs file; all the members are then
+     interpolated with one sparse matrix product
+   - the obs outside the grid, and the ones whose value or interpolated
+     members are not valid, are left out of the statistics
+   - spread/RMSE near 1 for a well-spread ensemble; a U-shaped rank histogram
+     for an under-dispersive one
+   - the field and the obs have to be in the same units (e.g. tmp [K] and
+     air_temperature [K])
+'''
+
+import numpy as np
+import sys
+import os
+import argparse
+
+# Shared helpers (repository root)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pyda_util.fv3_io import member_file_name, read_fv3_lonlat, prefetch_fv3_layers_valid, PREFETCH_DEPTH
+from pyda_util.ufo_io import UfoFile
+from pyda_util.nc_read import combine_valid
+from pyda_util.obs_interp import interp_weights, inside, interp_members, ens_at_obs, obs_rank, rank_histogram
+from pyda_util import instrument
+
+
+# Directory of the cached interpolation weights
+CACHE_DIR = './data_output'
+
+
+def read_members(casedir, time_str, VarName, layer, size_member, file_type='dyn', prefetch=PREFETCH_DEPTH):
+
+    # (ny*nx, member) array of one layer of every member; invalid points are NaN
+    fnames = [member_file_name(casedir, time_str, mm, file_type) for mm in range(1, size_member+1)]
+    members = None
+    for mm, (data, valid) in enumerate(prefetch_fv3_layers_valid(fnames, VarName, layer, depth=prefetch)):
+        field = data[VarName].reshape(-1)
+        if members is None:
+            members = np.empty((field.size, size_member), dtype=field.dtype)
+        members[:,mm] = field
+        if valid[VarName] is not None:
+            members[~valid[VarName].reshape(-1),mm] = np.nan
+    return members
+
+
+def write_csv(fname, lat, lon, obs, mean, spread, rank):
+
+    tmpname = fname + '.' + str(os.getpid())
+    with open(tmpname, 'w') as f:
+        f.write('lat,lon,obs,ens_mean,ens_spread,rank\n')
+        for row in zip(lat, lon, obs, mean, spread, rank):
+            f.write('%.5f,%.5f,%.6g,%.6g,%.6g,%d\n' % row)
+    os.replace(tmpname, fname)
+
+#=====================================================================
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Ensemble mean and spread of an FV3 field at the obs locations')
+    parser.add_argument('casedir', help='case directory (<casedir>/<time_str>/mem00NN/fcst_fv3lam/)')
+    parser.add_argument('time_str', help='cycle, e.g. 2021091621')
+    parser.add_argument('filename', help='UFO file of the obs')
+    parser.add_argument('--variable', default='tmp', help='FV3 variable')
+    parser.add_argument('--obs-var', default='air_temperature', help='obs variable (<obs-var>@ObsValue)')
+    parser.add_argument('--layer', type=int, default=65, help='layer of the FV3 variable (from 1)')
+    parser.add_argument('--members', type=int, default=20, help='number of members')
+    parser.add_argument('--file-type', default='dyn', help='dyn or phy')
+    parser.add_argument('--cache-dir', default=CACHE_DIR, help='directory of the cached interpolation weights')
+    parser.add_argument('--prefetch', type=int, default=PREFETCH_DEPTH,
+                        help='member files read ahead of the one being stacked (0: none)')
+    parser.add_argument('--output', default=None, help='CSV file of the ensemble at every obs')
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+    instrument.setup(args)
+
+    # Obs locations and values
+    with UfoFile(args.filename) as ufo_file:
+        lat, lat_valid = ufo_file.read_valid('latitude@MetaData')
+        lon, lon_valid = ufo_file.read_valid('longitude@MetaData')
+        obs, obs_valid = ufo_file.read_valid(args.obs_var+'@ObsValue')
+    # obs without a valid location get no weights
+    located = combine_valid(lat_valid, lon_valid)
+    if located is not None:
+        lat = np.where(located, lat, np.nan)
+
+    # Interpolation weights (cached per grid and obs set) and the members at the obs
+    grid_lon, grid_lat = read_fv3_lonlat(member_file_name(args.casedir, args.time_str, 1, args.file_type))
+    with instrument.span('stage', 'weights'):
+        weights = interp_weights(grid_lat, grid_lon, lat, lon, args.cache_dir)
+    with instrument.span('stage', 'read_members'):
+        members = read_members(args.casedir, args.time_str, args.variable, args.layer, args.members,
+                               args.file_type, args.prefetch)
+    with instrument.span('stage', 'interp'):
+        hx = interp_members(weights, members)
+
+    use = inside(weights) & np.all(np.isfinite(hx), axis=1) & np.isfinite(obs)
+    if obs_valid is not None:
+        use &= obs_valid
+    mean, spread = ens_at_obs(hx[use])
+    rank = obs_rank(hx[use], obs[use])
+    omb  = obs[use] - mean
+
+    print(" ")
+    print("===================================================")
+    print("ENSEMBLE AT THE OBS: " + args.variable + " (layer " + str(args.layer) + ") v.s. " + args.obs_var)
+    print("===================================================")
+    print("--- Numbers of obs ---")
+    print("  in the file:       " + str(len(obs)))
+    print("  inside the grid:   " + str(np.sum(inside(weights))))
+    print("  used:              " + str(np.sum(use)))
+    if np.sum(use) == 0:
+        sys.exit(0)
+
+    rmse = np.sqrt(np.mean(omb**2))
+    print(" ")
+    print("--- Spread-skill (obs - ens mean) ---")
+    print("  bias:              %12.5g" % np.mean(omb))
+    print("  RMSE:              %12.5g" % rmse)
+    print("  mean spread:       %12.5g" % np.mean(spread))
+    print("  RMS spread:        %12.5g" % np.sqrt(np.mean(spread**2)))
+    print("  RMS spread / RMSE: %12.5g" % (np.sqrt(np.mean(spread**2)) / rmse if rmse > 0 else np.nan))
+
+    hist = rank_histogram(rank, args.members)
+    print(" ")
+    print("--- Rank histogram (flat: " + str(round(np.sum(use) / (args.members + 1.0), 1)) + " per rank) ---")
+    for ii in range(0, args.members+1):
+        print("  %4d %8d %s" % (ii, hist[ii], '*' * int(round(50.0 * hist[ii] / max(hist)))))
+
+    if args.output is not None:
+        write_csv(args.output, lat[use], lon[use], obs[use], mean, spread, rank)
+        print(" ")
+        print("--- Written: " + args.output + " ---")
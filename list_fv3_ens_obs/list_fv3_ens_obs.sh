@@ -0,0 +1 @@
+python list_fv3_ens_obs.py /scratch/case54 2021091621 ufo_sfc_2021091621_t_0000.nc4 --variable tmp --obs-var air_temperature --layer 65 --members 20 --output ens_obs_tmp.csv >& list_fv3_ens_obs.log
@@ -7,11 +7,22 @@ Output:
 
 History Log:
    2022.05.11: Liaofan Lin - Created
+   2026.10.18: Size of each data type from one np.unique (see also list_obs_inventory)
+   2026.10.18: Command line through argparse; --instrument FILE writes a timing/IO/memory
+               report (pyda_util/instrument.py)
+
+Usage:
+   python list_gsi_diag_nc.py filename [--instrument report.json|report.csv] [--cprofile FILE]
 '''
 
 import numpy as np
 import sys
-from netCDF4 import Dataset
+import os
+import argparse
+
+# Shared helpers (repository root)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pyda_util import instrument
 
 
 if __name__ == '__main__':
@@ -20,7 +31,12 @@ if __name__ == '__main__':
     # General Information
     # ===============================================
     # Get arguments
-    filename = sys.argv[1]    
+    parser = argparse.ArgumentParser(description='List the content of a GSI diag file')
+    parser.add_argument('filename')
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+    instrument.setup(args)
+    filename = args.filename
 
     print(" ")
     print("===================================================") 
@@ -30,7 +46,7 @@ if __name__ == '__main__':
     print(f"  {filename}")
     
     # Read the file
-    f = Dataset(filename, mode='r')
+    f = instrument.nc_open(filename, mode='r')
     o_type = f.variables['Observation_Type'][:] 
     
     # Print All Variables
@@ -58,16 +74,14 @@ if __name__ == '__main__':
     
     print(" ")
     print("--- All Available Data Types ---")    
-    uniqueValues, indicesList = np.unique(o_type, return_index=True)
+    uniqueValues, uniqueCounts = np.unique(o_type, return_counts=True)
     print(f"  -> {uniqueValues}")
     
     print(" ")
     print("--- Size of Each Data Type ---")
     for i in range(0,len(uniqueValues)):
          
-        itemindex = np.where(o_type==uniqueValues[i])
-        o_type_size = len(itemindex[0][:])
-        print("  -> Obs Type " + str(uniqueValues[i]) + ": " + str(o_type_size))
+        print("  -> Obs Type " + str(uniqueValues[i]) + ": " + str(uniqueCounts[i]))
     
     
     
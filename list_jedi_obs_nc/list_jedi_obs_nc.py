@@ -7,11 +7,70 @@ Output:
 
 History Log:
    2022.05.11: Liaofan Lin - Created
+   2026.10.18: Pressure bins from one np.digitize; profile statistics (count,
+               mean, RMS, STD) of ombg, oman, GsiHofX - hofx and the obs error
+               per bin, optionally per ObsType
+   2026.10.18: --instrument FILE writes a timing/IO/memory report (pyda_util/instrument.py)
+
+Usage:
+   python list_jedi_obs_nc.py filename [--variable air_temperature] [--coord air_pressure@MetaData]
+                              [--edges 0 10000 ... 100000] [--by-obstype]
+                              [--instrument report.json|report.csv] [--cprofile FILE]
+
+Note:
+   - bins are right-closed (edges[i] < x <= edges[i+1]), as before; use e.g.
+     --coord geopotential_height@MetaData --edges 0 1000 ... for height bins
+   - hofx is <var>@hofx, or the first outer-loop <var>@hofx0; the obs error is
+     <var>@EffectiveError, or <var>@ObsError
 '''
 
 import numpy as np
 import sys
-from netCDF4 import Dataset
+import os
+import argparse
+
+# Shared helpers (repository root)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pyda_util.profile_stat import profile_bins, profile_stat, profile_summary
+from pyda_util import instrument
+
+
+# Bins of the vertical coordinate [unit in Pa]
+PRESS_LEVELS = [    0, 10000, 20000, 30000, 40000, 50000, \
+                60000, 70000, 80000, 90000,100000]
+
+
+def read_profile_values(f,VarName):
+
+    # the quantities of the profile statistics that are in the file
+    names = f.variables.keys()
+    values = {}
+    for group in ['ombg','oman']:
+        if VarName+'@'+group in names:
+            values[group] = f.variables[VarName+'@'+group][:]
+
+    hofx = [VarName+'@'+group for group in ['hofx','hofx0'] if VarName+'@'+group in names]
+    if VarName+'@GsiHofX' in names and len(hofx) > 0:
+        values['GsiHofX-hofx'] = f.variables[VarName+'@GsiHofX'][:] - f.variables[hofx[0]][:]
+
+    error = [VarName+'@'+group for group in ['EffectiveError','ObsError'] if VarName+'@'+group in names]
+    if len(error) > 0:
+        values['obs_error'] = f.variables[error[0]][:]
+    return values
+
+
+def print_profile_stat(coord,values,edges,groups=None):
+
+    bins = profile_bins(coord,edges)
+    for name, value in values.items():
+        stat = profile_stat(bins,len(edges)-1,value,groups)
+        for key in stat:
+            count, mean, rms, std = profile_summary(stat[key])
+            print(" ")
+            print("--- " + name + " (ObsType " + str(key) + ") ---")
+            print("  %10s %10s %8s %12s %12s %12s" % ('From','To','Count','Mean','RMS','STD'))
+            for i in range(0,len(edges)-1):
+                print("  %10g %10g %8d %12.5g %12.5g %12.5g" % (edges[i],edges[i+1],count[i],mean[i],rms[i],std[i]))
 
 #=====================================================================
 if __name__ == '__main__':
@@ -20,7 +79,21 @@ if __name__ == '__main__':
     # General Information
     # ===============================================    
     # Get arguments
-    filename = sys.argv[1]    
+    parser = argparse.ArgumentParser(description='List the content of a JEDI obs file')
+    parser.add_argument('filename')
+    parser.add_argument('--variable', default='air_temperature',
+                        help='variable of the ObsType listing and the profile statistics')
+    parser.add_argument('--coord', default='air_pressure@MetaData',
+                        help='vertical coordinate of the bins')
+    parser.add_argument('--edges', type=float, nargs='+', default=PRESS_LEVELS,
+                        help='bin edges of the vertical coordinate')
+    parser.add_argument('--by-obstype', action='store_true',
+                        help='profile statistics per ObsType')
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+    instrument.setup(args)
+    filename = args.filename
+    VarName  = args.variable
 
     print(" ")
     print("===================================================") 
@@ -30,9 +103,11 @@ if __name__ == '__main__':
     print(f"  {filename}")
     
     # Read the file
-    f = Dataset(filename, mode='r')
+    f = instrument.nc_open(filename, mode='r')
     press   = f.variables['air_pressure@MetaData'][:]
-    obstype = f.variables['air_temperature@ObsType'][:]
+    obstype = f.variables[VarName+'@ObsType'][:]
+    coord   = f.variables[args.coord][:]
+    values  = read_profile_values(f,VarName)
     
     
     # Print All Variables
@@ -55,27 +130,28 @@ if __name__ == '__main__':
     
     print(" ")
     print("--- Size of Data Under Some Pressure Levels [unit in Pa] ---")   
-    press_levels = [    0, 10000, 20000, 30000, 40000, 50000, \
-                    60000, 70000, 80000, 90000,100000]
+    press_levels = PRESS_LEVELS
+    press_level_size = np.bincount(profile_bins(press,press_levels)+1, minlength=len(press_levels))[1:]
                      
     for i in range(0,len(press_levels)-1):
         
-        itemindex = np.where((press > press_levels[i]) & (press <= press_levels[i+1]) )
-        press_level_size = len(itemindex[0][:])
-        print("  -> From " + str(press_levels[i]) + " to " + str(press_levels[i+1]) + ": " + str(press_level_size) )
+        print("  -> From " + str(press_levels[i]) + " to " + str(press_levels[i+1]) + ": " + str(press_level_size[i]) )
         
         
     print(" ")
     print("===================================================") 
-    print("PRINTING INFORMATION FOR SPECIFIC VARIABLE: air_temperature@ObsType") 
+    print("PRINTING INFORMATION FOR SPECIFIC VARIABLE: " + VarName + "@ObsType") 
     print("===================================================")         
     print("--- The Total Length of the Data ---")
     print("  -> " + str(len(obstype)))    
     
     print(" ")
     print("--- Print the Content ---")     
-    print(obstype)  
+    print(obstype)
     
-        
-        
-        
\ No newline at end of file
+    
+    print(" ")
+    print("===================================================") 
+    print("PRINTING PROFILE STATISTICS FOR: " + VarName + " (bins of " + args.coord + ")") 
+    print("===================================================")         
+    print_profile_stat(coord,values,args.edges,obstype if args.by_obstype else None)
@@ -1,69 +1,413 @@
 '''
-Purpose: Print out list information, if there is a difference (given a threshold) 
+Purpose: Print out list information, if there is a difference (given a threshold)
          in hofx between GSI and UFO.
- 
+
 Input: UFO NetCDF files
 
-Output: 
+Output: the listing (stdout), or a CSV/Parquet file of the mismatches (--output),
+        and a summary of the worst mismatches
 
 History Log:
    2021      : Ming Hu or Shun Liu or someone else?
    2022.05.04: Liaofan Lin - Modified
+   2026.10.18: Vectorised mismatch selection with absolute/relative thresholds,
+               station ids decoded, bulk CSV/Parquet output, top-N summary
+   2026.10.18: --manifest runs many jobs in one process, each file opened once
+   2026.10.18: --tasks: totals over all MPI-task files, reduced in parallel (--workers)
+   2026.10.18: --station/--obstype/--box/--nearest list only the rows found in the
+               sidecar index of the file (pyda_util/obs_index.py)
+   2026.10.18: --gsi-diag compares with a GSI diag file matched on the obs keys
+               (pyda_util/obs_match.py) instead of the row order
+   2026.10.18: Plain arrays and validity masks instead of masked arrays
+               (pyda_util/nc_read.py); same listing
+   2026.10.18: --instrument FILE writes a timing/IO/memory report (pyda_util/instrument.py)
+
+Usage:
+   python list_ufo_omb.py filename OBSTYPE VarName subtask [--abs-threshold A] [--rel-threshold R]
+                          [--output FILE.csv|FILE.parquet] [--top N]
+   python list_ufo_omb.py --manifest MANIFEST [options as above]
+   python list_ufo_omb.py 'ufo_sfc_2021010612_t_*.nc4' OBSTYPE VarName subtask --tasks [--workers N]
+   python list_ufo_omb.py filename OBSTYPE VarName subtask [--station KCBK] [--obstype 187]
+                          [--box LAT0,LAT1,LON0,LON1] [--nearest LAT,LON[,K]] [options as above]
+   python list_ufo_omb.py filename OBSTYPE VarName subtask --gsi-diag DIAGFILE [--vcoord pressure|height]
+                          [--tolerance lat=0.01,lon=0.01,vcoord=0.1,time=0.01] [--unmatched FILE.csv]
+   any of the above [--instrument report.json|report.csv] [--cprofile FILE]
+
+Note:
+   - a row is listed if |gsi - ufo| > A + R*|gsi| (the np.isclose convention);
+     the default (A=0.0005, R=0) is the threshold used so far
+   - Parquet output needs pyarrow
+   - MANIFEST: one "file obstype variable subtask" per line (see pyda_util/ufo_io.py);
+     the jobs are grouped by file, so a file and its MetaData are read once.
+     {VarName}, {OBSTYPE} and {subtask} in --output are replaced per job
+   - with --tasks, filename is a glob of the MPI-task files; each file is
+     reduced to mergeable statistics (pyda_util/obs_stat.py) and the totals
+     (number above the threshold, bias, RMS, range) are printed
+   - the query options select rows through <file>.idx.npz, built on first use
+     and rebuilt when the file changes; the threshold still applies (use
+     --abs-threshold -1 to list every selected row)
+   - with --gsi-diag, the gsi hofx (Observation - Obs_Minus_Forecast_unadjusted)
+     comes from DIAGFILE: its obs are joined with the UFO obs on station id and
+     obs type, and lat, lon, pressure (or height) and time within the
+     tolerances; the numbers of unmatched obs on each side and the first
+     --top of them are printed, all of them with --unmatched
+   - --instrument times every job (and the read/match steps of --gsi-diag),
+     counts the bytes read from each variable and records the peak RSS
 '''
 
 import numpy as np
 import sys
-import statistics
-import math
-import matplotlib.pyplot as plt
-from netCDF4 import Dataset
-
-
-def list_ufo_var(filename,OBSTYPE,VarName):
-
-   thisobstype = OBSTYPE
-   thisvarname = VarName
-   gsihofXBc   = thisvarname+'@GsiHofXBc'
-   gsihofX     = thisvarname+'@GsiHofX'
-   ufohofX     = thisvarname+'@hofx'
-   obstype     = thisvarname+'@ObsType'
-   useflag     = thisvarname+'@GsiUseFlag'
-   f = Dataset(filename, mode='r')
-   gsi_observer_withqc = f.variables[gsihofXBc][:]
-   gsi_observer_noqc   = f.variables[gsihofX][:]
-   ufo                 = f.variables[ufohofX][:]
-   geopotential_height = f.variables['height@MetaData'][:]
-   lat                 = f.variables['latitude@MetaData'][:]
-   lon                 = f.variables['longitude@MetaData'][:]
-   otype               = f.variables[obstype][:]
-   oflag               = f.variables[useflag][:]
-   oele                = f.variables['station_elevation@MetaData'][:]
-   sid                 = f.variables['station_id@MetaData'][:,:]
-   f.close()
-
-   diff = gsi_observer_noqc - ufo
+import os
+import argparse
+
+# Shared helpers (repository root)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pyda_util.ufo_io import UfoFile, read_manifest, group_by_file
+from pyda_util.parallel import run_units, report_failures
+from pyda_util.obs_stat import DiffStat, HIST_BINS, HIST_RANGE, task_files, ufo_diff_stat
+from pyda_util.obs_index import ObsIndex
+from pyda_util.nc_read import combine_valid
+from pyda_util.obs_match import TOLERANCE, read_gsi_obs, read_jedi_obs, match_obs, format_obs, write_unmatched
+from pyda_util import instrument
+
+
+# Threshold of the hofx difference between GSI and UFO
+ABS_THRESHOLD = 0.0005
+REL_THRESHOLD = 0.0
+
+# Number of rows in the summary of the worst mismatches
+TOP_N = 20
+
+# Columns of the listing and their format in the CSV file
+COLUMNS = ['n','sid','diff','ufo','gsi','lat','lon','otype','oflag','height','oele']
+CSV_FMT = ['%d','%s','%.8g','%.8g','%.8g','%.7g','%.7g','%d','%d','%.7g','%.7g']
+
+
+def read_ufo_var(ufo_file,VarName,rows=None,gsi=None):
+
+   # the columns of the listing (all locations, or the given rows) as plain
+   # arrays, their validity masks in data['valid'] (None: all valid), station
+   # ids as strings; ufo_file is a UfoFile, so MetaData already read for another
+   # variable is reused.  gsi: (data, valid) of the gsi hofx of the rows from
+   # elsewhere (a diag file)
+   names = {'gsi':    VarName+'@GsiHofX',
+            'ufo':    VarName+'@hofx',
+            'otype':  VarName+'@ObsType',
+            'oflag':  VarName+'@GsiUseFlag',
+            'height': 'height@MetaData',
+            'lat':    'latitude@MetaData',
+            'lon':    'longitude@MetaData',
+            'oele':   'station_elevation@MetaData'}
+   data = {'valid': {}}
+   for name, ncname in names.items():
+      if name == 'gsi' and gsi is not None:
+         data['gsi'], data['valid']['gsi'] = gsi
+      else:
+         data[name], data['valid'][name] = ufo_file.read_valid(ncname,rows)
+   data['sid']    = ufo_file.station_id(rows)
+   data['row']    = np.arange(len(data['gsi'])) if rows is None else rows
+   return data
+
+
+def query_rows(filename,VarName,query):
+
+   # rows of filename matching all the given criteria, from its sidecar index;
+   # None without criteria
+   criteria = {key: value for key, value in query.items() if value is not None}
+   if len(criteria) == 0:
+      return None
+
+   index = ObsIndex.open(filename)
+   selected = []
+   if 'station' in criteria:
+      selected.append(index.station(criteria['station']))
+   if 'obstype' in criteria:
+      selected.append(index.obstype(criteria['obstype'],VarName))
+   if 'box' in criteria:
+      selected.append(index.box(*criteria['box']))
+   if 'nearest' in criteria:
+      lat, lon = criteria['nearest'][0:2]
+      k = int(criteria['nearest'][2]) if len(criteria['nearest']) > 2 else 1
+      selected.append(np.sort(index.nearest(lat,lon,k)[0]))
+
+   rows = selected[0]
+   for other in selected[1:]:
+      rows = np.intersect1d(rows,other,assume_unique=True)
+   return rows
+
+
+def find_mismatch(gsi,ufo,abs_threshold=ABS_THRESHOLD,rel_threshold=REL_THRESHOLD,valid=None):
+
+   # indices of |gsi - ufo| > abs_threshold + rel_threshold*|gsi|; plain arrays,
+   # invalid values (valid False) never match
+   diff = gsi - ufo
+   exceed = np.abs(diff) > abs_threshold + rel_threshold*np.abs(gsi)
+   if valid is not None:
+      exceed &= valid
+   return np.flatnonzero(exceed), diff
+
+
+def mismatch_table(data,index,diff):
+
+   # the listed rows only; a column with invalid values becomes a masked array
+   # (printed as --)
+   table = {'n': data['row'][index], 'diff': diff[index]}
+   for name in COLUMNS:
+      if name not in table:
+         valid = data['valid'].get(name)
+         table[name] = data[name][index] if valid is None else np.ma.array(data[name][index],mask=~valid[index])
+   return table
+
+
+def format_rows(table,rows):
+
+   # the listing format used so far
+   lines = []
+   for r in rows:
+      lines.append("n= " + str(table['n'][r]) + "  SID=" + table['sid'][r] + "  diff= " + str(table['diff'][r]) +
+                   "  ufo= " + str(table['ufo'][r]) + "  gsi= " + str(table['gsi'][r]) +
+                   " lat= " + str(table['lat'][r]) + "  lon= " + str(table['lon'][r]) +
+                   "  otype= " + str(table['otype'][r]) + "  oflag= " + str(table['oflag'][r]) +
+                   "  height= " + str(table['height'][r]) + "  oele= " + str(table['oele'][r]))
+   return lines
+
+
+def table_column(table,name):
+
+   # (data, missing) of a column of the listing: a plain array and the mask of
+   # its invalid entries (None: all valid)
+   column = table[name]
+   if np.ma.isMaskedArray(column):
+      return np.ma.getdata(column), np.ma.getmaskarray(column)
+   return column, None
+
+
+def write_table(outname,table):
+
+   # invalid entries (-- in the listing) are nulls in Parquet and empty
+   # fields in the CSV file, never their fill values
+   if outname.endswith('.parquet'):
+      try:
+         import pyarrow
+         import pyarrow.parquet
+      except ImportError:
+         raise ImportError('writing ' + outname + ' needs pyarrow; use a .csv file instead')
+      columns = []
+      for name in COLUMNS:
+         data, missing = table_column(table,name)
+         columns.append(pyarrow.array(data,mask=missing))
+      pyarrow.parquet.write_table(pyarrow.Table.from_arrays(columns, names=COLUMNS), outname)
+   else:
+      lines = None
+      for name, fmt in zip(COLUMNS,CSV_FMT):
+         data, missing = table_column(table,name)
+         cells = np.char.mod(fmt,data) if len(data) > 0 else np.array([],dtype=str)
+         if missing is not None:
+            cells = np.where(missing,'',cells)
+         lines = cells if lines is None else np.char.add(np.char.add(lines,','),cells)
+      with open(outname,'w') as f:
+         f.write(','.join(COLUMNS) + '\n')
+         if len(lines) > 0:
+            f.write('\n'.join(lines) + '\n')
+
+
+def list_ufo_var(filename,OBSTYPE,VarName,abs_threshold=ABS_THRESHOLD,rel_threshold=REL_THRESHOLD,output=None,top=TOP_N,ufo_file=None,rows=None,gsi=None):
+
+   # without ufo_file (an open UfoFile of filename) the file is opened for this call only
+   if ufo_file is None:
+      with UfoFile(filename) as ufo_file:
+         return list_ufo_var(filename,OBSTYPE,VarName,abs_threshold,rel_threshold,output,top,ufo_file,rows,gsi)
+
+   # rows: the selected rows only (query_rows); gsi: their gsi hofx (list_ufo_matched)
+   data = read_ufo_var(ufo_file,VarName,rows,gsi)
+   valid = combine_valid(data['valid']['gsi'],data['valid']['ufo'])
+   index, diff = find_mismatch(data['gsi'],data['ufo'],abs_threshold,rel_threshold,valid)
+   if rows is not None:
+      print("Numbers of obs selected: " + str(len(rows)))
    print("Numbers of hofx Difference Between GSI and UFO: " + str(len(diff)))
+   print("Numbers above the threshold: " + str(len(index)))
 
-   for n in range(0, len(diff)):
-      if abs(diff[n]) > 0.0005:
-        print("n=",n," SID={}".format(sid[n][0:7])," diff=",diff[n], " ufo=", ufo[n], " gsi=",gsi_observer_noqc[n],
-              "lat=",lat[n]," lon=",lon[n], " otype=", otype[n], " oflag=",oflag[n],
-              " height=",geopotential_height[n]," oele=",oele[n])
+   table = mismatch_table(data,index,diff)
+
+   # All mismatches: to the output file, or listed as before
+   if output is None:
+      if len(index) > 0:
+         print("\n".join(format_rows(table,range(len(index)))))
+   else:
+      write_table(output,table)
+      print("Mismatches written to " + output)
+
+   # Summary: the largest differences first
+   worst = np.argsort(-np.abs(np.ma.getdata(table['diff'])), kind='stable')[0:top]
+   if len(worst) > 0:
+      print("Top " + str(len(worst)) + " differences:")
+      print("\n".join(format_rows(table,worst)))
 
-#=====================================================================
-if __name__ == '__main__':
 
-   filename = sys.argv[1]
-   OBSTYPE  = sys.argv[2]
-   VarName  = sys.argv[3]
-   subtask  = sys.argv[4]
-   
+def list_ufo_matched(filename,diag,OBSTYPE,VarName,abs_threshold=ABS_THRESHOLD,rel_threshold=REL_THRESHOLD,output=None,top=TOP_N,
+                     vcoord='pressure',tolerance=TOLERANCE,unmatched=None):
+
+   # the UFO obs joined with the obs of the GSI diag file on their keys
+   with instrument.span('stage','read_obs'):
+      gsi_obs = read_gsi_obs(diag,VarName,vcoord)
+      ufo_obs = read_jedi_obs(filename,VarName,vcoord,gsi_obs['date_time'])
+   with instrument.span('stage','match_obs'):
+      igsi, iufo, gsi_left, ufo_left = match_obs(gsi_obs,ufo_obs,tolerance)
+   print("Numbers of obs in the GSI diag file: " + str(len(gsi_obs['hofx'])))
+   print("Numbers of obs in the UFO file: " + str(len(ufo_obs['hofx'])))
+   print("Numbers of unmatched obs: GSI " + str(len(gsi_left)) + "  UFO " + str(len(ufo_left)))
+   for side, obs, left in [('GSI', gsi_obs, gsi_left), ('UFO', ufo_obs, ufo_left)]:
+      if len(left) > 0:
+         print("First " + str(min(top,len(left))) + " unmatched " + side + " obs:")
+         print("\n".join(format_obs(obs,left[0:top])))
+   if unmatched is not None:
+      write_unmatched(unmatched,[('gsi', gsi_obs, gsi_left), ('ufo', ufo_obs, ufo_left)])
+      print("Unmatched obs written to " + unmatched)
+
+   # the matched UFO rows in file order, with the gsi hofx of their partners
+   order = np.argsort(iufo)
+   gsi = gsi_obs['hofx'][igsi[order]]
+   gsi = (gsi, np.isfinite(gsi))
+   list_ufo_var(filename,OBSTYPE,VarName,abs_threshold,rel_threshold,output,top,rows=iufo[order],gsi=gsi)
+
+
+def print_header(filename,OBSTYPE,VarName):
+
    print("listing gsi hofx v.s. ufo hofx, for")
    print("  - File:" + filename)
    print("  - ObsYype:" + OBSTYPE)
    print("  - Variable: " + VarName)
-   
-   list_ufo_var(filename,OBSTYPE,VarName)
-   
-   print("listing done ")
-   print("===========================")
+
+
+def list_ufo_batch(jobs,abs_threshold=ABS_THRESHOLD,rel_threshold=REL_THRESHOLD,output=None,top=TOP_N,query={}):
+
+   # jobs: (filename, OBSTYPE, VarName, subtask); one open per file
+   # query: {'station','obstype','box','nearest'} criteria of query_rows
+   failed = []
+   for filename, group in group_by_file(jobs):
+      try:
+         ufo_file = UfoFile(filename)
+      except (OSError, RuntimeError) as err:
+         failed += [(' '.join(job), str(err)) for job in group]
+         continue
+      with ufo_file:
+         for (filename,OBSTYPE,VarName,subtask) in group:
+            print_header(filename,OBSTYPE,VarName)
+            job_output = None if output is None else output.format(VarName=VarName,OBSTYPE=OBSTYPE,subtask=subtask)
+            try:
+               with instrument.span('job',VarName,file=os.path.basename(filename),obstype=OBSTYPE,subtask=subtask):
+                  rows = query_rows(filename,VarName,query)
+                  list_ufo_var(filename,OBSTYPE,VarName,abs_threshold,rel_threshold,job_output,top,ufo_file,rows)
+            except (KeyError, IndexError, ValueError, ImportError) as err:
+               print("FAILED: " + type(err).__name__ + ": " + str(err))
+               failed.append((' '.join([filename,OBSTYPE,VarName,subtask]), type(err).__name__ + ": " + str(err)))
+            print("listing done ")
+            print("===========================")
+   report_failures(failed)
+   return failed
+
+
+def list_ufo_tasks(pattern,OBSTYPE,VarName,abs_threshold=ABS_THRESHOLD,rel_threshold=REL_THRESHOLD,workers=1):
+
+   # All MPI-task files: one DiffStat per file (on WORKERS processes), merged
+   threshold = (abs_threshold,rel_threshold)
+   units = [(fname,VarName,'GsiHofX',HIST_BINS,HIST_RANGE,threshold) for fname in task_files(pattern)]
+
+   stat = DiffStat(threshold=threshold)
+   failed = []
+   for unit, task_stat, error in run_units(ufo_diff_stat,units,workers):
+      if error is None:
+         stat.merge(task_stat)
+      else:
+         failed.append((unit[0],error))
+
+   print("Numbers of files: " + str(len(units)-len(failed)))
+   print("Numbers of hofx Difference Between GSI and UFO: " + str(stat.count))
+   print("Numbers above the threshold: " + str(stat.above))
+   print("bias= " + str(stat.bias()) + "  rms= " + str(stat.rms()) + "  std= " + str(stat.std()))
+   print("min= " + str(stat.min) + "  max= " + str(stat.max))
+   report_failures(failed)
+   return failed
+
+
+#=====================================================================
+if __name__ == '__main__':
+
+   parser = argparse.ArgumentParser(description='List the hofx differences between GSI and UFO')
+   parser.add_argument('filename', nargs='?')
+   parser.add_argument('OBSTYPE', nargs='?')
+   parser.add_argument('VarName', nargs='?')
+   parser.add_argument('subtask', nargs='?')
+   parser.add_argument('--manifest', default=None,
+                       help='file of "file obstype variable subtask" jobs, run in this one process')
+   parser.add_argument('--abs-threshold', type=float, default=ABS_THRESHOLD,
+                       help='absolute threshold of |gsi - ufo|')
+   parser.add_argument('--rel-threshold', type=float, default=REL_THRESHOLD,
+                       help='threshold of |gsi - ufo| relative to |gsi|')
+   parser.add_argument('--output', default=None,
+                       help='write the mismatches to this .csv or .parquet file instead of listing them')
+   parser.add_argument('--top', type=int, default=TOP_N,
+                       help='number of the largest differences in the summary')
+   parser.add_argument('--station', default=None,
+                       help='list only the obs of this station id')
+   parser.add_argument('--obstype', type=int, default=None,
+                       help='list only the obs of this ObsType')
+   parser.add_argument('--box', default=None,
+                       help='list only the obs in LAT0,LAT1,LON0,LON1 (degrees east)')
+   parser.add_argument('--nearest', default=None,
+                       help='list only the K (default 1) obs nearest to LAT,LON[,K]')
+   parser.add_argument('--gsi-diag', default=None,
+                       help='take the gsi hofx from this GSI diag file, matched on the obs keys')
+   parser.add_argument('--vcoord', choices=['pressure','height'], default='pressure',
+                       help='vertical coordinate of the match')
+   parser.add_argument('--tolerance', default=None,
+                       help='tolerances of the match, e.g. lat=0.01,lon=0.01,vcoord=0.1,time=0.01 (hPa or m, hours)')
+   parser.add_argument('--unmatched', default=None,
+                       help='CSV file of the unmatched obs on both sides')
+   parser.add_argument('--tasks', action='store_true',
+                       help='filename is a glob of MPI-task files, reduced to one set of totals')
+   parser.add_argument('--workers', type=int, default=1,
+                       help='number of worker processes reading the task files')
+   instrument.add_arguments(parser)
+   args = parser.parse_args()
+   instrument.setup(args)
+
+   if args.tasks:
+      if args.subtask is None:
+         parser.error('--tasks needs filename (a glob) OBSTYPE VarName subtask')
+      print_header(args.filename,args.OBSTYPE,args.VarName)
+      failed = list_ufo_tasks(args.filename,args.OBSTYPE,args.VarName,args.abs_threshold,args.rel_threshold,args.workers)
+      print("listing done ")
+      print("===========================")
+      sys.exit(1 if len(failed) > 0 else 0)
+
+   if args.gsi_diag is not None:
+      if args.subtask is None:
+         parser.error('--gsi-diag needs filename OBSTYPE VarName subtask')
+      tolerance = {}
+      if args.tolerance is not None:
+         for item in args.tolerance.split(','):
+            key, value = item.split('=')
+            tolerance[key.strip()] = float(value)
+      print_header(args.filename,args.OBSTYPE,args.VarName)
+      print("  - GSI diag: " + args.gsi_diag)
+      list_ufo_matched(args.filename,args.gsi_diag,args.OBSTYPE,args.VarName,args.abs_threshold,args.rel_threshold,
+                       args.output,args.top,args.vcoord,tolerance,args.unmatched)
+      print("listing done ")
+      print("===========================")
+      sys.exit(0)
+
+   if args.manifest is not None:
+      jobs = read_manifest(args.manifest)
+   elif args.subtask is not None:
+      jobs = [(args.filename, args.OBSTYPE, args.VarName, args.subtask)]
+   else:
+      parser.error('give filename OBSTYPE VarName subtask, or --manifest')
+
+   query = {'station': args.station, 'obstype': args.obstype,
+            'box':     None if args.box is None else [float(x) for x in args.box.split(',')],
+            'nearest': None if args.nearest is None else [float(x) for x in args.nearest.split(',')]}
+
+   failed = list_ufo_batch(jobs,args.abs_threshold,args.rel_threshold,args.output,args.top,query)
+   if len(failed) > 0:
+      sys.exit(1)
@@ -0,0 +1,234 @@
+'''
+Purpose: Inventory of the observations in a directory of GSI diag files and
+         JEDI obs files: number of obs per observation type x use flag x
+         analysis use, for every variable, in one table across all files and
+         cycles.
+
+Input: a directory with GSI diag NetCDF files (diag_conv_<var>_ges.<cycle>.nc4)
+       and/or JEDI obs NetCDF files (<obs>_obs_<cycle>.nc4, ufo_*.nc4)
+
+Output: the cross-tabulation (stdout) and, with --output, the counts per
+        file cycle as CSV
+
+History Log:
+   2026.10.18: Created
+   2026.10.18: --instrument FILE writes a timing/IO/memory report (pyda_util/instrument.py)
+
+Usage:
+   python list_obs_inventory.py DIRECTORY [--workers N] [--output FILE.csv]
+                                [--gsi-pattern GLOB] [--jedi-pattern GLOB ...]
+                                [--instrument report.json|report.csv] [--cprofile FILE]
+
+Note:
+   - only the metadata variables below are read from each file
+       GSI:  Observation_Type, Prep_Use_Flag,   Analysis_Use_Flag
+       JEDI: <var>@ObsType,    <var>@PreUseFlag, <var>@GsiUseFlag
+     a JEDI file without GsiUseFlag takes the analysis use from its last
+     EffectiveQC (0 -> 1 (used), otherwise -1 (not used)); without either
+     flag the analysis use is -999
+   - each file is one unit on the worker processes (--workers)
+'''
+
+import numpy as np
+import sys
+import os
+import re
+import glob
+import argparse
+
+# Shared helpers (repository root)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pyda_util.parallel import run_units, report_failures
+from pyda_util import instrument
+
+
+# File names of the GSI diag and JEDI obs files
+GSI_PATTERN  = 'diag_conv_*_ges.*.nc4'
+JEDI_PATTERN = ['*_obs_*.nc4', 'ufo_*.nc4']
+
+# Value of a flag that is not in the file
+MISSING = -999
+
+# Columns of the CSV output
+COLUMNS = ['source','variable','cycle','obs_type','use_flag','analysis_use','count']
+
+
+def file_cycle(filename):
+
+    # cycle (YYYYMMDDHH) in the file name
+    match = re.search(r'(\d{10})', os.path.basename(filename))
+    return match.group(1) if match else 'unknown'
+
+
+def count_keys(otype,use,anl):
+
+    # distinct (type, use flag, analysis use) and their counts, in one np.unique
+    keys = np.stack([np.ma.filled(x, MISSING).astype(np.int64) for x in (otype,use,anl)])
+    uniqueKeys, counts = np.unique(keys, axis=1, return_counts=True)
+    return uniqueKeys.T, counts
+
+
+def gsi_inventory(filename):
+
+    # diag_conv_<var>_ges.<cycle>.nc4
+    variable = os.path.basename(filename).split('_')[2]
+
+    f = instrument.nc_open(filename, mode='r')
+    o_type = f.variables['Observation_Type'][:]
+    use    = f.variables['Prep_Use_Flag'][:]
+    anl    = f.variables['Analysis_Use_Flag'][:]
+    f.close()
+
+    return [('gsi', variable) + count_keys(o_type,use,anl)]
+
+
+def jedi_inventory(filename):
+
+    f = instrument.nc_open(filename, mode='r')
+    names = list(f.variables.keys())
+
+    out = []
+    for name in names:
+        if not name.endswith('@ObsType'):
+            continue
+        variable = name.split('@')[0]
+        obstype  = f.variables[name][:]
+
+        if variable + '@PreUseFlag' in names:
+            use = f.variables[variable + '@PreUseFlag'][:]
+        else:
+            use = np.full(len(obstype), MISSING)
+
+        if variable + '@GsiUseFlag' in names:
+            anl = f.variables[variable + '@GsiUseFlag'][:]
+        else:
+            # the last QC iteration: EffectiveQC, or the highest EffectiveQC<N>
+            qc = sorted([nn for nn in names if re.fullmatch(re.escape(variable) + r'@EffectiveQC\d*', nn)],
+                        key=lambda nn: (nn[-1].isdigit(), len(nn), nn))
+            if len(qc) > 0:
+                anl = np.where(np.ma.filled(f.variables[qc[-1]][:], 1) == 0, 1, -1)
+            else:
+                anl = np.full(len(obstype), MISSING)
+
+        out.append(('jedi', variable) + count_keys(obstype,use,anl))
+
+    f.close()
+    return out
+
+
+def inventory_file(filename,source):
+    '''
+    One unit: [(source, variable, cycle, keys (n,3), counts (n,)), ...]
+    '''
+    if source == 'gsi':
+        tables = gsi_inventory(filename)
+    else:
+        tables = jedi_inventory(filename)
+    return [(src, variable, file_cycle(filename), keys, counts) for (src, variable, keys, counts) in tables]
+
+
+def find_files(directory,gsi_pattern=GSI_PATTERN,jedi_pattern=JEDI_PATTERN):
+
+    gsi_files  = sorted(glob.glob(os.path.join(directory, gsi_pattern)))
+    jedi_files = []
+    for pattern in jedi_pattern:
+        jedi_files += [fname for fname in sorted(glob.glob(os.path.join(directory, pattern)))
+                       if fname not in jedi_files and fname not in gsi_files]
+    return [(fname,'gsi') for fname in gsi_files] + [(fname,'jedi') for fname in jedi_files]
+
+
+def build_inventory(units,workers=1):
+    '''
+    {(source, variable, cycle, obs_type, use_flag, analysis_use): count} over all files
+    '''
+    inventory = {}
+    failed = []
+    for unit, tables, error in run_units(inventory_file, units, workers):
+        if error is not None:
+            failed.append((unit[0], error))
+            continue
+        for (source, variable, cycle, keys, counts) in tables:
+            for key, count in zip(keys.tolist(), counts.tolist()):
+                key = (source, variable, cycle) + tuple(key)
+                inventory[key] = inventory.get(key, 0) + count
+    report_failures(failed)
+    return inventory
+
+
+def print_inventory(inventory):
+
+    # Cross-tabulation over all cycles: type x use flag x analysis use
+    crosstab = {}
+    cycles = {}
+    for (source, variable, cycle, otype, use, anl), count in inventory.items():
+        key = (source, variable, otype, use, anl)
+        crosstab[key] = crosstab.get(key, 0) + count
+        cycles.setdefault((source, variable), set()).add(cycle)
+
+    last = None
+    for key in sorted(crosstab):
+        (source, variable, otype, use, anl) = key
+        if (source, variable) != last:
+            last = (source, variable)
+            total = sum([count for kk, count in crosstab.items() if kk[0:2] == last])
+            print(" ")
+            print("--- " + source.upper() + " " + variable + ": " + str(total) + " obs in " +
+                  str(len(cycles[last])) + " cycle(s) ---")
+            print("  %8s %9s %13s %10s" % ('Obs Type', 'Use Flag', 'Analysis Use', 'Count'))
+        print("  %8d %9d %13d %10d" % (otype, use, anl, crosstab[key]))
+
+    # Totals per cycle
+    print(" ")
+    print("--- Number of Obs per Cycle ---")
+    totals = {}
+    for (source, variable, cycle, otype, use, anl), count in inventory.items():
+        totals[(source, variable, cycle)] = totals.get((source, variable, cycle), 0) + count
+    for key in sorted(totals):
+        print("  -> " + ' '.join(key) + ": " + str(totals[key]))
+
+
+def write_inventory(outname,inventory):
+
+    with open(outname, 'w') as f:
+        f.write(','.join(COLUMNS) + '\n')
+        for key in sorted(inventory):
+            f.write(','.join([str(x) for x in key]) + ',' + str(inventory[key]) + '\n')
+
+
+#=====================================================================
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Inventory of GSI diag and JEDI obs files')
+    parser.add_argument('directory')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of worker processes reading the files')
+    parser.add_argument('--output', default=None,
+                        help='CSV file of the counts per cycle')
+    parser.add_argument('--gsi-pattern', default=GSI_PATTERN,
+                        help='glob of the GSI diag files in the directory')
+    parser.add_argument('--jedi-pattern', nargs='+', default=JEDI_PATTERN,
+                        help='glob(s) of the JEDI obs files in the directory')
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+    instrument.setup(args)
+
+    print(" ")
+    print("===================================================")
+    print("OBSERVATION INVENTORY")
+    print("===================================================")
+    print("--- Directory ---")
+    print(f"  {args.directory}")
+
+    units = find_files(args.directory,args.gsi_pattern,args.jedi_pattern)
+    print(" ")
+    print("--- Files ---")
+    print("  -> GSI diag: " + str(len([1 for unit in units if unit[1] == 'gsi'])))
+    print("  -> JEDI obs: " + str(len([1 for unit in units if unit[1] == 'jedi'])))
+
+    inventory = build_inventory(units,args.workers)
+    print_inventory(inventory)
+
+    if args.output is not None:
+        write_inventory(args.output,inventory)
+        print(" ")
+        print("--- Counts per cycle written to " + args.output + " ---")
@@ -0,0 +1,7 @@
+#module use -a /scratch2/NCEPDEV/marineda/Jong.Kim/save/modulefiles
+#module load anaconda/3.15.1
+
+# Directory with diag_conv_*_ges.*.nc4 and/or *_obs_*.nc4 files (all cycles)
+obsdir=/scratch1/BMC/zrtrr/llin/210511_jedi/61_mhu_test/test_v01/case2/output
+
+python list_obs_inventory.py $obsdir --workers 4 --output list_obs_inventory.csv >& list_obs_inventory.log
@@ -3,10 +3,27 @@ Purpose: Plot the time series (ts) of domain mean and STD of each member
  
 Input: FV3 dyn or phy forecast files
 
-Output: 
+Output: time series of the domain mean and STD of each member; with the region statistics of
+        plt_fv3_ens_mean_std.py in the case store, a list and time series of the region
+        means and STDs (stage plot_region)
 
 History Log:
    2022.04.04: Liaofan Lin - Created
+   2026.10.18: Read only the layer of interest (hyperslab), all variables in one open
+   2026.10.18: --workers N runs the cycles on a process pool
+   2026.10.18: Results go to the case store (data_output/ens_stat_case*.nc) instead of a pickle
+   2026.10.18: Input-fingerprinted cache: only new or changed cycles are recomputed
+   2026.10.18: Stages run by pyda_util.pipeline from plt_fv3_domain_mean_std.yaml (no more SWITCH_*);
+               cycles already done by plt_fv3_ens_mean_std.py (same OUTPUT_DIR) are not read again
+   2026.10.18: --instrument FILE writes a timing/IO/memory report (pyda_util.instrument)
+   2026.10.18: --threads N reduces each member tile by tile on N threads (pyda_util.tiles)
+   2026.10.18: --prefetch K reads the next K member files while one is reduced
+   2026.10.18: Stage plot_region lists and plots the area-weighted region statistics that
+               plt_fv3_ens_mean_std.py (REGION_STATS) keeps in the case store
+
+Usage:
+   python plt_fv3_domain_mean_std.py [--config FILE] [--stages a,b,...] [--workers N] [--force]
+                                     [--threads N] [--prefetch K] [--instrument report.json|.csv] [--cprofile FILE]
 '''
 
 
@@ -16,13 +33,21 @@ History Log:
 import matplotlib 
 import matplotlib.pyplot as plt
 import numpy as np
-import yaml
 import sys 
 import os
 import math
-import pickle
-from netCDF4 import Dataset
+import argparse
 
+# Shared helpers (repository root)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pyda_util.fv3_units import domain_stat_cycle
+from pyda_util.parallel import run_units, report_failures
+from pyda_util.ens_store import EnsStore, store_name
+from pyda_util.fv3_io import member_file_name
+from pyda_util.cache import UnitCache, cache_name, code_version, fingerprint, digest
+from pyda_util.pipeline import Pipeline, load_config
+from pyda_util import instrument
+import pyda_util.fv3_io, pyda_util.ens_stat, pyda_util.fv3_units, pyda_util.regions, pyda_util.tiles
 #Necessary to generate figs when not running an Xserver (e.g. via PBS)
 plt.switch_backend('agg')
 
@@ -30,8 +55,9 @@ plt.switch_backend('agg')
 #%% =====================================
 #   Variables to be edited
 #   =====================================
-SWITCH_DATA_PROCESS = True
-SWITCH_PLOTTING     = True
+#   - the stages to run (data_process, plotting, plot_region) are chosen in the
+#     YAML config; its settings section can override the values below
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'plt_fv3_domain_mean_std.yaml')
 
 # ------------------------------------------
 #   -> Please choose one of the cases below
@@ -67,69 +93,216 @@ FILE_TYPE = 'dyn'
 # Variables
 VARIABLE_STR = 'tmp'
 #VARIABLE_STR = 'spfh'
+
+# Variables extracted in the data-process stage
+#   - each member file is opened once and serves all of them
+VARIABLE_LIST = [VARIABLE_STR]
+#VARIABLE_LIST = ['tmp','spfh']
  
 # Figure Title
 FIGURE_TITLE = 'Statistics for 3-h Temperature Fcst (Layer 65) [K]'
 #FIGURE_TITLE = 'Statistics for 3-h Specific Humidity Fcst (Layer 65) [m3/m3]'
 
+# Number of worker processes for the data process (1: serial)
+WORKERS = 1
+
+# Number of threads reducing the grid of each cycle, tile by tile (1: serial)
+THREADS = 1
+
+# Number of member files read ahead, on a background thread, of the one being
+# reduced (0: none)
+PREFETCH = 2
+
+# Directory of the case store (ens_stat_case<CASEID>.nc) and its cache; with
+# the OUTPUT_DIR of plt_fv3_ens_mean_std.py (an absolute path if the scripts
+# run from different directories) the cycles it has done are not read again
+OUTPUT_DIR = './data_output'
+
+# ------------------------------------------
+#   Command line options (override the settings above)
+parser = argparse.ArgumentParser(description='Domain mean and STD of each FV3 member')
+parser.add_argument('--config', default=CONFIG_FILE,
+                    help='YAML config with the stages and settings')
+parser.add_argument('--stages', default=None,
+                    help='comma-separated stages to run (default: run list of the config)')
+parser.add_argument('--workers', type=int, default=None,
+                    help='number of worker processes for the data process')
+parser.add_argument('--force', action='store_true',
+                    help='run the stages and recompute every cycle, even if up to date')
+parser.add_argument('--threads', type=int, default=None,
+                    help='number of threads reducing the grid tiles of each cycle')
+parser.add_argument('--prefetch', type=int, default=None,
+                    help='number of member files read ahead of the one being reduced')
+instrument.add_arguments(parser)
+args = parser.parse_args()
+instrument.setup(args)
+
+# Settings from the config (lower-case names of the variables above)
+config = load_config(args.config)
+for key, value in config['settings'].items():
+    if key.upper() not in globals() and key not in globals():
+        raise ValueError('unknown setting ' + key + ' in ' + args.config)
+    globals()[key.upper() if key.upper() in globals() else key] = value
+
+if args.workers is not None:
+    WORKERS = args.workers
+if args.threads is not None:
+    THREADS = args.threads
+if args.prefetch is not None:
+    PREFETCH = args.prefetch
+
+# The plotted variable is always extracted
+if VARIABLE_STR not in VARIABLE_LIST:
+    VARIABLE_LIST = VARIABLE_LIST + [VARIABLE_STR]
+
+# Cycles (time strings)
+CYCLES = [YEAR + DATE[math.floor(cc/8)] + HOUR[cc%8] for cc in range(0,size_cycle)]
+
+# Cache of the figures drawn (which inputs each one came from)
+FIGURE_CACHE = OUTPUT_DIR + '/figures.cache.json'
+
 
 #%% =====================================
 #   Data Process 
 #   =====================================
-if SWITCH_DATA_PROCESS == True:
+#   - the per-member statistics share the case store and cache entries with
+#     plt_fv3_ens_mean_std.py, which computes them in its own pass over the
+#     member files; when both scripts use the same OUTPUT_DIR, cycles it has
+#     already done are not read again (do not run the two at the same time,
+#     one process writes to a store at a time)
+def func_plan_data_process():
 
-    # Define Variables
-    domain_avg = np.zeros((size_member,size_cycle))
-    domain_std = np.zeros((size_member,size_cycle))
+    # Version of the code producing the statistics (part of every fingerprint,
+    # the same as in plt_fv3_ens_mean_std.py)
+    CODE_VERSION = code_version(pyda_util.fv3_io, pyda_util.ens_stat, pyda_util.fv3_units, pyda_util.regions, pyda_util.tiles)
 
-    print('Case ' + str(CASEID)) 
+    fname = store_name(OUTPUT_DIR, CASEID)
+    cache = UnitCache(cache_name(fname))
+    store = EnsStore(fname) if os.path.exists(fname) else None
 
     # Loading variables of interest from each member and each cycle
-    for cc in range(0,size_cycle):
-    
-        # Construct the time string
-        TIME_STR = YEAR + DATE[math.floor(cc/8)] + HOUR[cc%8]
+    #   - one unit per cycle; results come back in cycle order
+    #   - a cycle is recomputed only for the variables whose inputs changed
+    units = []
+    keys  = []
+    for TIME_STR in CYCLES:
     
-        print('Processing ' + VARIABLE_STR +' data on ' + TIME_STR)
-    
-        for mm in range(0,size_member):
+        files = [member_file_name(casedir, TIME_STR, mm+1, FILE_TYPE) for mm in range(0,size_member)]
+        fps   = {}
+        stale = []
+        for vname in VARIABLE_LIST:
+            key = 'member/' + TIME_STR + '/' + vname
+            fps[key] = fingerprint(files, variable=vname, layer=NO_LAYER, code=CODE_VERSION)
+            done = store is not None and store.has_member_stat(TIME_STR, vname) and cache.is_current(key, fps[key])
+            if args.force or not done:
+                stale.append(vname)
+
+        if len(stale) > 0:
+            units.append((casedir, TIME_STR, stale, NO_LAYER, size_member, FILE_TYPE, THREADS, PREFETCH))
+            keys.append(fps)
+
+    if store is not None:
+        store.close()
+
+    return units, keys
+
+
+def stage_data_process_is_current():
+
+    units, keys = func_plan_data_process()
+    return len(units) == 0
+
+
+def stage_data_process_load():
+
+    # Read the per-member domain statistics from the case store
+    with EnsStore(store_name(OUTPUT_DIR, CASEID)) as store:
+        [domain_avg, domain_std] = store.read_member_stat(VARIABLE_STR, CYCLES)
+    return {'member_dm': [domain_avg, domain_std]}
+
+
+def stage_data_process(data):
+
+    print('Case ' + str(CASEID)) 
+
+    units, keys = func_plan_data_process()
+
+    # Per-member domain statistics go to the case store, cycle by cycle
+    store = EnsStore(store_name(OUTPUT_DIR, CASEID), 'a')
+    cache = UnitCache(cache_name(store.fname))
+
+    # No eviction: the member/ entries of other variables or cycles may be
+    # the ones of plt_fv3_ens_mean_std.py
+    print(str(size_cycle - len(units)) + ' cycle(s) up to date, ' + str(len(units)) + ' to compute')
+
+    # Define Variables (handed to the plotting; NaN for a cycle that cannot be read)
+    domain_avg = np.full((size_member,size_cycle), np.nan)
+    domain_std = np.full((size_member,size_cycle), np.nan)
+
+    failed = []
+    for fps, (unit, stat, error) in zip(keys, run_units(domain_stat_cycle, units, WORKERS)):
     
-            # Contstruct the member string
-            if mm+1 < 10:
-                mem_str = '0'+str(mm+1)
-            else:
-                mem_str = str(mm+1)
+        TIME_STR = unit[1]
+        print('Processing ' + ', '.join(unit[2]) +' data on ' + TIME_STR)
 
+        if error is not None:
+            print('  FAILED: ' + error)
+            failed.append((TIME_STR, error))
+            for vname in unit[2]:
+                cache.forget('member/' + TIME_STR + '/' + vname)
+            cache.save()
+            continue
     
-            # Read a variable
-            fname = casedir + '/' + TIME_STR + '/mem00' + mem_str + '/fcst_fv3lam/' + FILE_TYPE + 'f003.nc'
-            # print(fname) # print file path and name
-            ncfile = Dataset(fname)   
-            var = np.squeeze( ncfile.variables[VARIABLE_STR][:])
-            ncfile.close() 
-             
-            var_2d = var[NO_LAYER-1,:,:]
-            var_2d_avg = np.mean(var_2d[:])
-            var_2d_std = np.std(var_2d[:])
-        
-        
-            domain_avg[mm,cc] = var_2d_avg
-            domain_std[mm,cc] = var_2d_std
-          
-            #print(np.shape(var)) # print variable dimension
-             
-        
-    # Open the pickle file
-    outfile = open('./data_output/domain_stat_case'+str(CASEID)+'_'+VARIABLE_STR+'.pkl','wb')
-    pickle.dump([domain_avg, domain_std],outfile)
-    outfile.close()
+        for vname in unit[2]:
+            store.write_member_stat(TIME_STR, vname, stat[vname][0], stat[vname][1])
+        if VARIABLE_STR in unit[2]:
+            domain_avg[:,CYCLES.index(TIME_STR)] = stat[VARIABLE_STR][0]
+            domain_std[:,CYCLES.index(TIME_STR)] = stat[VARIABLE_STR][1]
+
+        # Record the cycle as done only once it is on disk (resume point)
+        store.sync()
+        for vname in unit[2]:
+            key = 'member/' + TIME_STR + '/' + vname
+            cache.record(key, fps[key])
+        cache.save()
+
+    report_failures(failed)
+
+    # Cycles that were up to date come from the store
+    computed = [CYCLES.index(unit[1]) for unit in units if VARIABLE_STR in unit[2]]
+    uptodate = [TIME_STR for TIME_STR in CYCLES if CYCLES.index(TIME_STR) not in computed]
+    [store_avg, store_std] = store.read_member_stat(VARIABLE_STR, uptodate)
+    store.close()
+    for ii, TIME_STR in enumerate(uptodate):
+        domain_avg[:,CYCLES.index(TIME_STR)] = store_avg[:,ii]
+        domain_std[:,CYCLES.index(TIME_STR)] = store_std[:,ii]
+
+    return {'member_dm': [domain_avg, domain_std]}
 
     
       
 #%% =====================================
 #   Plotting
 #   =====================================
-if SWITCH_PLOTTING == True:
+def func_figname():
+
+    return VARIABLE_STR + '_layer_' + str(NO_LAYER) + '_case' + str(CASEID)+'.png'
+
+
+def func_plot_inputs():
+
+    # the store entries of all cycles of the plotted variable
+    cache = UnitCache(cache_name(store_name(OUTPUT_DIR, CASEID)))
+    return digest([[cache.entries.get('member/' + TIME_STR + '/' + VARIABLE_STR) for TIME_STR in CYCLES], FIGURE_TITLE])
+
+
+def stage_plotting_is_current():
+
+    figname = func_figname()
+    return os.path.exists(figname) and UnitCache(FIGURE_CACHE).is_current('member_ts/' + figname, func_plot_inputs())
+
+
+def stage_plotting(data):
  
     print('Plotting ' + VARIABLE_STR +' data for Case ' + str(CASEID))
  
@@ -141,10 +314,8 @@ if SWITCH_PLOTTING == True:
     width = 0.22
     height = 0.8
     
-    # Read pickle files
-    infile = open('./data_output/domain_stat_case'+str(CASEID)+'_'+VARIABLE_STR+'.pkl','rb')
-    [domain_avg, domain_std] = pickle.load(infile)
-    infile.close()    
+    # Per-member domain statistics handed over by the data process (or read from the store)
+    [domain_avg, domain_std] = data['member_dm']
                   
     # Plots
     plt.rcParams.update({'font.size': 14})
@@ -185,8 +356,117 @@ if SWITCH_PLOTTING == True:
 
    
     #plt.savefig(VARIABLE + '.png',bbox_inches='tight',dpi=300)
-    plt.savefig(VARIABLE_STR + '_layer_' + str(NO_LAYER) + '_case' + str(CASEID)+'.png',bbox_inches='tight',dpi=100)
+    figname = func_figname()
+    plt.savefig(figname,bbox_inches='tight',dpi=100)
+    plt.clf()
+
+    figure_cache = UnitCache(FIGURE_CACHE)
+    figure_cache.record('member_ts/' + figname, func_plot_inputs())
+    figure_cache.save()
+
+
+#%% =====================================
+#   Region statistics
+#   =====================================
+#   - area-weighted region means and STDs of each member, computed by
+#     plt_fv3_ens_mean_std.py (REGION_STATS) in its get_data stage and read
+#     here from the case store (same OUTPUT_DIR); they are averaged over the
+#     members, like the ensemble spread (region mean of the ensemble STD map)
+def func_region_figname():
+
+    return VARIABLE_STR + '_layer_' + str(NO_LAYER) + '_case' + str(CASEID) + '_regions.png'
+
+
+def func_region_inputs():
+
+    # the store entries of all cycles of the plotted variable
+    cache = UnitCache(cache_name(store_name(OUTPUT_DIR, CASEID)))
+    return digest([[cache.entries.get('region/' + TIME_STR + '/' + VARIABLE_STR) for TIME_STR in CYCLES], FIGURE_TITLE])
+
+
+def stage_plot_region_is_current():
+
+    figname = func_region_figname()
+    return os.path.exists(figname) and UnitCache(FIGURE_CACHE).is_current('region_ts/' + figname, func_region_inputs())
+
+
+def stage_plot_region(data):
+
+    fname = store_name(OUTPUT_DIR, CASEID)
+    names = []
+    if os.path.exists(fname):
+        with EnsStore(fname) as store:
+            cycles = [TIME_STR for TIME_STR in CYCLES if store.has_region_stat(TIME_STR, VARIABLE_STR)]
+            if len(cycles) > 0:
+                names = store.region_names()
+                [region_ens, region_member] = store.read_region_stat(VARIABLE_STR, CYCLES)
+    if len(names) == 0:
+        print('No region statistics of ' + VARIABLE_STR + ' for Case ' + str(CASEID) + ' in ' + fname +
+              ' (get_data of plt_fv3_ens_mean_std.py with REGION_STATS and the same OUTPUT_DIR)')
+        return
+
+    # (cycle, region) averaged over the members; NaN for the cycles not in the store
+    region_avg = np.mean(region_member[:,:,0,:], axis=1)
+    region_std = np.mean(region_member[:,:,1,:], axis=1)
+    region_spread = region_ens[:,1,:]
+
+    print('Region statistics of ' + VARIABLE_STR + ' for Case ' + str(CASEID) + ' (' + str(len(cycles)) + ' of ' +
+          str(size_cycle) + ' cycles, averaged over the cycles)')
+    print('  %-16s %12s %12s %12s' % ('region', 'mean', 'STD', 'ens spread'))
+    for rr, name in enumerate(names):
+        print('  %-16s %12.5g %12.5g %12.5g' % (name, np.nanmean(region_avg[:,rr]), np.nanmean(region_std[:,rr]),
+                                               np.nanmean(region_spread[:,rr])))
+
+    # Plots (dashed once the colors repeat)
+    styles = ['-' if rr < 10 else '--' for rr in range(0,len(names))]
+    plt.rcParams.update({'font.size': 14})
+    fig = plt.subplots(2, 1, figsize=(12, 10))
+
+    # subplot 01
+    ax1 = plt.subplot(2,1,1)
+    ax1.set_position([0.1, 0.57, 0.7, 0.38])
+    plt.xlim(-0.5,24.5)
+    for rr in range(0,len(names)):
+        plt.plot(region_avg[:,rr], styles[rr])
+    plt.grid(True)
+    plt.xlabel('Cycles Every 3h From ' + YEAR + DATE[0] + HOUR[0])
+    plt.ylabel('Region Mean')
+    plt.title(FIGURE_TITLE)
+    plt.legend(names, loc='upper left', bbox_to_anchor=(1.02, 1.0), fontsize=11)
+
+    # subplot 02
+    ax2 = plt.subplot(2,1,2)
+    ax2.set_position([0.1, 0.07, 0.7, 0.38])
+    for rr in range(0,len(names)):
+        plt.plot(region_std[:,rr], styles[rr])
+    plt.grid(True)
+    plt.xlabel('Cycles Every 3h From ' + YEAR + DATE[0] + HOUR[0])
+    plt.ylabel('Region STD')
+    plt.xlim(-0.5,24.5)
+
+    figname = func_region_figname()
+    plt.savefig(figname,bbox_inches='tight',dpi=100)
     plt.clf()
+
+    figure_cache = UnitCache(FIGURE_CACHE)
+    figure_cache.record('region_ts/' + figname, func_region_inputs())
+    figure_cache.save()
+
+
+#%% =====================================
+#   Run the stages
+#   =====================================
+STAGES = {'data_process': {'run': stage_data_process, 'is_current': stage_data_process_is_current, 'load': stage_data_process_load},
+          'plotting':     {'run': stage_plotting,     'is_current': stage_plotting_is_current},
+          'plot_region':  {'run': stage_plot_region,  'is_current': stage_plot_region_is_current}}
+
+if __name__ == '__main__':
+
+    pipeline = Pipeline(config, STAGES)
+    if args.stages is None:
+        pipeline.run(force=args.force)
+    else:
+        pipeline.run(args.stages.split(','), force=args.force)
             
             
     
\ No newline at end of file
@@ -7,9 +7,41 @@ Output:
 
 History Log:
    - 2022.04.08: Liaofan Lin - Created
+   - 2026.10.18: Read only the layer of interest (hyperslab), all variables in one open
+   - 2026.10.18: Streaming ens mean/std (members are no longer stacked in memory)
+   - 2026.10.18: --workers N runs the case/cycle units on a process pool
+   - 2026.10.18: One NetCDF store per case (data_output/ens_stat_case*.nc) replaces the pickles
+   - 2026.10.18: Input-fingerprinted cache: only new or changed cycles are recomputed
+   - 2026.10.18: Maps reuse one projection/figure per grid (pyda_util.map_render)
+   - 2026.10.18: --plot-workers N renders the maps on a process pool
+   - 2026.10.18: Stages run by pyda_util.pipeline from plt_fv3_ens_mean_std.yaml (no more SWITCH_*);
+                 domain means and per-member statistics come from the same pass over the members
+   - 2026.10.18: Area-weighted statistics over the verification regions (REGION_STATS), from the
+                 same pass as well
+   - 2026.10.18: --instrument FILE writes a timing/IO/memory report (pyda_util.instrument)
+   - 2026.10.18: --threads N reduces each member tile by tile on N threads (pyda_util.tiles);
+                 grid dimensions come from the files (XDIM/YDIM removed)
+   - 2026.10.18: --prefetch K reads the next K member files while one is reduced
+   - 2026.10.18: Profile mode (stages get_profile, plot_profile): per-layer domain means of
+                 the ensemble mean and spread over the full column, as (cycle, layer) arrays
+                 in the case store and time-height cross sections
+   - 2026.10.18: Any number of cases (one per entry of CASEID; CASE_LABEL replaces the EFSOI/EnKF
+                 legend); stage plot_diff maps the mean difference between cases over all cycles,
+                 stippled where a paired t-test or bootstrap test over the cycles is significant
+                 (pyda_util.ens_compare)
+
+Usage:
+   python plt_fv3_ens_mean_std.py [--config FILE] [--stages a,b,...] [--workers N] [--force] [--plot-workers N]
+                                  [--threads N] [--prefetch K] [--instrument report.json|.csv] [--cprofile FILE]
 
 Note:
    - needs to load the modules for GSL's pygraf before running this scripts
+   - on the 3 km grid, e.g. --workers 4 --threads 10 on a 40-core node
+   - profile mode: --stages get_profile,plot_profile; each member file is
+     opened once and read in blocks of PROFILE_BLOCK layers
+   - experiment comparison: --stages plot_diff (after get_data); one map per
+     pair of cases (COMPARE_PAIRS) and statistic, over the cycles that all
+     the cases have
 '''
 
 
@@ -19,12 +51,10 @@ Note:
 import matplotlib as mpl
 import matplotlib.pyplot as plt
 import numpy as np
-import yaml
 import sys 
 import os
 import math
-import pickle
-from netCDF4 import Dataset
+import argparse
 
 # For Basemap (python book 2021.08.19)
 import matplotlib.image as mpimg
@@ -32,6 +62,19 @@ import matplotlib.offsetbox as mpob
 import matplotlib.patches as mpatches
 from mpl_toolkits.basemap import Basemap
 
+# Shared helpers (repository root)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pyda_util.fv3_io import member_file_name, read_fv3_lonlat
+from pyda_util.ens_store import EnsStore, store_name
+from pyda_util.cache import UnitCache, cache_name, code_version, fingerprint, digest
+import pyda_util.fv3_io, pyda_util.ens_stat, pyda_util.fv3_units, pyda_util.regions, pyda_util.tiles
+from pyda_util.map_render import MapRenderer, render_store_maps
+from pyda_util.fv3_units import ens_stat_cycle, ens_profile_cycle
+from pyda_util.regions import region_index_file
+from pyda_util.parallel import run_units, report_failures
+from pyda_util.pipeline import Pipeline, load_config
+from pyda_util.ens_compare import compare_cases, case_pairs
+from pyda_util import instrument
 
 
 
@@ -42,17 +85,17 @@ plt.switch_backend('agg')
 #%% =====================================
 #   Variables to be edited
 #   =====================================
-SWITCH_DP_GET_DATA       = False
-SWITCH_DP_DM_CALCULATION = False
-SWITCH_PLT_MAP           = True
-SWITCH_PLT_TS            = True
+#   - the stages to run (get_data, plot_map, plot_ts) are chosen in the
+#     YAML config; its settings section can override the values below
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'plt_fv3_ens_mean_std.yaml')
 
 
 # ------------------------------------------
-SIZE_CASE  = 2
 SIZE_CYCLE = 16  # number of cycles
 
+# One entry per case in each of the three lists
 CASEID  = [53,54]
+CASE_LABEL = ['EFSOI','EnKF']  # legends and titles
 CASEDIR = ["/scratch1/BMC/zrtrr/llin/220101_rrfs_dev1/STMP/tmpnwprd/RRFS_CONUS_13km_case53_efsoi_20210915_3days",\
            "/scratch1/BMC/zrtrr/llin/220101_rrfs_dev1/STMP/tmpnwprd/RRFS_CONUS_13km_case54_enkf_20210915_3days"]
 # ------------------------------------------
@@ -72,9 +115,10 @@ HOUR = ['00','03','06','09','12','15','18','21']
 NO_LAYER = 65  
 
 
-# Specifying the horizontal dimensions
-XDIM = 393
-YDIM = 225
+# Layers of the profile mode (get_profile, plot_profile; None: all layers of
+# the files), and the number of layers reduced at a time (bounds the memory)
+PROFILE_LAYERS = None
+PROFILE_BLOCK  = 8
 
 
 # File type: dyn or phy
@@ -85,74 +129,153 @@ FILE_TYPE = 'dyn'
 # Variables
 VARIABLE_STR = 'tmp'
 #VARIABLE_STR = 'spfh'
+
+# Variables extracted in the data-process stage
+#   - each member file is opened once and serves all of them
+VARIABLE_LIST = [VARIABLE_STR]
+#VARIABLE_LIST = ['tmp','spfh']
  
 # Figure Title
 FIGURE_TITLE = 'Statistics for 3-h Temperature Fcst (Layer 65) [K]'
 #FIGURE_TITLE = 'Ensemble Statistics for 3-h Specific Humidity Fcst (Layer 65) [g/kg]'
 
+# Number of worker processes for the data-process stage (1: serial)
+WORKERS = 1
+
+# Number of threads reducing the grid of each unit, tile by tile (1: serial)
+THREADS = 1
+
+# Number of member files read ahead, on a background thread, of the one being
+# reduced (0: none); each holds the layer of every variable in VARIABLE_LIST
+PREFETCH = 2
+
+# Number of worker processes for rendering the maps (1: serial)
+PLOT_WORKERS = 1
+
+# Directory of the case stores (ens_stat_case<CASEID>.nc) and their caches;
+# plt_fv3_domain_mean_std.py reuses the per-member statistics computed here
+# when its OUTPUT_DIR is the same directory (relative to where each script
+# runs, so give an absolute path if they run from different directories)
+OUTPUT_DIR = './data_output'
+
+# Keep the map projection in OUTPUT_DIR between runs (False: rebuild every run)
+MAP_CACHE = True
+
+# Area-weighted statistics over the verification regions (CONUS quadrants,
+# land/water, elevation bands; see pyda_util/regions.py), kept in the case store
+REGION_STATS = True
+
+# Experiment comparison (stage plot_diff): pairs of case indices [a, b] mapped
+# as case b - case a (None: every pair), the significance test over the
+# cycles ('ttest' or 'bootstrap', with BOOTSTRAP_SAMPLES resamples) and the
+# level below which a grid point is stippled
+COMPARE_PAIRS = None
+COMPARE_TEST  = 'ttest'
+COMPARE_ALPHA = 0.05
+BOOTSTRAP_SAMPLES = 1000
+
+
+# ------------------------------------------
+#   Command line options (override the settings above)
+parser = argparse.ArgumentParser(description='Ensemble mean and STD of FV3 forecasts')
+parser.add_argument('--config', default=CONFIG_FILE,
+                    help='YAML config with the stages and settings')
+parser.add_argument('--stages', default=None,
+                    help='comma-separated stages to run (default: run list of the config)')
+parser.add_argument('--workers', type=int, default=None,
+                    help='number of worker processes for the data-process stage')
+parser.add_argument('--force', action='store_true',
+                    help='run the stages and recompute every cycle, even if up to date')
+parser.add_argument('--plot-workers', type=int, default=None,
+                    help='number of worker processes for rendering the maps')
+parser.add_argument('--threads', type=int, default=None,
+                    help='number of threads reducing the grid tiles of each unit')
+parser.add_argument('--prefetch', type=int, default=None,
+                    help='number of member files read ahead of the one being reduced')
+instrument.add_arguments(parser)
+args = parser.parse_args()
+instrument.setup(args)
+
+# Settings from the config (lower-case names of the variables above)
+config = load_config(args.config)
+for key, value in config['settings'].items():
+    if key.upper() not in globals():
+        raise ValueError('unknown setting ' + key + ' in ' + args.config)
+    globals()[key.upper()] = value
+
+if args.workers is not None:
+    WORKERS = args.workers
+if args.plot_workers is not None:
+    PLOT_WORKERS = args.plot_workers
+if args.threads is not None:
+    THREADS = args.threads
+if args.prefetch is not None:
+    PREFETCH = args.prefetch
+
+# Cases
+if not len(CASE_LABEL) == len(CASEDIR) == len(CASEID):
+    raise ValueError('caseid, case_label and casedir have ' + str(len(CASEID)) + ', ' +
+                     str(len(CASE_LABEL)) + ' and ' + str(len(CASEDIR)) + ' entries in ' + args.config)
+SIZE_CASE = len(CASEID)
+
+# The plotted variable is always extracted
+if VARIABLE_STR not in VARIABLE_LIST:
+    VARIABLE_LIST = VARIABLE_LIST + [VARIABLE_STR]
+
+# Cycles (time strings)
+CYCLES = [YEAR + DATE[math.floor(cc/8)] + HOUR[cc%8] for cc in range(0,SIZE_CYCLE)]
+
+# Cache of the figures drawn (which inputs each one came from)
+FIGURE_CACHE = OUTPUT_DIR + '/figures.cache.json'
+
+# Directory of the cached map projection (None: rebuilt every run)
+MAP_CACHE_DIR = OUTPUT_DIR if MAP_CACHE else None
+
 
 
 
 #%%============================================================================
 #  functions for plotting a map
 # =============================================================================    
-def func_plot_map(var_2d, lon, lat, TIME_STR, FIGURE_TITLE, VARIABLE_STR, caseid_str, figure_title02):
-
-    # Create a figure
-    plt.rcParams.update({'font.size': 14})
-    fig,axes = plt.subplots(1, 1, figsize=(11,6))
-    
-    # Colormap
-    cmap=plt.cm.get_cmap('jet',24)
-    cmaplist = [cmap(i) for i in range(cmap.N)]
-    cmap = mpl.colors.LinearSegmentedColormap.from_list('Custom cmap', cmaplist, cmap.N)
-    
-    #
-    ax1 = plt.subplot(1,1,1)
-    ax1.set_position([0.05, 0.05, 0.80, 0.80])
-    
-    # Computing the mean
-    lon_0 = lon.mean()
-    lat_0 = lat.mean()   
-        
-    m = Basemap(width=5100000,height=2900000,\
-                resolution='l',projection='lcc',\
-                lat_ts=23,lat_0=lat_0+1.25,lon_0=lon_0)
-        
-    # Create lon/lat suitable for the projection
-    LON,LAT = m(lon,lat)    
-        
-    # Plot 2D variable
-    cs = m.pcolor(LON,LAT,var_2d,cmap=cmap)
- 
-    plt.title(FIGURE_TITLE + '\n' \
-              'Ensemble '+ figure_title02 +': Initialized at ' + TIME_STR[0:8] + ' ' + TIME_STR[8:10] + 'UTC')
-           
-    # Add boundary
-    m.drawcoastlines()
-    m.drawstates()
-    m.drawcountries()
-            
-    # Colorbar
-    cbar_ax = fig.add_axes([0.88, 0.05, 0.015, 0.800])
-    fig.colorbar(cs, cax=cbar_ax)
+def func_map_frame(TIME_STR, FIGURE_TITLE, VARIABLE_STR, caseid_str, figure_title02):
 
     # Colorbar limit
     if (VARIABLE_STR == 'tmp') & (figure_title02 == 'Mean'):
-        plt.clim(273,310)
+        clim = (273,310)
     elif (VARIABLE_STR == 'tmp') & (figure_title02 == 'STD'): 
-        plt.clim(0,3)
+        clim = (0,3)
     elif (VARIABLE_STR == 'spfh') & (figure_title02 == 'Mean'): 
-        plt.clim(0.00125,0.02125)        
+        clim = (0.00125,0.02125)        
     elif (VARIABLE_STR == 'spfh') & (figure_title02 == 'STD'): 
-        plt.clim(0,0.004)        
+        clim = (0,0.004)        
     else:
+        clim = None
         print('WARNING: the color bar limit for this variable is not decided yet')
 
+    title = FIGURE_TITLE + '\n' \
+            'Ensemble '+ figure_title02 +': Initialized at ' + TIME_STR[0:8] + ' ' + TIME_STR[8:10] + 'UTC'
+
+    figname = './figures/Ens_' + figure_title02 + '_case'+ caseid_str + '_time_' + TIME_STR + '_' + VARIABLE_STR + '.png'
+
+    return title, clim, figname
+
+
+def func_plot_map(var_2d, lon, lat, TIME_STR, FIGURE_TITLE, VARIABLE_STR, caseid_str, figure_title02, renderer=None):
+
+    # Projection, boundaries and figure are built once per grid and reused;
+    # without a renderer a one-off one is built for this map
+    if renderer is None:
+        one_off = MapRenderer(lon, lat)
+    else:
+        one_off = None
+
+    title, clim, figname = func_map_frame(TIME_STR, FIGURE_TITLE, VARIABLE_STR, caseid_str, figure_title02)
+
     # save Figure
-    plt.savefig('./figures/Ens_' + figure_title02 + '_case'+ caseid_str + '_time_' + TIME_STR + '_' + VARIABLE_STR + '.png',\
-                bbox_inches='tight',dpi=100)
-    plt.close()  
+    (renderer or one_off).render(var_2d, title, clim, figname)
+
+    if one_off is not None:
+        one_off.close()
 
 
 
@@ -164,114 +287,272 @@ def func_plot_map(var_2d, lon, lat, TIME_STR, FIGURE_TITLE, VARIABLE_STR, caseid
 #%% =============================================
 #   Data Process (Getting Data From Each Member)
 #   =============================================
-if SWITCH_DP_GET_DATA == True:
+#   - one pass over the member files gives the ensemble mean/std maps, their
+#     domain means and the domain mean/std of each member (for
+#     plt_fv3_domain_mean_std.py), all written to the case store
+def func_code_version():
+
+    # Version of the code producing the statistics (part of every fingerprint)
+    return code_version(pyda_util.fv3_io, pyda_util.ens_stat, pyda_util.fv3_units, pyda_util.regions, pyda_util.tiles)
+
+
+def func_kinds():
+
+    # Kinds of outputs of a (cycle, variable), each with its cache entry
+    if REGION_STATS:
+        return ['ens','member','region']
+    return ['ens','member']
+
+
+def func_plan_get_data(index_regions=False):
+
+    # Units (case, cycle, variables) whose inputs changed since they were
+    # computed; also returns the cache keys the configuration produces.
+    # With index_regions (and REGION_STATS), the region index of the grid is
+    # built or found once per case and its file handed to the units
+    CODE_VERSION = func_code_version()
 
+    units   = []
+    keys    = []
+    current = {}
     for index_case in range(0,SIZE_CASE):    
-   
-        print('Getting ' + VARIABLE_STR +' data for case ' + str(CASEID[index_case]))
-
-        for cc in range(0,SIZE_CYCLE):
-                
-            # Construct the time string
-            TIME_STR = YEAR + DATE[math.floor(cc/8)] + HOUR[cc%8]
-            print('  - Initialized at ' + TIME_STR)    
-                
-            # Define variables
-            var_2d_allens = np.zeros((SIZE_MEMBER,YDIM,XDIM))
-                   
-            for mm in range(0,SIZE_MEMBER):
-    
-                # Contstruct the member string
-                if mm+1 < 10:
-                    mem_str = '0'+str(mm+1)
-                else:
-                    mem_str = str(mm+1)        
-    
-                # Read a variable
-                fname = CASEDIR[index_case] + '/' + TIME_STR + '/mem00' + mem_str + '/fcst_fv3lam/' + FILE_TYPE + 'f003.nc'
-                ncfile = Dataset(fname)   
-                var = np.squeeze( ncfile.variables[VARIABLE_STR][:])
-                ncfile.close() 
-
-                # Collect the data into the big array
-                var_2d_allens[mm,:,:] = var[NO_LAYER-1,:,:]
- 
-            # Compute ens mean and std
-            var_2d_avg = np.mean(var_2d_allens,axis=0)
-            var_2d_std = np.std(var_2d_allens,axis=0)    
-
-            # Save data into a pickle file
-            outfile = open('./data_output/ens_stat_case' + str(CASEID[index_case]) + '_time_' + TIME_STR + '_' + VARIABLE_STR + '.pkl','wb')
-            pickle.dump([var_2d_avg, var_2d_std],outfile)
-            outfile.close()
-                
-#%% =============================================
-#   Data Process (Computing Domain Mean Values)
-#   =============================================
-if SWITCH_DP_DM_CALCULATION == True:      
-    
+
+        fname = store_name(OUTPUT_DIR, CASEID[index_case])
+        cache = UnitCache(cache_name(fname))
+        store = EnsStore(fname) if os.path.exists(fname) else None
+        current[index_case] = []
+        region_file = None
+
+        for TIME_STR in CYCLES:
+
+            files = [member_file_name(CASEDIR[index_case], TIME_STR, mm+1, FILE_TYPE) for mm in range(0,SIZE_MEMBER)]
+            fps   = {}
+            stale = []
+            for vname in VARIABLE_LIST:
+                done = store is not None and store.has_cycle(TIME_STR, vname) and store.has_member_stat(TIME_STR, vname)
+                if REGION_STATS:
+                    done = done and store.has_region_stat(TIME_STR, vname)
+                for kind in func_kinds():
+                    key = kind + '/' + TIME_STR + '/' + vname
+                    fps[key] = fingerprint(files, variable=vname, layer=NO_LAYER, code=CODE_VERSION)
+                    current[index_case].append(key)
+                    done = done and cache.is_current(key, fps[key])
+                if args.force or not done:
+                    stale.append(vname)
+
+            if len(stale) > 0:
+                # region index from the first cycle to compute (one grid per
+                # case); a cycle whose first member cannot be read fails in its
+                # unit, and the next cycle is tried
+                if index_regions and REGION_STATS and region_file is None:
+                    try:
+                        region_file = region_index_file(files[0], OUTPUT_DIR)
+                    except OSError:
+                        pass
+                units.append((CASEDIR[index_case], TIME_STR, stale, NO_LAYER, SIZE_MEMBER, FILE_TYPE,
+                              region_file, THREADS, PREFETCH))
+                keys.append((index_case, fps))
+
+        if store is not None:
+            store.close()
+
+    return units, keys, current
+
+
+def stage_get_data_is_current():
+
+    units, keys, current = func_plan_get_data()
+    return len(units) == 0
+
+
+def stage_get_data_load():
+
+    # Domain means of the plotted variable, read back from the stores
+    ens_dm = {}
     for index_case in range(0,SIZE_CASE):    
-   
-        print('Processing ' + VARIABLE_STR +' data for case ' + str(CASEID[index_case]))
-
-        # Define variables
-        var_avg_dm = np.zeros((SIZE_CYCLE))
-        var_std_dm = np.zeros((SIZE_CYCLE))
-
-        for cc in range(0,SIZE_CYCLE):
-                
-            # Construct the time string
-            TIME_STR = YEAR + DATE[math.floor(cc/8)] + HOUR[cc%8]
-                          
-            # Read pickle files
-            infile = open('./data_output/ens_stat_case' + str(CASEID[index_case]) + '_time_' + TIME_STR + '_' + VARIABLE_STR + '.pkl','rb')
-            [var_2d_avg, var_2d_std] = pickle.load(infile)
-            infile.close() 
-            
-            var_avg_dm[cc] = np.mean(var_2d_avg)
-            var_std_dm[cc] = np.mean(var_2d_std)
-            
-        # Save data into a pickle file
-        outfile = open('./data_output/ens_stat_case' + str(CASEID[index_case]) + '_domain_mean_' + VARIABLE_STR + '.pkl','wb')
-        pickle.dump([var_avg_dm,var_std_dm],outfile)
-        outfile.close()            
+        with EnsStore(store_name(OUTPUT_DIR, CASEID[index_case])) as store:
+            ens_dm[index_case] = store.read_domain_mean(VARIABLE_STR, CYCLES)
+    return {'ens_maps': [store_name(OUTPUT_DIR, caseid) for caseid in CASEID], 'ens_dm': ens_dm}
+
+
+def stage_get_data(data):
+
+    units, keys, current = func_plan_get_data(index_regions=True)
+
+    # One store (and its cache) per case; new cycles are appended, existing ones overwritten
+    stores = {}
+    caches = {}
+    ens_dm = {}
+    for index_case in range(0,SIZE_CASE):
+        stores[index_case] = EnsStore(store_name(OUTPUT_DIR, CASEID[index_case]), 'a')
+        caches[index_case] = UnitCache(cache_name(stores[index_case].fname))
+        ens_dm[index_case] = {}
+
+        # Entries this configuration does not produce any more; the member/
+        # entries are shared with plt_fv3_domain_mean_std.py (its variables and
+        # cycles may differ), so only the ones of this script are evicted
+        evicted = []
+        for kind in ['ens','region']:
+            evicted += caches[index_case].evict(kind + '/', current[index_case])
+        caches[index_case].save()
+
+        n_compute = len([1 for key in keys if key[0] == index_case])
+        print('Case ' + str(CASEID[index_case]) + ': ' + str(SIZE_CYCLE - n_compute) + ' cycle(s) up to date, ' +
+              str(n_compute) + ' to compute, ' + str(len(evicted)) + ' orphaned cache entries evicted')
+
+    # Results come back in the order above (serial or on WORKERS processes)
+    failed = []
+    last_case = None
+    for (index_case, fps), (unit, stat, error) in zip(keys, run_units(ens_stat_cycle, units, WORKERS)):
+
+        TIME_STR = unit[1]
+        if index_case != last_case:
+            print('Getting ' + ', '.join(VARIABLE_LIST) +' data for case ' + str(CASEID[index_case]))
+            last_case = index_case
+        print('  - Initialized at ' + TIME_STR)    
+
+        store = stores[index_case]
+        cache = caches[index_case]
+
+        if error is not None:
+            print('    FAILED: ' + error)
+            failed.append(('case ' + str(CASEID[index_case]) + ' ' + TIME_STR, error))
+            for vname in unit[2]:
+                for kind in func_kinds():
+                    cache.forget(kind + '/' + TIME_STR + '/' + vname)
+            cache.save()
+            continue
+
+        # lon and lat from a member of this (successfully read) cycle
+        if not store.has_lonlat():
+            lon, lat = read_fv3_lonlat(member_file_name(CASEDIR[index_case], TIME_STR, 1, FILE_TYPE))
+            store.set_lonlat(lon, lat)
+
+        # Save the mean and std maps, their domain means, the per-member and the region statistics
+        [ens, member, region] = stat
+        for vname in unit[2]:
+            store.write_cycle(TIME_STR, vname, ens[vname])
+            store.write_member_stat(TIME_STR, vname, member[vname][0], member[vname][1])
+            if region is not None:
+                store.write_region_stat(TIME_STR, vname, region[0], region[1][vname][0], region[1][vname][1])
+        if VARIABLE_STR in unit[2]:
+            ens_dm[index_case][TIME_STR] = [np.mean(field, dtype=np.float64) for field in ens[VARIABLE_STR]]
+
+        # Record the cycle as done only once it is on disk (resume point)
+        store.sync()
+        for vname in unit[2]:
+            for kind in func_kinds():
+                key = kind + '/' + TIME_STR + '/' + vname
+                cache.record(key, fps[key])
+        cache.save()
+
+    report_failures(failed)
+
+    # Domain means handed to the time series: computed above, or from the
+    # store for the cycles that were up to date
+    for index_case in range(0,SIZE_CASE):
+        missing = [cc for cc in CYCLES if cc not in ens_dm[index_case]]
+        var_dm  = dict(zip(missing, stores[index_case].read_domain_mean(VARIABLE_STR, missing)))
+        var_dm.update(ens_dm[index_case])
+        ens_dm[index_case] = np.array([var_dm[cc] for cc in CYCLES])
+        stores[index_case].close()
+
+    return {'ens_maps': [store_name(OUTPUT_DIR, caseid) for caseid in CASEID], 'ens_dm': ens_dm}
+
             
 #%% =====================================
 #   Plotting (Maps)
 #   =====================================
-if SWITCH_PLT_MAP == True: 
-     
-    # Getting lon and lat
-    fname = CASEDIR[0] + '/' + YEAR + DATE[0] + HOUR[0] + '/mem0001/fcst_fv3lam/' + FILE_TYPE + 'f003.nc'
-    ncfile = Dataset(fname)   
-    lon = np.squeeze( ncfile.variables['lon'][:])
-    lat = np.squeeze( ncfile.variables['lat'][:])
-    ncfile.close()     
-     
+def func_plan_maps(ens_maps, verbose=True):
+
+    # One frame per case, cycle and statistic; a frame is up to date when its
+    # PNG exists and was drawn from the current store entry with the same
+    # title and colorbar limits
+    figure_cache = UnitCache(FIGURE_CACHE)
+
+    frames = []
+    fps    = []
     for index_case in range(0,SIZE_CASE):    
-   
-        print('Plotting maps for ' + VARIABLE_STR +' data for case ' + str(CASEID[index_case]))
 
-        for cc in range(0,SIZE_CYCLE):    
-            
-            # Construct the time string
-            TIME_STR = YEAR + DATE[math.floor(cc/8)] + HOUR[cc%8]
-            print('  - Initialized at ' + TIME_STR)
-            
-            # Read pickle files
-            infile = open('./data_output/ens_stat_case' + str(CASEID[index_case]) + '_time_' + TIME_STR + '_' + VARIABLE_STR + '.pkl','rb')
-            [var_2d_avg, var_2d_std] = pickle.load(infile)
-            infile.close()             
-            
+        fname = ens_maps[index_case]
+        cache = UnitCache(cache_name(fname))
+        with EnsStore(fname) as store:
+
+            for TIME_STR in CYCLES:    
             
-            func_plot_map(var_2d_avg,lon,lat,TIME_STR,FIGURE_TITLE,VARIABLE_STR,str(CASEID[index_case]),'Mean')
-            func_plot_map(var_2d_std,lon,lat,TIME_STR,FIGURE_TITLE,VARIABLE_STR,str(CASEID[index_case]),'STD')
+                # Skip a cycle that failed in the data process
+                if not store.has_cycle(TIME_STR, VARIABLE_STR):
+                    if verbose:
+                        print('WARNING: cycle ' + TIME_STR + ' of case ' + str(CASEID[index_case]) + ' is missing in the store')
+                    continue
+
+                for stat_index, figure_title02 in enumerate(['Mean','STD']):
+                    title, clim, figname = func_map_frame(TIME_STR,FIGURE_TITLE,VARIABLE_STR,str(CASEID[index_case]),figure_title02)
+                    fp = digest([cache.entries.get('ens/' + TIME_STR + '/' + VARIABLE_STR), title, clim])
+                    if args.force or not (os.path.exists(figname) and figure_cache.is_current('map/' + figname, fp)):
+                        frames.append((fname, TIME_STR, VARIABLE_STR, stat_index, title, clim, figname))
+                        fps.append(fp)
+
+    return frames, fps
+
+
+def stage_plot_map_is_current():
+
+    frames, fps = func_plan_maps([store_name(OUTPUT_DIR, caseid) for caseid in CASEID], False)
+    return len(frames) == 0
+
+
+def stage_plot_map(data):
+
+    # Frames are drawn serially or on PLOT_WORKERS processes, each reading
+    # its map from the case store
+    print('Plotting maps for ' + VARIABLE_STR +' data for case(s) ' + ', '.join([str(caseid) for caseid in CASEID]))
+    frames, fps = func_plan_maps(data['ens_maps'])
+
+    figure_cache = UnitCache(FIGURE_CACHE)
+    failed = []
+    for (figname, error), fp in zip(render_store_maps(frames, PLOT_WORKERS, MAP_CACHE_DIR), fps):
+        if error is None:
+            print('  - ' + figname)
+            figure_cache.record('map/' + figname, fp)
+        else:
+            print('  FAILED: ' + figname + ': ' + error)
+            failed.append((figname, error))
+    figure_cache.save()
+
+    report_failures(failed)
             
            
 #%% ============================================
 #   Plotting (Time Series of Domain Mean Values)
 #   ============================================
-if SWITCH_PLT_TS == True: 
+def func_case_label(index_case):
+
+    return 'Case ' + str(CASEID[index_case]) + ': ' + CASE_LABEL[index_case]
+
+
+def func_ts_figname():
+
+    return './figures/'+ VARIABLE_STR + '_layer_' + str(NO_LAYER) + '_ens_stat_dm.png'
+
+
+def func_ts_inputs():
+
+    # the store entries of all cases and cycles of the plotted variable
+    entries = []
+    for caseid in CASEID:
+        cache = UnitCache(cache_name(store_name(OUTPUT_DIR, caseid)))
+        entries.append([cache.entries.get('ens/' + TIME_STR + '/' + VARIABLE_STR) for TIME_STR in CYCLES])
+    return digest([entries, FIGURE_TITLE, CASEID, CASE_LABEL])
+
+
+def stage_plot_ts_is_current():
+
+    figname = func_ts_figname()
+    return os.path.exists(figname) and UnitCache(FIGURE_CACHE).is_current('ts/' + figname, func_ts_inputs())
+
+
+def stage_plot_ts(data):
         
     # Define variables
     var_avg_dm_all = np.zeros((SIZE_CASE,SIZE_CYCLE))    
@@ -279,14 +560,11 @@ if SWITCH_PLT_TS == True:
         
     for index_case in range(0,SIZE_CASE):    
    
-
-        # Save data into a pickle file
-        infile = open('./data_output/ens_stat_case' + str(CASEID[index_case]) + '_domain_mean_' + VARIABLE_STR + '.pkl','rb')
-        [var_avg_dm,var_std_dm] = pickle.load(infile)
-        infile.close() 
+        # Domain means handed over by the data process (or read from the store)
+        var_dm = data['ens_dm'][index_case]
         
-        var_avg_dm_all[index_case,:] = var_avg_dm
-        var_std_dm_all[index_case,:] = var_std_dm
+        var_avg_dm_all[index_case,:] = var_dm[:,0]
+        var_std_dm_all[index_case,:] = var_dm[:,1]
         
         
     # Create a figure
@@ -309,7 +587,7 @@ if SWITCH_PLT_TS == True:
     plt.xlabel('Cycles Every 3h From ' + YEAR + DATE[0] + HOUR[0])
     plt.ylabel('Ensemble Mean')
     plt.title(FIGURE_TITLE)
-    plt.legend( ('Case ' +str(CASEID[0])+': EFSOI' , 'Case '+str(CASEID[1]) + ': EnKF'  ) )
+    plt.legend( [func_case_label(index_case) for index_case in range(0,SIZE_CASE)] )
 
     # subplot 02
     ax2 = plt.subplot(2,1,2)
@@ -328,5 +606,293 @@ if SWITCH_PLT_TS == True:
         
         
     # save the plot
-    plt.savefig('./figures/'+ VARIABLE_STR + '_layer_' + str(NO_LAYER) + '_ens_stat_dm.png',bbox_inches='tight',dpi=100)
-    plt.close()       
\ No newline at end of file
+    figname = func_ts_figname()
+    plt.savefig(figname,bbox_inches='tight',dpi=100)
+    plt.close()
+
+    figure_cache = UnitCache(FIGURE_CACHE)
+    figure_cache.record('ts/' + figname, func_ts_inputs())
+    figure_cache.save()
+
+
+#%% ============================================
+#   Experiment comparison (difference maps between cases)
+#   ============================================
+def func_compare_cycles():
+
+    # Cycles in the stores of all the cases (a cycle missing in one case
+    # cannot be paired)
+    cycles = []
+    stores = [EnsStore(store_name(OUTPUT_DIR, caseid)) for caseid in CASEID]
+    try:
+        for TIME_STR in CYCLES:
+            if all([store.has_cycle(TIME_STR, VARIABLE_STR) for store in stores]):
+                cycles.append(TIME_STR)
+    finally:
+        for store in stores:
+            store.close()
+    return cycles
+
+
+def func_diff_frame(pair, figure_title02, size_cycle):
+
+    # Title, colorbar (symmetric, set from the data) and name of a difference map
+    index_a, index_b = pair
+    title = FIGURE_TITLE + '\n' \
+            'Ensemble ' + figure_title02 + ' Difference: ' + func_case_label(index_b) + ' minus ' + \
+            func_case_label(index_a) + '\n' \
+            'Mean of ' + str(size_cycle) + ' cycles; dots: p < ' + str(COMPARE_ALPHA) + ' (' + COMPARE_TEST + ')'
+
+    figname = './figures/Ens_' + figure_title02 + '_diff_case' + str(CASEID[index_b]) + '_minus_case' + \
+              str(CASEID[index_a]) + '_' + VARIABLE_STR + '.png'
+
+    return title, figname
+
+
+def func_diff_inputs(pair, cycles):
+
+    # the store entries of both cases over the paired cycles, and the test
+    entries = []
+    for index_case in pair:
+        cache = UnitCache(cache_name(store_name(OUTPUT_DIR, CASEID[index_case])))
+        entries.append([cache.entries.get('ens/' + TIME_STR + '/' + VARIABLE_STR) for TIME_STR in cycles])
+    return digest([entries, cycles, FIGURE_TITLE, [CASEID[cc] for cc in pair], CASE_LABEL,
+                   COMPARE_TEST, COMPARE_ALPHA, BOOTSTRAP_SAMPLES])
+
+
+def stage_plot_diff_is_current():
+
+    cycles = func_compare_cycles()
+    figure_cache = UnitCache(FIGURE_CACHE)
+    for pair in case_pairs(SIZE_CASE, COMPARE_PAIRS):
+        for figure_title02 in ['Mean','STD']:
+            title, figname = func_diff_frame(pair, figure_title02, len(cycles))
+            if not (os.path.exists(figname) and figure_cache.is_current('diff/' + figname, func_diff_inputs(pair, cycles))):
+                return False
+    return True
+
+
+def stage_plot_diff(data):
+
+    # Maps of (case b - case a) averaged over the cycles both have, one per
+    # pair of cases and statistic; every pair comes from one batched test
+    # over the cycle axis of the stacked maps (case, cycle, y, x)
+    cycles = func_compare_cycles()
+    pairs  = case_pairs(SIZE_CASE, COMPARE_PAIRS)
+    print('Plotting difference maps for ' + VARIABLE_STR + ' over ' + str(len(cycles)) + ' cycles, ' +
+          str(len(pairs)) + ' pair(s) of cases, ' + COMPARE_TEST)
+    if len(cycles) < 2:
+        print('WARNING: fewer than 2 cycles in all the case stores, no difference maps')
+        return
+
+    with EnsStore(data['ens_maps'][0]) as store:
+        lon, lat = store.lonlat()
+    renderer = MapRenderer(lon, lat, MAP_CACHE_DIR, cmap='RdBu_r')
+
+    figure_cache = UnitCache(FIGURE_CACHE)
+    used = sorted(set([cc for pair in pairs for cc in pair]))
+    for stat_index, figure_title02 in enumerate(['Mean','STD']):
+
+        fields = np.full((SIZE_CASE, len(cycles)) + np.shape(lon), np.nan, dtype=np.float32)
+        for index_case in used:
+            with EnsStore(data['ens_maps'][index_case]) as store:
+                fields[index_case] = store.read_cycles(VARIABLE_STR, cycles, stat_index)
+
+        pairs, diff, pvalue = compare_cases(fields, pairs, COMPARE_TEST, BOOTSTRAP_SAMPLES)
+
+        for pp, pair in enumerate(pairs):
+            title, figname = func_diff_frame(pair, figure_title02, len(cycles))
+            significant = pvalue[pp] < COMPARE_ALPHA
+            limit = np.nanmax(np.abs(diff[pp]))
+            clim = (-limit, limit) if limit > 0 else None
+            renderer.render(diff[pp], title, clim, figname, stipple=significant)
+            print('  - ' + figname + ': ' + '%.1f' % (100.0 * np.mean(significant)) + '% of the grid significant')
+            figure_cache.record('diff/' + figname, func_diff_inputs(pair, cycles))
+
+    renderer.close()
+    figure_cache.save()
+
+
+#%% ============================================
+#   Profile mode (all layers, one pass over the member files)
+#   ============================================
+def func_plan_profile():
+
+    # Units (case, cycle, variables) whose profiles are missing or whose
+    # inputs changed; also the cache keys the configuration produces
+    CODE_VERSION = func_code_version()
+
+    units   = []
+    keys    = []
+    current = {}
+    for index_case in range(0,SIZE_CASE):
+
+        fname = store_name(OUTPUT_DIR, CASEID[index_case])
+        cache = UnitCache(cache_name(fname))
+        store = EnsStore(fname) if os.path.exists(fname) else None
+        current[index_case] = []
+
+        for TIME_STR in CYCLES:
+
+            files = [member_file_name(CASEDIR[index_case], TIME_STR, mm+1, FILE_TYPE) for mm in range(0,SIZE_MEMBER)]
+            fps   = {}
+            stale = []
+            for vname in VARIABLE_LIST:
+                key = 'profile/' + TIME_STR + '/' + vname
+                fps[key] = fingerprint(files, variable=vname, layers=PROFILE_LAYERS, code=CODE_VERSION)
+                current[index_case].append(key)
+                done = store is not None and store.has_profile(TIME_STR, vname) and cache.is_current(key, fps[key])
+                if args.force or not done:
+                    stale.append(vname)
+
+            if len(stale) > 0:
+                units.append((CASEDIR[index_case], TIME_STR, stale, PROFILE_LAYERS, SIZE_MEMBER, FILE_TYPE,
+                              PROFILE_BLOCK, THREADS, PREFETCH))
+                keys.append((index_case, fps))
+
+        if store is not None:
+            store.close()
+
+    return units, keys, current
+
+
+def stage_get_profile_is_current():
+
+    units, keys, current = func_plan_profile()
+    return len(units) == 0
+
+
+def stage_get_profile(data):
+
+    units, keys, current = func_plan_profile()
+
+    stores = {}
+    caches = {}
+    for index_case in range(0,SIZE_CASE):
+        stores[index_case] = EnsStore(store_name(OUTPUT_DIR, CASEID[index_case]), 'a')
+        caches[index_case] = UnitCache(cache_name(stores[index_case].fname))
+        evicted = caches[index_case].evict('profile/', current[index_case])
+        caches[index_case].save()
+
+        n_compute = len([1 for key in keys if key[0] == index_case])
+        print('Case ' + str(CASEID[index_case]) + ': ' + str(SIZE_CYCLE - n_compute) + ' profile cycle(s) up to date, ' +
+              str(n_compute) + ' to compute, ' + str(len(evicted)) + ' orphaned cache entries evicted')
+
+    failed = []
+    for (index_case, fps), (unit, stat, error) in zip(keys, run_units(ens_profile_cycle, units, WORKERS)):
+
+        TIME_STR = unit[1]
+        print('  - Profile of case ' + str(CASEID[index_case]) + ' initialized at ' + TIME_STR)
+        store = stores[index_case]
+        cache = caches[index_case]
+
+        if error is None:
+            try:
+                layers, profile = stat
+                for vname in unit[2]:
+                    store.write_profile(TIME_STR, vname, layers, profile[vname])
+            except ValueError as err:
+                error = str(err)
+        if error is not None:
+            print('    FAILED: ' + error)
+            failed.append(('case ' + str(CASEID[index_case]) + ' ' + TIME_STR, error))
+            for vname in unit[2]:
+                cache.forget('profile/' + TIME_STR + '/' + vname)
+            cache.save()
+            continue
+
+        # Record the cycle as done only once it is on disk (resume point)
+        store.sync()
+        for vname in unit[2]:
+            key = 'profile/' + TIME_STR + '/' + vname
+            cache.record(key, fps[key])
+        cache.save()
+
+    for index_case in range(0,SIZE_CASE):
+        stores[index_case].close()
+    report_failures(failed)
+
+    return {'ens_profile': [store_name(OUTPUT_DIR, caseid) for caseid in CASEID]}
+
+
+def stage_get_profile_load():
+
+    return {'ens_profile': [store_name(OUTPUT_DIR, caseid) for caseid in CASEID]}
+
+
+def func_profile_figname(vname, caseid_str):
+
+    return './figures/' + vname + '_profile_case' + caseid_str + '_ens_stat_dm.png'
+
+
+def func_profile_inputs(index_case, vname):
+
+    cache = UnitCache(cache_name(store_name(OUTPUT_DIR, CASEID[index_case])))
+    return digest([[cache.entries.get('profile/' + TIME_STR + '/' + vname) for TIME_STR in CYCLES], CASEID[index_case]])
+
+
+def stage_plot_profile_is_current():
+
+    figure_cache = UnitCache(FIGURE_CACHE)
+    for index_case in range(0,SIZE_CASE):
+        for vname in VARIABLE_LIST:
+            figname = func_profile_figname(vname, str(CASEID[index_case]))
+            if not (os.path.exists(figname) and figure_cache.is_current('profile/' + figname, func_profile_inputs(index_case, vname))):
+                return False
+    return True
+
+
+def stage_plot_profile(data):
+
+    # Time-height cross sections of the per-layer domain means, one figure
+    # per case and variable: ensemble mean (top) and spread (bottom)
+    figure_cache = UnitCache(FIGURE_CACHE)
+    for index_case in range(0,SIZE_CASE):
+
+        with EnsStore(data['ens_profile'][index_case]) as store:
+            layers = store.profile_layers()
+            profiles = {}
+            for vname in VARIABLE_LIST:
+                profiles[vname] = store.read_profile(vname, CYCLES)
+
+        for vname in VARIABLE_LIST:
+            figname = func_profile_figname(vname, str(CASEID[index_case]))
+            print('  - ' + figname)
+
+            plt.rcParams.update({'font.size': 14})
+            fig, axes = plt.subplots(2, 1, figsize=(12,10))
+            for ax, field, figure_title02 in zip(axes, profiles[vname], ['Mean','STD']):
+                pc = ax.pcolormesh(np.arange(0,SIZE_CYCLE), layers, np.transpose(field), shading='nearest',
+                                   cmap='viridis' if figure_title02 == 'Mean' else 'magma_r')
+                ax.set_ylim(max(layers) + 0.5, min(layers) - 0.5)
+                ax.xaxis.set_major_locator(mpl.ticker.MaxNLocator(integer=True))
+                ax.set_xlabel('Cycles Every 3h From ' + YEAR + DATE[0] + HOUR[0])
+                ax.set_ylabel('Layer (' + str(max(layers)) + ': bottom)')
+                ax.set_title('Case ' + str(CASEID[index_case]) + ': ' + vname + ', domain mean of the ensemble ' + figure_title02)
+                fig.colorbar(pc, ax=ax)
+            plt.tight_layout()
+            plt.savefig(figname,bbox_inches='tight',dpi=100)
+            plt.close()
+
+            figure_cache.record('profile/' + figname, func_profile_inputs(index_case, vname))
+    figure_cache.save()
+
+
+#%% ============================================
+#   Run the stages
+#   ============================================
+STAGES = {'get_data': {'run': stage_get_data, 'is_current': stage_get_data_is_current, 'load': stage_get_data_load},
+          'plot_map': {'run': stage_plot_map, 'is_current': stage_plot_map_is_current},
+          'plot_ts':  {'run': stage_plot_ts,  'is_current': stage_plot_ts_is_current},
+          'plot_diff': {'run': stage_plot_diff, 'is_current': stage_plot_diff_is_current},
+          'get_profile':  {'run': stage_get_profile,  'is_current': stage_get_profile_is_current,
+                           'load': stage_get_profile_load},
+          'plot_profile': {'run': stage_plot_profile, 'is_current': stage_plot_profile_is_current}}
+
+if __name__ == '__main__':
+
+    pipeline = Pipeline(config, STAGES)
+    if args.stages is None:
+        pipeline.run(force=args.force)
+    else:
+        pipeline.run(args.stages.split(','), force=args.force)
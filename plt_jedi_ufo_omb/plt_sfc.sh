@@ -6,18 +6,18 @@ exp='exp2'
 OBSTYPE='surface'
 taskdir=/scratch1/BMC/zrtrr/llin/210511_jedi/61_mhu_test/test_v01/case2/output
 
-VarName='air_temperature'
-filename="ufo_sfc_2021010612_t_0000.nc4"
-python plt_ufo_omb.py $taskdir/$filename $OBSTYPE $VarName $exp
+# All variables in one process: each file (and its MetaData) is read once,
+# e.g. the uv file serves both eastward_wind and northward_wind
+manifest=manifest_sfc_${exp}.txt
+cat > $manifest << EOF
+$taskdir/ufo_sfc_2021010612_t_0000.nc4   $OBSTYPE air_temperature   $exp
+$taskdir/ufo_sfc_2021010612_q_0000.nc4   $OBSTYPE specific_humidity $exp
+$taskdir/ufo_sfc_2021010612_uv_0000.nc4  $OBSTYPE eastward_wind     $exp
+$taskdir/ufo_sfc_2021010612_uv_0000.nc4  $OBSTYPE northward_wind    $exp
+EOF
+python plt_ufo_omb.py --manifest $manifest
 
-VarName='specific_humidity'
-filename="ufo_sfc_2021010612_q_0000.nc4"
-python plt_ufo_omb.py $taskdir/$filename $OBSTYPE $VarName $exp
-
-VarName='eastward_wind'
-filename="ufo_sfc_2021010612_uv_0000.nc4"
-python plt_ufo_omb.py $taskdir/$filename $OBSTYPE $VarName $exp
-
-VarName='northward_wind'
-filename="ufo_sfc_2021010612_uv_0000.nc4"
-python plt_ufo_omb.py $taskdir/$filename $OBSTYPE $VarName $exp
+# One variable per run:
+#VarName='air_temperature'
+#filename="ufo_sfc_2021010612_t_0000.nc4"
+#python plt_ufo_omb.py $taskdir/$filename $OBSTYPE $VarName $exp
@@ -9,16 +9,108 @@ Output:
 History Log:
    2021      : Shun Liu (https://github.com/ShunLiu-NOAA/plt_ufo_acceptance)
    2022.05.04: Liaofan Lin - Modified
+   2026.10.18: --manifest runs many jobs in one process, each file opened once;
+               subtask is an argument of plt_ufo_t
+   2026.10.18: Density mode for the scatter plots of large files (--mode)
+   2026.10.18: --tasks: statistics and histogram over all MPI-task files, reduced
+               in parallel (--workers); RMS without the Python loop
+   2026.10.18: Plain arrays and validity masks instead of masked arrays
+               (pyda_util/nc_read.py); same figures
+   2026.10.18: --instrument FILE writes a timing/IO/memory report (pyda_util/instrument.py)
+
+Usage:
+   python plt_ufo_omb.py filename OBSTYPE VarName subtask [--mode auto|points|density] [--bins N]
+   python plt_ufo_omb.py --manifest MANIFEST [--mode ...] [--bins N]
+   python plt_ufo_omb.py 'ufo_sfc_2021010612_t_*.nc4' OBSTYPE VarName subtask --tasks [--workers N]
+   any of the above [--instrument report.json|report.csv] [--cprofile FILE]
+
+Note:
+   - MANIFEST: one "file obstype variable subtask" per line (see pyda_util/ufo_io.py);
+     the jobs are grouped by file, so a file and its MetaData are read once
+   - density mode bins the points of figures (1) and (3) into an N x N 2-D
+     histogram drawn as one image with a log colour scale; its cost hardly
+     grows with the number of obs.  auto: points up to DENSITY_MIN_POINTS obs
+   - with --tasks, filename is a glob of the MPI-task files; each file is
+     reduced to mergeable statistics (pyda_util/obs_stat.py) and only the
+     histogram (2) is drawn, as the scatter plots need every point
+   - --instrument times every job and every savefig, counts the bytes read
+     from each variable and records the peak RSS
 '''
 
 import numpy as np
 import sys
-import statistics
-import math
+import os
+import argparse
+import matplotlib as mpl
 import matplotlib.pyplot as plt
-from netCDF4 import Dataset
 
-def plt_ufo_t(filename,OBSTYPE,VarName):
+# Shared helpers (repository root)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pyda_util.ufo_io import UfoFile, read_manifest, group_by_file
+from pyda_util.parallel import run_units, report_failures
+from pyda_util.nc_read import combine_valid, as_masked
+from pyda_util.obs_stat import DiffStat, HIST_BINS, HIST_RANGE, task_files, ufo_diff_stat
+from pyda_util import instrument
+
+
+# Scatter plots: 'points', 'density' or 'auto' (density above DENSITY_MIN_POINTS obs)
+PLOT_MODE = 'auto'
+DENSITY_MIN_POINTS = 100000
+
+# Number of bins along each axis in density mode
+DENSITY_BINS = 200
+
+
+def density_2d(x,y,bins=DENSITY_BINS):
+
+   # 2-D histogram of the valid (x,y) pairs with uniform bins, in one bincount;
+   # returns counts (x,y) and the bin edges
+   valid = ~(np.ma.getmaskarray(x) | np.ma.getmaskarray(y))
+   x = np.ma.getdata(x)[valid]
+   y = np.ma.getdata(y)[valid]
+   valid = np.isfinite(x) & np.isfinite(y)
+   x = x[valid]
+   y = y[valid]
+
+   if len(x) == 0:
+      return np.zeros((bins,bins)), np.linspace(0,1,bins+1), np.linspace(0,1,bins+1)
+
+   edges = []
+   index = []
+   for v in (x,y):
+      vmin = float(v.min())
+      vmax = float(v.max())
+      if vmax <= vmin:
+         vmax = vmin + 1.0
+      edges.append(np.linspace(vmin,vmax,bins+1))
+      ii = ((v - vmin) * (bins / (vmax - vmin))).astype(np.intp)
+      index.append(np.minimum(ii, bins-1))
+
+   counts = np.bincount(index[0]*bins + index[1], minlength=bins*bins).reshape(bins,bins)
+   return counts, edges[0], edges[1]
+
+
+def plt_xy(fig,ax,x,y,mode,bins,**scatter_kwargs):
+
+   # scatter of (x,y), or its density with a log colour scale
+   if mode == 'auto':
+      mode = 'density' if np.size(x) > DENSITY_MIN_POINTS else 'points'
+
+   if mode == 'points':
+      plt.scatter(x,y,**scatter_kwargs)
+   else:
+      counts, xedges, yedges = density_2d(x,y,bins)
+      mesh = ax.pcolormesh(xedges,yedges,np.ma.masked_equal(counts,0).T,
+                           norm=mpl.colors.LogNorm(),cmap='viridis',rasterized=True)
+      fig.colorbar(mesh,ax=ax,label='number of obs')
+
+
+def plt_ufo_t(filename,OBSTYPE,VarName,subtask,ufo_file=None,mode=PLOT_MODE,bins=DENSITY_BINS):
+
+   # without ufo_file (an open UfoFile of filename) the file is opened for this call only
+   if ufo_file is None:
+      with UfoFile(filename) as ufo_file:
+         return plt_ufo_t(filename,OBSTYPE,VarName,subtask,ufo_file,mode,bins)
 
    # Loading data 
    thisobstype=OBSTYPE
@@ -26,12 +118,12 @@ def plt_ufo_t(filename,OBSTYPE,VarName):
    gsihofXBc=thisvarname+'@GsiHofXBc'
    gsihofX  =thisvarname+'@GsiHofX'
    ufohofX  =thisvarname+'@hofx'
-   f=Dataset(filename, mode='r')
-   gsi_observer_withqc=f.variables[gsihofXBc][:]
-   gsi_observer_noqc  =f.variables[gsihofX][:]
-   ufo                =f.variables[ufohofX][:]
-   geopotential_height=f.variables['height@MetaData'][:]
-   f.close()
+   # plain arrays and their validity masks (None: all valid); masked arrays
+   # only where matplotlib or the printout want them
+   gsi_observer_withqc,gsi_valid=ufo_file.read_valid(gsihofXBc)
+   ufo,ufo_valid                =ufo_file.read_valid(ufohofX)
+   geopotential_height,hgt_valid=ufo_file.read_valid('height@MetaData')
+   valid=combine_valid(gsi_valid,ufo_valid)
 
    #=========================
    # Figure 1: Scatter Plot (GSI vs. UFO)
@@ -40,65 +132,149 @@ def plt_ufo_t(filename,OBSTYPE,VarName):
    fig = plt.figure(figsize=(8.0,7.5))
    ax=fig.add_subplot(111)
 
-   plt.scatter(gsi_observer_withqc,ufo, color='blue',label=thisobstype, marker='o', s=3)
+   plt_xy(fig,ax,as_masked(gsi_observer_withqc,gsi_valid),as_masked(ufo,ufo_valid),mode,bins, color='blue',label=thisobstype, marker='o', s=3)
 
    plt.xlabel('gsi')
    plt.ylabel('ufo')
    plt.title(thisobstype+':gsi and ufo hofx scatter')
    figname='ufo_'+thisobstype+'_'+thisvarname+'_scatter_'+subtask+'.png'
    plt.savefig(figname,bbox_inches='tight',dpi=100)
+   plt.close(fig)
    #=========================
 
    #=========================
    # Figure 2: Histogram of the difference between GSI/UFO
-   diff=gsi_observer_withqc
-   diff=diff - ufo
-   print(diff)
+   diff=gsi_observer_withqc - ufo
 
-   rms=float(0)
-   for x in diff:
-      rms=rms+x*x
-      
-   rms=math.sqrt(rms/len(diff))
-   print("rms=",rms)
+   stat=DiffStat()
+   stat.add(diff,valid=valid)
+   diff=as_masked(diff,valid)
+   print(diff)
+   print("rms=",stat.rms())
 
    print(diff.max(),diff.min())
 
-   fig1 = plt.figure(figsize=(8.0,7.5))
-   ax=fig1.add_subplot(111)
-
-   plt.hist(diff,bins=50,range=(-2.00,2.00))
-
-   plt.xlabel('(gsi-ufo)*1')
-   plt.title(thisobstype+':gsi and ufo diff histogram')
-   figname='ufo_'+thisobstype+'_'+thisvarname+'_hist_'+subtask+'.png'
-   plt.savefig(figname,bbox_inches='tight',dpi=100)
+   plt_diff_hist(stat,thisobstype,thisvarname,subtask)
    #=========================
 
    #=========================
    # Figure 3: Difference between GSI/UFO over heights
    fig2 = plt.figure(figsize=(8.0,7.5))
    ax=fig2.add_subplot(111)
-   plt.scatter(diff,geopotential_height, color='b',label="rw", marker='o', s=3)
+   plt_xy(fig2,ax,diff,as_masked(geopotential_height,hgt_valid),mode,bins, color='b',label="rw", marker='o', s=3)
 
    plt.xlabel('(gsi-ufo)*1')
    plt.ylabel('geop-height')
    plt.title(thisobstype+':gsi-ufo diff in vertical')
    figname='ufo_'+thisobstype+'_'+thisvarname+'_vdiff_scatter_'+subtask+'.png'
    plt.savefig(figname,bbox_inches='tight',dpi=100)
+   plt.close(fig2)
    #=========================
 
 
+def plt_diff_hist(stat,thisobstype,thisvarname,subtask):
+
+   # Histogram of the difference from the binned counts of a DiffStat
+   fig1 = plt.figure(figsize=(8.0,7.5))
+   ax=fig1.add_subplot(111)
+
+   plt.hist(stat.edges[:-1],bins=stat.edges,weights=stat.hist)
+
+   plt.xlabel('(gsi-ufo)*1')
+   plt.title(thisobstype+':gsi and ufo diff histogram')
+   figname='ufo_'+thisobstype+'_'+thisvarname+'_hist_'+subtask+'.png'
+   plt.savefig(figname,bbox_inches='tight',dpi=100)
+   plt.close(fig1)
+
+
+def plt_ufo_tasks(pattern,OBSTYPE,VarName,subtask,workers=1):
+
+   # All MPI-task files: one DiffStat per file (on WORKERS processes), merged
+   units = [(fname,VarName,'GsiHofXBc',HIST_BINS,HIST_RANGE) for fname in task_files(pattern)]
+
+   stat = DiffStat()
+   failed = []
+   for unit, task_stat, error in run_units(ufo_diff_stat,units,workers):
+      if error is None:
+         stat.merge(task_stat)
+      else:
+         failed.append((unit[0],error))
+   report_failures(failed)
+
+   print("files=",len(units)-len(failed)," nobs=",stat.count)
+   print("bias=",stat.bias()," rms=",stat.rms()," std=",stat.std())
+   print(stat.max,stat.min)
+
+   plt_diff_hist(stat,OBSTYPE,VarName,subtask)
+   return failed
+
+
+def plt_ufo_batch(jobs,mode=PLOT_MODE,bins=DENSITY_BINS):
+
+   # jobs: (filename, OBSTYPE, VarName, subtask); one open per file
+   failed = []
+   for filename, group in group_by_file(jobs):
+      try:
+         ufo_file = UfoFile(filename)
+      except (OSError, RuntimeError) as err:
+         failed += [(' '.join(job), str(err)) for job in group]
+         continue
+      with ufo_file:
+         for (filename,OBSTYPE,VarName,subtask) in group:
+            print("  - " + filename + ": " + VarName)
+            try:
+               with instrument.span('job',VarName,file=os.path.basename(filename),obstype=OBSTYPE,subtask=subtask):
+                  plt_ufo_t(filename,OBSTYPE,VarName,subtask,ufo_file,mode,bins)
+            except (KeyError, IndexError, ValueError) as err:
+               print("FAILED: " + type(err).__name__ + ": " + str(err))
+               failed.append((' '.join([filename,OBSTYPE,VarName,subtask]), type(err).__name__ + ": " + str(err)))
+   report_failures(failed)
+   return failed
+
+
 #=====================================================================
 #=====================================================================
 if __name__ == '__main__':
 
+   parser = argparse.ArgumentParser(description='Plot the hofx from GSI and UFO')
+   parser.add_argument('filename', nargs='?')
+   parser.add_argument('OBSTYPE', nargs='?')
+   parser.add_argument('VarName', nargs='?')
+   parser.add_argument('subtask', nargs='?')
+   parser.add_argument('--manifest', default=None,
+                       help='file of "file obstype variable subtask" jobs, run in this one process')
+   parser.add_argument('--mode', choices=['auto','points','density'], default=PLOT_MODE,
+                       help='scatter plots as points or as a 2-D histogram (auto: by the number of obs)')
+   parser.add_argument('--bins', type=int, default=DENSITY_BINS,
+                       help='number of bins along each axis in density mode')
+   parser.add_argument('--tasks', action='store_true',
+                       help='filename is a glob of MPI-task files, reduced to one set of statistics')
+   parser.add_argument('--workers', type=int, default=1,
+                       help='number of worker processes reading the task files')
+   instrument.add_arguments(parser)
+   args = parser.parse_args()
+   instrument.setup(args)
+
+   if args.tasks:
+      if args.subtask is None:
+         parser.error('--tasks needs filename (a glob) OBSTYPE VarName subtask')
+      print("start ploting")
+      print("ploting gsi hofx v.s. ufo hofx, all files of " + args.filename)
+      failed = plt_ufo_tasks(args.filename,args.OBSTYPE,args.VarName,args.subtask,args.workers)
+      print("ploting done")
+      sys.exit(1 if len(failed) > 0 else 0)
+
+   if args.manifest is not None:
+      jobs = read_manifest(args.manifest)
+   elif args.subtask is not None:
+      jobs = [(args.filename, args.OBSTYPE, args.VarName, args.subtask)]
+   else:
+      parser.error('give filename OBSTYPE VarName subtask, or --manifest')
+
    print("start ploting")
    print("ploting gsi hofx v.s. ufo hofx")
-   fileame=sys.argv[1]
-   OBSTYPE=sys.argv[2]
-   VarName=sys.argv[3]
-   subtask=sys.argv[4]
-   plt_ufo_t(fileame,OBSTYPE,VarName)
+   failed = plt_ufo_batch(jobs,args.mode,args.bins)
    print("ploting done")
+   if len(failed) > 0:
+      sys.exit(1)
 
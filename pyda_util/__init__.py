@@ -0,0 +1,9 @@
+'''
+Purpose: Shared helpers for the pyda scripts (FV3 ensemble statistics,
+         JEDI/GSI observation listing and plotting).
+
+Note:
+   - The scripts live in their own directories and are run from there, so
+     each of them puts the repository root on sys.path before importing
+     from this package.
+'''
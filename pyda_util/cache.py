@@ -0,0 +1,98 @@
+'''
+Purpose: Input-fingerprinted cache for the data-process stages.  For every
+         output (e.g. one cycle of one variable in the case store) it records
+         the inputs it came from: member file paths, sizes and mtimes, the
+         processing parameters (variable, layer, ...) and the code version.
+         A re-run recomputes an output only when its fingerprint changes.
+
+Note:
+   - the cache is a small JSON file next to the case store; it is rewritten
+     (atomically) after each finished unit, so a job killed on walltime
+     resumes where it stopped
+   - entries no longer produced by the current configuration are evicted
+
+History Log:
+   - 2026.10.18: Created
+'''
+
+import os
+import json
+import hashlib
+
+
+def cache_name(store_fname):
+
+    return os.path.splitext(store_fname)[0] + '.cache.json'
+
+
+def code_version(*modules):
+    '''
+    Hash of the source of the modules that produce the outputs; any edit to
+    them invalidates the cache.
+    '''
+    sha = hashlib.sha1()
+    for module in modules:
+        with open(module.__file__, 'rb') as f:
+            sha.update(f.read())
+    return sha.hexdigest()[0:12]
+
+
+def file_fingerprint(fname):
+
+    # a missing file gets no size/mtime, so it never matches a recorded entry
+    try:
+        st = os.stat(fname)
+    except OSError:
+        return [os.path.abspath(fname), None, None]
+    return [os.path.abspath(fname), st.st_size, st.st_mtime_ns]
+
+
+def digest(obj):
+
+    # short hash of a JSON-able object (e.g. the entries a figure was drawn from)
+    return hashlib.sha1(json.dumps(obj, sort_keys=True).encode()).hexdigest()[0:16]
+
+
+def fingerprint(files, **params):
+
+    return {'files': [file_fingerprint(fname) for fname in files],
+            'params': params}
+
+
+class UnitCache:
+
+    def __init__(self, fname):
+
+        self.fname = fname
+        self.entries = {}
+        if os.path.exists(fname):
+            with open(fname) as f:
+                self.entries = json.load(f)
+
+    def is_current(self, key, fp):
+        return self.entries.get(key) == fp
+
+    def record(self, key, fp):
+        self.entries[key] = fp
+
+    def forget(self, key):
+        self.entries.pop(key, None)
+
+    def evict(self, prefix, keep):
+        '''
+        Drop the entries starting with `prefix` that are not in `keep`.
+        '''
+        keep = set(keep)
+        orphans = [key for key in self.entries if key.startswith(prefix) and key not in keep]
+        for key in orphans:
+            del self.entries[key]
+        return orphans
+
+    def save(self):
+
+        # write to a temporary file and rename, so a killed job never leaves
+        # a half-written cache behind
+        tmpname = self.fname + '.tmp'
+        with open(tmpname, 'w') as f:
+            json.dump(self.entries, f, indent=1, sort_keys=True)
+        os.replace(tmpname, self.fname)
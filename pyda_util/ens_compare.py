@@ -0,0 +1,138 @@
+'''
+Purpose: Comparison of any number of experiments (cases) map by map: the
+         difference of every pair of cases, averaged over the cycles, and the
+         significance of that mean difference at every grid point.
+
+         The maps of a case are stacked as (cycle, y, x) and all the pairs
+         are differenced at once, so the tests are NumPy reductions over the
+         cycle axis for the whole grid (no loop over the grid points):
+            - ttest:     paired t-test of the cycle-by-cycle differences
+            - bootstrap: the cycles are resampled with replacement; the
+                         resampled means of all the grid points of a block
+                         are one matrix product of the resampling counts
+                         (sample, cycle) with the centred differences
+                         (cycle, point)
+
+Note:
+   - the cycles are taken as independent samples; successive 3-hourly
+     cycles are correlated, so the p-values are on the optimistic side
+   - p-values are two-sided; a grid point with no spread in its differences
+     gets p = 0 (a constant non-zero difference) or 1 (no difference)
+   - the bootstrap p-value is (1 + number of resampled means at least as far
+     from the mean as the mean is from 0) / (1 + samples), so its smallest
+     value is 1 / (1 + samples); with few cycles it is liberal (with no real
+     difference, about 8 % of the points at p < 0.05 with 16 cycles and 12 %
+     with 8), so the t-test is the default
+
+History Log:
+   - 2026.10.18: Created
+'''
+
+import numpy as np
+from scipy import stats
+
+
+# Significance tests
+TESTS = ['ttest', 'bootstrap']
+
+# Resamples of the bootstrap test
+BOOTSTRAP_SAMPLES = 1000
+
+# Grid points per bootstrap block (bounds the (sample, point) array)
+POINT_BLOCK = 4096
+
+
+def case_pairs(size_case, pairs=None):
+    '''
+    [(a, b), ...]: case indices of the differences b - a; every pair a < b by
+    default
+    '''
+    if pairs is None:
+        return [(aa, bb) for aa in range(0, size_case) for bb in range(aa + 1, size_case)]
+    pairs = [tuple(pair) for pair in pairs]
+    for pair in pairs:
+        if len(pair) != 2 or not all([0 <= cc < size_case for cc in pair]) or pair[0] == pair[1]:
+            raise ValueError('bad pair of cases ' + str(list(pair)) + ' for ' + str(size_case) + ' cases')
+    return pairs
+
+
+def pair_differences(fields, pairs):
+    '''
+    fields: (case, cycle, ...) -> differences (pair, cycle, ...) in float64
+    '''
+    index = np.array(pairs, dtype=np.int64).reshape(-1, 2)
+    return np.subtract(fields[index[:,1]], fields[index[:,0]], dtype=np.float64)
+
+
+def paired_ttest(diff):
+    '''
+    Mean over the cycles (axis 1) of diff (pair, cycle, ...) and the p-value
+    of the paired t-test
+    '''
+    ncycle = diff.shape[1]
+    mean = np.mean(diff, axis=1)
+    if ncycle < 2:
+        return mean, np.full(mean.shape, np.nan)
+
+    sem = np.std(diff, axis=1, ddof=1) / np.sqrt(ncycle)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        tt = np.abs(mean) / sem
+    pvalue = 2.0 * stats.t.sf(tt, ncycle - 1)
+    pvalue = np.where(sem == 0.0, np.where(mean == 0.0, 1.0, 0.0), pvalue)
+    return mean, np.where(np.isfinite(mean), pvalue, np.nan)
+
+
+def bootstrap_counts(ncycle, samples=BOOTSTRAP_SAMPLES, seed=0):
+    '''
+    (samples, cycle) number of times each cycle is drawn in each resample
+    '''
+    rng = np.random.default_rng(seed)
+    draws = rng.integers(0, ncycle, (samples, ncycle))
+    counts = np.zeros((samples, ncycle))
+    np.add.at(counts, (np.repeat(np.arange(samples), ncycle), draws.ravel()), 1.0)
+    return counts
+
+
+def bootstrap_test(diff, samples=BOOTSTRAP_SAMPLES, seed=0, block=POINT_BLOCK):
+    '''
+    Mean over the cycles (axis 1) of diff (pair, cycle, ...) and the p-value
+    of the bootstrap test (same resamples at every grid point)
+    '''
+    ncycle = diff.shape[1]
+    mean = np.mean(diff, axis=1)
+    if ncycle < 2:
+        return mean, np.full(mean.shape, np.nan)
+
+    # (cycle, point) differences centred on their mean: resampled means
+    # about 0 under the null hypothesis
+    columns = np.moveaxis(diff, 1, 0).reshape(ncycle, -1)
+    target = np.abs(mean).reshape(-1)
+    weights = bootstrap_counts(ncycle, samples, seed) / ncycle
+
+    exceed = np.zeros(target.size)
+    for start in range(0, target.size, block):
+        points = slice(start, min(start + block, target.size))
+        centred = columns[:,points] - mean.reshape(-1)[points]
+        resampled = weights @ centred
+        # a resampled mean equal to the mean (to rounding) counts as exceeding
+        exceed[points] = np.sum(np.abs(resampled) >= target[points] * (1.0 - 1.0e-12), axis=0)
+
+    pvalue = ((1.0 + exceed) / (1.0 + samples)).reshape(mean.shape)
+    return mean, np.where(np.isfinite(mean), pvalue, np.nan)
+
+
+def compare_cases(fields, pairs=None, test='ttest', samples=BOOTSTRAP_SAMPLES, seed=0):
+    '''
+    fields: (case, cycle, y, x) maps of the cases on the same cycles
+
+    Returns (pairs, mean difference (pair, y, x), p-value (pair, y, x))
+    '''
+    if test not in TESTS:
+        raise ValueError('unknown test ' + str(test) + ' (' + ', '.join(TESTS) + ')')
+    pairs = case_pairs(fields.shape[0], pairs)
+    diff = pair_differences(fields, pairs)
+    if test == 'ttest':
+        mean, pvalue = paired_ttest(diff)
+    else:
+        mean, pvalue = bootstrap_test(diff, samples, seed)
+    return pairs, mean, pvalue
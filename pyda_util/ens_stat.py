@@ -0,0 +1,123 @@
+'''
+Purpose: Streaming (Welford) ensemble statistics.  Members are folded in one
+         at a time, so memory stays O(grid) no matter how many members there
+         are.
+
+History Log:
+   - 2026.10.18: Created
+   - 2026.10.18: Members are folded in tile by tile on a thread pool
+                 (pyda_util.tiles); same statistics
+'''
+
+import numpy as np
+
+
+class EnsembleAccumulator:
+    '''
+    Running mean, variance, min and max of a field over ensemble members.
+
+    mean/M2 are kept in `dtype` (float64 by default, which reproduces the
+    numbers of the old np.mean/np.std over a float64 member array); min and
+    max stay in the native dtype of the input, where they are exact.
+
+    With a pool (pyda_util.tiles.TilePool), add() updates the grid tile by
+    tile on its threads.
+    '''
+
+    def __init__(self, dtype=np.float64, pool=None):
+        self.dtype = np.dtype(dtype)
+        self.pool = pool
+        self.count = 0
+        self._mean = None
+        self._m2 = None
+        self._min = None
+        self._max = None
+        self._delta = None
+
+    def add(self, field):
+
+        # plain data (same as copying a masked array into np.zeros before)
+        field = np.ma.getdata(field)
+
+        if self.count == 0:
+            self._mean = field.astype(self.dtype, copy=True)
+            self._m2 = np.zeros(field.shape, dtype=self.dtype)
+            self._min = field.copy()
+            self._max = field.copy()
+            self._delta = np.empty(field.shape, dtype=self.dtype)
+            self.count = 1
+            return
+
+        if field.shape != self._mean.shape:
+            raise ValueError('member shape ' + str(field.shape) + ' does not match ' + str(self._mean.shape))
+
+        self.count += 1
+        if self.pool is None or field.ndim < 2:
+            self._add(field, Ellipsis)
+        else:
+            self.pool.map(lambda tile: self._add(field, (Ellipsis,) + tile), field.shape)
+
+    def _add(self, field, index):
+
+        # views of one tile (or of the whole grid)
+        field = field[index]
+        mean, m2, delta = self._mean[index], self._m2[index], self._delta[index]
+        vmin, vmax = self._min[index], self._max[index]
+
+        # delta = x - mean_old ; mean += delta/n ; M2 += delta*(x - mean_new)
+        np.subtract(field, mean, out=delta, casting='unsafe')
+        mean += delta / self.count
+        delta *= field - mean
+        m2 += delta
+
+        np.minimum(vmin, field, out=vmin)
+        np.maximum(vmax, field, out=vmax)
+
+    def merge(self, other):
+        '''
+        Fold in another accumulator (Chan et al. pairwise update).
+        '''
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            self.count = other.count
+            self._mean = other._mean.astype(self.dtype, copy=True)
+            self._m2 = other._m2.astype(self.dtype, copy=True)
+            self._min = other._min.copy()
+            self._max = other._max.copy()
+            self._delta = np.empty(self._mean.shape, dtype=self.dtype)
+            return self
+
+        n = self.count + other.count
+        delta = other._mean - self._mean
+        self._mean += delta * (other.count / n)
+        self._m2 += other._m2 + delta * delta * (self.count * other.count / n)
+        np.minimum(self._min, other._min, out=self._min)
+        np.maximum(self._max, other._max, out=self._max)
+        self.count = n
+        return self
+
+    # -------------------------------------------------------------------------
+    def _check(self):
+        if self.count == 0:
+            raise ValueError('no members have been added')
+
+    def mean(self):
+        self._check()
+        return self._mean.copy()
+
+    def var(self, ddof=0):
+        self._check()
+        return self._m2 / (self.count - ddof)
+
+    def std(self, ddof=0):
+        # ddof=0 matches np.std
+        return np.sqrt(self.var(ddof))
+
+    def min(self):
+        self._check()
+        return self._min.copy()
+
+    def max(self):
+        self._check()
+        return self._max.copy()
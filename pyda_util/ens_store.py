@@ -0,0 +1,308 @@
+'''
+Purpose: One compressed, chunked NetCDF4 store per case for the ensemble
+         statistics, in place of the per-cycle/per-variable pickle files.
+
+Layout (ens_stat_case<CASEID>.nc):
+   cycle (unlimited)                  cycle initial time, YYYYMMDDHH
+   stat                               mean, std
+   lat(y,x), lon(y,x)                 grid coordinates
+   <var>(cycle,stat,y,x)              ensemble mean/std maps (float32, zlib, one chunk per map)
+   <var>_dm(cycle,stat)               domain means of the maps
+   <var>_member(cycle,member,stat)    domain mean/std of each member
+   <var>_region_dm(cycle,stat,region)           area-weighted region means of the maps
+   <var>_region_member(cycle,member,stat,region) area-weighted region mean/std of each member
+   layer                              layers of the profiles (1: top of the model)
+   <var>_profile(cycle,stat,layer)    per-layer domain means of the ensemble mean/std maps
+
+Note:
+   - a new cycle is appended along the unlimited dimension; existing cycles
+     are neither read nor rewritten, and a cycle that is already there is
+     overwritten in place
+   - readers slice single cycles, nothing is loaded until it is asked for
+   - only one process should write to a store at a time
+
+History Log:
+   - 2026.10.18: Created
+   - 2026.10.18: Region statistics (pyda_util.regions)
+   - 2026.10.18: Opened through pyda_util.instrument.nc_open (reads counted when instrumented)
+   - 2026.10.18: Full-column profiles (cycle, layer) of the profile mode
+   - 2026.10.18: read_cycles(): one statistic of many cycles at once (experiment comparison)
+'''
+
+import os
+import numpy as np
+from netCDF4 import Dataset
+
+from pyda_util.instrument import nc_open
+
+
+STAT_NAMES = ['mean', 'std']
+
+
+def store_name(outdir, caseid):
+
+    return outdir + '/ens_stat_case' + str(caseid) + '.nc'
+
+
+class EnsStore:
+
+    def __init__(self, fname, mode='r'):
+
+        # mode 'a' creates the store (and its directory) if it does not exist yet
+        if mode == 'a' and not os.path.exists(fname):
+            os.makedirs(os.path.dirname(fname) or '.', exist_ok=True)
+            self.nc = Dataset(fname, 'w', format='NETCDF4')
+            self.nc.createDimension('cycle', None)
+            self.nc.createDimension('stat', len(STAT_NAMES))
+            self.nc.stat_names = ' '.join(STAT_NAMES)
+            cycle = self.nc.createVariable('cycle', 'i8', ('cycle',))
+            cycle.long_name = 'cycle initial time (YYYYMMDDHH)'
+        else:
+            self.nc = nc_open(fname, mode)
+
+        self.fname = fname
+        self._cycles = {}
+        for ii, cc in enumerate(np.ma.getdata(self.nc.variables['cycle'][:])):
+            self._cycles[str(cc)] = ii
+
+    def close(self):
+        self.nc.close()
+
+    def sync(self):
+        # flush to disk (before a cache entry records the cycle as done)
+        self.nc.sync()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # -------------------------------------------------------------------------
+    #   Cycles and coordinates
+    # -------------------------------------------------------------------------
+    def cycles(self):
+        return sorted(self._cycles, key=self._cycles.get)
+
+    def has_cycle(self, time_str, vname=None):
+
+        # with vname: the maps of that variable have been written for the cycle
+        if time_str not in self._cycles:
+            return False
+        if vname is None:
+            return True
+        if vname + '_dm' not in self.nc.variables:
+            return False
+        return not np.ma.is_masked(self.nc.variables[vname + '_dm'][self._cycles[time_str], :])
+
+    def _cycle_index(self, time_str, create=False):
+
+        if time_str in self._cycles:
+            return self._cycles[time_str]
+        if not create:
+            raise KeyError('cycle ' + time_str + ' is not in ' + self.fname)
+        ii = len(self.nc.dimensions['cycle'])
+        self.nc.variables['cycle'][ii] = int(time_str)
+        self._cycles[time_str] = ii
+        return ii
+
+    def has_lonlat(self):
+        return 'lon' in self.nc.variables
+
+    def set_lonlat(self, lon, lat):
+
+        if self.has_lonlat():
+            return
+        ny, nx = np.shape(lon)
+        self.nc.createDimension('y', ny)
+        self.nc.createDimension('x', nx)
+        for name, value, units in (('lon', lon, 'degrees_east'), ('lat', lat, 'degrees_north')):
+            var = self.nc.createVariable(name, 'f8', ('y','x'), zlib=True, complevel=4)
+            var.units = units
+            var[:] = value
+
+    def lonlat(self):
+        return self.nc.variables['lon'][:], self.nc.variables['lat'][:]
+
+    # -------------------------------------------------------------------------
+    #   Ensemble statistics maps and their domain means
+    # -------------------------------------------------------------------------
+    def _variable(self, name, dims, dtype, **kwargs):
+
+        if name in self.nc.variables:
+            return self.nc.variables[name]
+        return self.nc.createVariable(name, dtype, dims, zlib=True, complevel=4, shuffle=True, **kwargs)
+
+    def write_cycle(self, time_str, vname, fields):
+        '''
+        fields: [var_2d_avg, var_2d_std]
+        '''
+        if not self.has_lonlat():
+            raise ValueError('set_lonlat() has to be called before writing maps to ' + self.fname)
+        ny = len(self.nc.dimensions['y'])
+        nx = len(self.nc.dimensions['x'])
+
+        ii = self._cycle_index(time_str, create=True)
+        var = self._variable(vname, ('cycle','stat','y','x'), 'f4', chunksizes=(1,1,ny,nx))
+        var.coordinates = 'lat lon'
+        for jj, field in enumerate(fields):
+            var[ii,jj,:,:] = field
+
+        # domain means from the full-precision fields
+        dm = self._variable(vname + '_dm', ('cycle','stat'), 'f8')
+        dm[ii,:] = [np.mean(field, dtype=np.float64) for field in fields]
+
+    def read_cycle(self, time_str, vname):
+        '''
+        Returns [var_2d_avg, var_2d_std] of one cycle (one chunk per map)
+        '''
+        ii = self._cycle_index(time_str)
+        var = self.nc.variables[vname]
+        return [var[ii,jj,:,:] for jj in range(len(STAT_NAMES))]
+
+    def read_cycles(self, vname, cycles, stat_index):
+        '''
+        One statistic (0: mean, 1: std) of the maps of several cycles, as an
+        array (len(cycles), y, x); NaN where the maps have no data
+        '''
+        var = self.nc.variables[vname]
+        out = np.empty((len(cycles),) + var.shape[2:], dtype=np.float32)
+        for cc, time_str in enumerate(cycles):
+            out[cc] = np.ma.filled(var[self._cycle_index(time_str),stat_index,:,:], np.nan)
+        return out
+
+    def read_domain_mean(self, vname, cycles):
+        '''
+        Domain means as an array (len(cycles), stat); NaN for missing cycles
+        '''
+        out = np.full((len(cycles), len(STAT_NAMES)), np.nan)
+        if vname + '_dm' not in self.nc.variables:
+            return out
+        dm = self.nc.variables[vname + '_dm']
+        for cc, time_str in enumerate(cycles):
+            if time_str in self._cycles:
+                out[cc,:] = np.ma.filled(dm[self._cycles[time_str],:].astype(np.float64), np.nan)
+        return out
+
+    # -------------------------------------------------------------------------
+    #   Domain statistics of each member
+    # -------------------------------------------------------------------------
+    def write_member_stat(self, time_str, vname, avg, std):
+
+        if 'member' not in self.nc.dimensions:
+            self.nc.createDimension('member', len(avg))
+        ii = self._cycle_index(time_str, create=True)
+        var = self._variable(vname + '_member', ('cycle','member','stat'), 'f8')
+        var[ii,:,0] = avg
+        var[ii,:,1] = std
+
+    def has_member_stat(self, time_str, vname):
+
+        if time_str not in self._cycles or vname + '_member' not in self.nc.variables:
+            return False
+        return not np.ma.is_masked(self.nc.variables[vname + '_member'][self._cycles[time_str],:,:])
+
+    def read_member_stat(self, vname, cycles):
+        '''
+        Returns [domain_avg, domain_std], each (member, len(cycles)); NaN for missing cycles
+        '''
+        size_member = len(self.nc.dimensions['member'])
+        out = np.full((len(STAT_NAMES), size_member, len(cycles)), np.nan)
+        var = self.nc.variables[vname + '_member']
+        for cc, time_str in enumerate(cycles):
+            if time_str in self._cycles:
+                out[:,:,cc] = np.transpose(np.ma.filled(var[self._cycles[time_str],:,:].astype(np.float64), np.nan))
+        return [out[0], out[1]]
+
+
+    # -------------------------------------------------------------------------
+    #   Area-weighted statistics over the verification regions
+    # -------------------------------------------------------------------------
+    def region_names(self):
+
+        if 'region' not in self.nc.dimensions:
+            return []
+        return self.nc.region_names.split(' ')
+
+    def write_region_stat(self, time_str, vname, names, ens, member):
+        '''
+        ens: (stat, region), member: (member, stat, region)
+        '''
+        if 'region' not in self.nc.dimensions:
+            self.nc.createDimension('region', len(names))
+            self.nc.region_names = ' '.join(names)
+        elif self.region_names() != list(names):
+            raise ValueError('the regions of ' + self.fname + ' (' + self.nc.region_names +
+                             ') differ from ' + ' '.join(names) + '; remove the store to rebuild it')
+        if 'member' not in self.nc.dimensions:
+            self.nc.createDimension('member', np.shape(member)[0])
+
+        ii = self._cycle_index(time_str, create=True)
+        self._variable(vname + '_region_dm', ('cycle','stat','region'), 'f8')[ii,:,:] = ens
+        self._variable(vname + '_region_member', ('cycle','member','stat','region'), 'f8')[ii,:,:,:] = member
+
+    def has_region_stat(self, time_str, vname):
+
+        if time_str not in self._cycles or vname + '_region_member' not in self.nc.variables:
+            return False
+        return not np.ma.is_masked(self.nc.variables[vname + '_region_member'][self._cycles[time_str],:,:,:])
+
+    def read_region_stat(self, vname, cycles):
+        '''
+        Returns ens (len(cycles), stat, region) and member (len(cycles), member, stat, region);
+        NaN for missing cycles
+        '''
+        size_region = len(self.nc.dimensions['region'])
+        size_member = len(self.nc.dimensions['member'])
+        ens    = np.full((len(cycles), len(STAT_NAMES), size_region), np.nan)
+        member = np.full((len(cycles), size_member, len(STAT_NAMES), size_region), np.nan)
+        for cc, time_str in enumerate(cycles):
+            if time_str in self._cycles:
+                ii = self._cycles[time_str]
+                ens[cc]    = np.ma.filled(self.nc.variables[vname + '_region_dm'][ii].astype(np.float64), np.nan)
+                member[cc] = np.ma.filled(self.nc.variables[vname + '_region_member'][ii].astype(np.float64), np.nan)
+        return ens, member
+
+    # -------------------------------------------------------------------------
+    #   Full-column profiles
+    # -------------------------------------------------------------------------
+    def profile_layers(self):
+
+        if 'layer' not in self.nc.variables:
+            return []
+        return [int(ll) for ll in np.ma.getdata(self.nc.variables['layer'][:])]
+
+    def write_profile(self, time_str, vname, layers, ens):
+        '''
+        ens: (stat, layer), the domain means of the mean/std maps of each layer
+        '''
+        if 'layer' not in self.nc.dimensions:
+            self.nc.createDimension('layer', len(layers))
+            var = self.nc.createVariable('layer', 'i4', ('layer',))
+            var.long_name = 'model layer (1: top)'
+            var[:] = layers
+        elif self.profile_layers() != list(layers):
+            raise ValueError('the profile layers of ' + self.fname + ' differ from ' + str(list(layers)) +
+                             '; remove the store to rebuild it')
+
+        ii = self._cycle_index(time_str, create=True)
+        self._variable(vname + '_profile', ('cycle','stat','layer'), 'f8')[ii,:,:] = ens
+
+    def has_profile(self, time_str, vname):
+
+        if time_str not in self._cycles or vname + '_profile' not in self.nc.variables:
+            return False
+        return not np.ma.is_masked(self.nc.variables[vname + '_profile'][self._cycles[time_str],:,:])
+
+    def read_profile(self, vname, cycles):
+        '''
+        Returns [mean, std], each (len(cycles), layer); NaN for missing cycles
+        '''
+        out = np.full((len(STAT_NAMES), len(cycles), len(self.profile_layers())), np.nan)
+        if vname + '_profile' not in self.nc.variables:
+            return [out[0], out[1]]
+        var = self.nc.variables[vname + '_profile']
+        for cc, time_str in enumerate(cycles):
+            if time_str in self._cycles:
+                out[:,cc,:] = np.ma.filled(var[self._cycles[time_str],:,:].astype(np.float64), np.nan)
+        return [out[0], out[1]]
@@ -0,0 +1,189 @@
+'''
+Purpose: Read FV3 forecast fields straight from the NetCDF hyperslab, so only
+         the requested layer(s) and time index are pulled off the disk.
+
+Input: FV3 dyn or phy forecast files
+
+History Log:
+   - 2026.10.18: Created
+   - 2026.10.18: read_fv3_layers_valid(): plain arrays and validity masks
+                 (pyda_util.nc_read)
+   - 2026.10.18: Each file read is timed when instrumented (pyda_util.instrument)
+   - 2026.10.18: prefetch_fv3_layers_valid(): the next member files are read on
+                 a background thread while the current one is reduced
+'''
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import numpy.ma as ma
+
+from pyda_util.nc_read import read_valid
+from pyda_util.instrument import nc_open, span
+
+
+#%%============================================================================
+#  File names
+# =============================================================================
+def member_file_name(casedir, time_str, member, file_type='dyn'):
+
+    # member counts from 1 (mem0001, mem0002, ...)
+    return casedir + '/' + time_str + '/mem00' + str(member).zfill(2) + '/fcst_fv3lam/' + file_type + 'f003.nc'
+
+
+#%%============================================================================
+#  Hyperslab reads
+# =============================================================================
+def _as_list(x):
+
+    if isinstance(x, (list, tuple)):
+        return list(x)
+    return [x]
+
+
+def _layer_index(layers):
+
+    # Layers are numbered from 1 (NO_LAYER convention); a contiguous run is
+    # read as one slice, anything else layer by layer.
+    index = [ll - 1 for ll in layers]
+    if index == list(range(index[0], index[-1] + 1)):
+        return [slice(index[0], index[-1] + 1)]
+    return [slice(ii, ii + 1) for ii in index]
+
+
+def read_layers(ncfile, variables, layers, time_index=0):
+    '''
+    Read layers of one or more variables from an open Dataset.
+
+    Returns a dict {variable: array(nlayer, y, x)} in the order of `layers`.
+    Variables without a vertical dimension (time, y, x) come back as (1, y, x).
+    '''
+    layers = _layer_index(_as_list(layers))
+
+    data = {}
+    for vname in _as_list(variables):
+        var = ncfile.variables[vname]
+        if var.ndim == 4:
+            blocks = [var[time_index, ss, :, :] for ss in layers]
+        elif var.ndim == 3:
+            blocks = [var[time_index:time_index + 1, :, :]]
+        else:
+            raise ValueError('unexpected dimensions ' + str(var.dimensions) + ' for ' + vname)
+
+        if len(blocks) == 1:
+            data[vname] = blocks[0]
+        else:
+            data[vname] = ma.concatenate(blocks, axis=0)
+    return data
+
+
+def read_layers_valid(ncfile, variables, layers, time_index=0):
+    '''
+    read_layers() as plain arrays: ({variable: array(nlayer, y, x)},
+    {variable: validity mask of the same shape, or None if all valid})
+    '''
+    layers = _layer_index(_as_list(layers))
+
+    data = {}
+    valid = {}
+    for vname in _as_list(variables):
+        var = ncfile.variables[vname]
+        if var.ndim == 4:
+            blocks = [read_valid(var, (time_index, ss, slice(None), slice(None))) for ss in layers]
+        elif var.ndim == 3:
+            blocks = [read_valid(var, (slice(time_index, time_index + 1), slice(None), slice(None)))]
+        else:
+            raise ValueError('unexpected dimensions ' + str(var.dimensions) + ' for ' + vname)
+
+        if len(blocks) == 1:
+            data[vname], valid[vname] = blocks[0]
+        else:
+            data[vname] = np.concatenate([block[0] for block in blocks], axis=0)
+            if all([block[1] is None for block in blocks]):
+                valid[vname] = None
+            else:
+                valid[vname] = np.concatenate([np.ones(block[0].shape, dtype=bool) if block[1] is None else block[1]
+                                               for block in blocks], axis=0)
+    return data, valid
+
+
+def read_fv3_layers(fname, variables, layers, time_index=0):
+    '''
+    Open `fname` once and read every requested variable/layer from it.
+    '''
+    with span('file', fname):
+        ncfile = nc_open(fname)
+        try:
+            data = read_layers(ncfile, variables, layers, time_index)
+        finally:
+            ncfile.close()
+    return data
+
+
+def read_fv3_layers_valid(fname, variables, layers, time_index=0):
+
+    with span('file', fname):
+        ncfile = nc_open(fname)
+        try:
+            data = read_layers_valid(ncfile, variables, layers, time_index)
+        finally:
+            ncfile.close()
+    return data
+
+
+#%%============================================================================
+#  Read-ahead
+# =============================================================================
+# Number of member files read ahead of the one being reduced (0: no read-ahead)
+PREFETCH_DEPTH = 2
+
+
+def prefetch(read, items, depth=PREFETCH_DEPTH):
+    '''
+    Yield read(item) for every item, in order, while up to `depth` of the
+    next items are read on a background I/O thread.
+
+    At most depth + 1 results are held at a time (the bounded queue), so the
+    memory is capped by the depth.  An error of read(item) is raised when
+    that item is reached, as in a plain loop.  One I/O thread only: the
+    netCDF-C library is not thread safe, and the reduction (NumPy) is what
+    the reads overlap with.
+    '''
+    items = list(items)
+    if depth <= 0:
+        for item in items:
+            yield read(item)
+        return
+
+    pool = ThreadPoolExecutor(max_workers=1)
+    queue = deque()
+    try:
+        for item in items[0:depth]:
+            queue.append(pool.submit(read, item))
+        for ii in range(len(items)):
+            result = queue.popleft().result()
+            if ii + depth < len(items):
+                queue.append(pool.submit(read, items[ii + depth]))
+            yield result
+    finally:
+        # the consumer stopped early (or failed): drop the reads not started
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def prefetch_fv3_layers_valid(fnames, variables, layers, time_index=0, depth=PREFETCH_DEPTH):
+    '''
+    read_fv3_layers_valid() of each file in turn, with `depth` files read ahead
+    '''
+    return prefetch(lambda fname: read_fv3_layers_valid(fname, variables, layers, time_index), fnames, depth)
+
+
+def read_fv3_lonlat(fname):
+
+    ncfile = nc_open(fname)
+    try:
+        lon = ncfile.variables['lon'][:]
+        lat = ncfile.variables['lat'][:]
+    finally:
+        ncfile.close()
+    return lon.squeeze(), lat.squeeze()
@@ -0,0 +1,207 @@
+'''
+Purpose: Per-cycle work units of the FV3 ensemble scripts.  Each unit reads
+         all members of one cycle and returns its statistics, so units can be
+         run in any order and on any worker process.
+
+History Log:
+   - 2026.10.18: Created
+   - 2026.10.18: ens_stat_cycle also returns the per-member domain statistics
+   - 2026.10.18: ens_stat_cycle also returns area-weighted statistics over the
+                 verification regions (pyda_util.regions)
+   - 2026.10.18: Plain arrays and validity masks instead of masked arrays
+                 (pyda_util.nc_read); same statistics
+   - 2026.10.18: threads: the grid is reduced tile by tile on a thread pool
+                 (pyda_util.tiles); domain means/stds accumulated in float64
+   - 2026.10.18: prefetch: the next member files are read while one is reduced
+                 (pyda_util.fv3_io.prefetch)
+   - 2026.10.18: ens_profile_cycle(): per-layer domain means of the ensemble mean
+                 and spread over the full column, streamed in layer blocks
+   - 2026.10.18: Region statistics over the valid points only (of each member, and of
+                 every member for the mean/std maps)
+'''
+
+import numpy as np
+
+from pyda_util.fv3_io import member_file_name, prefetch_fv3_layers_valid, read_layers_valid, PREFETCH_DEPTH
+from pyda_util.fv3_io import prefetch as prefetch_reads
+from pyda_util.instrument import nc_open
+from pyda_util.ens_stat import EnsembleAccumulator
+from pyda_util.regions import load_region_index
+from pyda_util.tiles import TilePool, mean_std
+
+
+def ens_stat_cycle(casedir, time_str, variables, layer, size_member, file_type='dyn', region_file=None, threads=1,
+                   prefetch=PREFETCH_DEPTH):
+    '''
+    Ensemble mean and std of one cycle, and in the same pass over the member
+    files the domain mean and std of each member:
+       ({variable: [var_2d_avg, var_2d_std]}, {variable: [domain_avg, domain_std]}, region)
+
+    With region_file (the region index of the grid, from
+    pyda_util.regions.region_index_file()), region is
+       (region names, {variable: [ens (stat, region), member (member, stat, region)]})
+    the area-weighted region means of the mean/std maps (over the points
+    valid in every member) and the area-weighted region mean/std of each
+    member (over its valid points); otherwise it is None.
+
+    The members are reduced tile by tile on `threads` threads, while the next
+    `prefetch` member files are read.
+    '''
+    with TilePool(threads) as pool:
+        return _ens_stat_cycle(casedir, time_str, variables, layer, size_member, file_type, region_file, pool, prefetch)
+
+
+def _ens_stat_cycle(casedir, time_str, variables, layer, size_member, file_type, region_file, pool, prefetch):
+
+    acc = {}
+    member = {}
+    valid_all = {}
+    for vname in variables:
+        acc[vname] = EnsembleAccumulator(pool=pool)
+        member[vname] = [np.zeros(size_member), np.zeros(size_member)]
+        valid_all[vname] = None
+
+    regions = None
+    region = None
+    if region_file is not None:
+        regions = load_region_index(region_file)
+        member_region = np.zeros((size_member, 2, len(variables), len(regions.names)))
+
+    fnames = [member_file_name(casedir, time_str, mm+1, file_type) for mm in range(0, size_member)]
+    for mm, (var, valid) in enumerate(prefetch_fv3_layers_valid(fnames, variables, layer, depth=prefetch)):
+        for vname in variables:
+            var_2d = var[vname][0,:,:]
+            acc[vname].add(var_2d)
+            member[vname][0][mm], member[vname][1][mm] = \
+                mean_std(var_2d, None if valid[vname] is None else valid[vname][0,:,:], pool)
+
+        # all variables of the member, all regions: one segment sum
+        if regions is not None:
+            member_valid = [None if valid[vname] is None else valid[vname][0,:,:] for vname in variables]
+            member_region[mm] = regions.reduce(np.stack([var[vname][0,:,:] for vname in variables]), member_valid)
+            for vname, mask in zip(variables, member_valid):
+                if mask is not None:
+                    valid_all[vname] = mask if valid_all[vname] is None else valid_all[vname] & mask
+
+    stat = {}
+    for vname in variables:
+        stat[vname] = [acc[vname].mean(), acc[vname].std()]
+
+    if regions is not None:
+        ens_region = regions.reduce(np.stack([field for vname in variables for field in stat[vname]]),
+                                    [valid_all[vname] for vname in variables for field in stat[vname]])[0]
+        region = (regions.names, {})
+        for vv, vname in enumerate(variables):
+            region[1][vname] = [ens_region[2*vv:2*vv+2], member_region[:,:,vv,:]]
+
+    return stat, member, region
+
+
+def domain_stat_cycle(casedir, time_str, variables, layer, size_member, file_type='dyn', threads=1,
+                      prefetch=PREFETCH_DEPTH):
+    '''
+    Domain mean and std of each member of one cycle: {variable: [avg, std]},
+    each of size size_member; reduced tile by tile on `threads` threads,
+    while the next `prefetch` member files are read.
+    '''
+    stat = {}
+    for vname in variables:
+        stat[vname] = [np.zeros(size_member), np.zeros(size_member)]
+
+    fnames = [member_file_name(casedir, time_str, mm+1, file_type) for mm in range(0, size_member)]
+    with TilePool(threads) as pool:
+        for mm, (var, valid) in enumerate(prefetch_fv3_layers_valid(fnames, variables, layer, depth=prefetch)):
+            for vname in variables:
+                stat[vname][0][mm], stat[vname][1][mm] = \
+                    mean_std(var[vname][0,:,:], None if valid[vname] is None else valid[vname][0,:,:], pool)
+    return stat
+
+
+# Number of layers reduced at a time in the profile mode; the memory of a unit
+# is about PROFILE_BLOCK x (3 float64 + (2 + prefetch) native) fields
+PROFILE_BLOCK = 8
+
+
+def layer_means(field, valid=None):
+    '''
+    Mean of each layer of a (layer, y, x) field over its valid points (NaN
+    for a layer without any), in float64
+    '''
+    if valid is None:
+        return np.mean(field, axis=(1,2), dtype=np.float64)
+    count = np.sum(valid, axis=(1,2))
+    total = np.sum(np.where(valid, field, 0.0), axis=(1,2), dtype=np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(count > 0, total / count, np.nan)
+
+
+def ens_profile_cycle(casedir, time_str, variables, layers, size_member, file_type='dyn', block=PROFILE_BLOCK,
+                      threads=1, prefetch=PREFETCH_DEPTH):
+    '''
+    Full-column profile of one cycle: for every layer (all layers of the
+    files if layers is None), the domain mean of the ensemble mean and of the
+    ensemble spread (std) maps:
+       (layers, {variable: array (stat, layer)})
+
+    Every member file is opened once; the layers are streamed through in
+    blocks of `block` layers (members folded in per block), so the memory
+    does not grow with the number of layers.  The domain means are over the
+    points valid in every member (NaN for a layer without any); variables
+    without layers (time, y, x) raise a ValueError.
+    The next `prefetch` member blocks are read ahead while one is reduced,
+    on `threads` threads.
+    '''
+    fnames = [member_file_name(casedir, time_str, mm+1, file_type) for mm in range(0, size_member)]
+    ncfiles = []
+    try:
+        for fname in fnames:
+            ncfiles.append(nc_open(fname))
+        for vname in variables:
+            var = ncfiles[0].variables[vname]
+            if var.ndim != 4:
+                raise ValueError('no layers in ' + vname + ' ' + str(var.dimensions) +
+                                 '; the profile mode needs (time, layer, y, x) variables')
+        if layers is None:
+            layers = list(range(1, ncfiles[0].variables[variables[0]].shape[1] + 1))
+        blocks = [layers[bb:bb+block] for bb in range(0, len(layers), block)]
+
+        profile = {}
+        for vname in variables:
+            profile[vname] = np.zeros((2, len(layers)))
+
+        # reads in (block, member) order, from the files opened above
+        reads = [(bb, mm) for bb in range(0, len(blocks)) for mm in range(0, size_member)]
+        def read(item):
+            return read_layers_valid(ncfiles[item[1]], variables, blocks[item[0]])
+
+        with TilePool(threads) as pool:
+            members = prefetch_reads(read, reads, prefetch)
+            try:
+                for bb, layer_block in enumerate(blocks):
+                    acc = {}
+                    valid_all = {}
+                    for vname in variables:
+                        acc[vname] = EnsembleAccumulator(pool=pool)
+                        valid_all[vname] = None
+                    for mm in range(0, size_member):
+                        var, valid = next(members)
+                        for vname in variables:
+                            acc[vname].add(var[vname])
+                            if valid[vname] is not None:
+                                valid_all[vname] = valid[vname] if valid_all[vname] is None else \
+                                                   valid_all[vname] & valid[vname]
+
+                    # domain means of the (layer, y, x) mean and std maps of
+                    # the block, over the points valid in every member
+                    for vname in variables:
+                        for jj, field in enumerate([acc[vname].mean(), acc[vname].std()]):
+                            profile[vname][jj, bb*block:bb*block+len(layer_block)] = \
+                                layer_means(field, valid_all[vname])
+            finally:
+                # no read may still be running when the files are closed
+                members.close()
+    finally:
+        for ncfile in ncfiles:
+            ncfile.close()
+
+    return list(layers), profile
@@ -0,0 +1,328 @@
+'''
+Purpose: Opt-in instrumentation of the scripts, to see where the time of a
+         long post-processing run goes:
+            - wall and CPU time of each stage, work unit and file
+            - bytes (and time) read from each NetCDF variable
+            - time of each figure savefig (drawing + writing)
+            - peak RSS of the process (and of its worker processes)
+         written as a JSON or CSV report at exit, with an optional cProfile dump.
+
+Switching it on:
+   python <script>.py ... --instrument report.json [--cprofile run.prof]
+   or, e.g. in a batch job, PYDA_INSTRUMENT=report.json [PYDA_CPROFILE=run.prof]
+   (a .csv report name gives one CSV table instead of JSON)
+
+Note:
+   - when it is off, nc_open() returns the netCDF4 Dataset itself and span()
+     a shared do-nothing context, so the scripts pay one function call per
+     file or stage
+   - reads are counted through nc_open(): its Dataset hands out variables
+     that count the bytes of every slice read
+   - the spans and reads of work units run on worker processes
+     (pyda_util.parallel) are sent back with their results; the spans appear
+     in the report with the pid of the worker (fork start method)
+
+History Log:
+   - 2026.10.18: Created
+'''
+
+import os
+import sys
+import time
+import json
+import atexit
+import resource
+from collections.abc import Mapping
+
+import numpy as np
+from netCDF4 import Dataset
+
+
+_RECORDER = None
+
+
+class _Null:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL = _Null()
+
+
+class Recorder:
+
+    def __init__(self, report, cprofile=None):
+
+        self.report = report
+        self.cprofile = cprofile
+        self.profiler = None
+        self.start = time.perf_counter()
+        self.start_cpu = time.process_time()
+        self.started = time.strftime('%Y-%m-%dT%H:%M:%S')
+        self.spans = []
+        self.reads = {}
+
+    def add_read(self, fname, vname, nbytes, seconds, calls=1):
+
+        key = (fname, vname)
+        entry = self.reads.get(key)
+        if entry is None:
+            self.reads[key] = [nbytes, calls, seconds]
+        else:
+            entry[0] += nbytes
+            entry[1] += calls
+            entry[2] += seconds
+
+
+class _Span:
+
+    def __init__(self, recorder, kind, name, info):
+
+        self.recorder = recorder
+        self.record = {'kind': kind, 'name': name}
+        self.record.update(info)
+
+    def __enter__(self):
+
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc):
+
+        wall = time.perf_counter()
+        self.record.update({'start_s': round(self.wall - self.recorder.start, 6),
+                            'wall_s': round(wall - self.wall, 6),
+                            'cpu_s': round(time.process_time() - self.cpu, 6),
+                            'rss_mb': _peak_rss_mb(resource.RUSAGE_SELF),
+                            'pid': os.getpid()})
+        self.recorder.spans.append(self.record)
+        return False
+
+
+def _peak_rss_mb(who):
+
+    # ru_maxrss is in kB on Linux, in bytes on macOS
+    rss = resource.getrusage(who).ru_maxrss
+    return round(rss / (1024.0 * 1024.0 if sys.platform == 'darwin' else 1024.0), 1)
+
+
+#%%============================================================================
+#  Switching on, and the report
+# =============================================================================
+def enabled():
+    return _RECORDER is not None
+
+
+def enable(report, cprofile=None):
+
+    global _RECORDER
+    if _RECORDER is not None:
+        return _RECORDER
+    _RECORDER = Recorder(report, cprofile)
+
+    # figure savefig (drawing and writing the file) is timed per figure, in
+    # the scripts that use matplotlib
+    if 'matplotlib.figure' in sys.modules:
+        figure = sys.modules['matplotlib.figure']
+        savefig = figure.Figure.savefig
+
+        def timed_savefig(fig, fname, *args, **kwargs):
+            with span('savefig', os.path.basename(str(fname))):
+                return savefig(fig, fname, *args, **kwargs)
+        figure.Figure.savefig = timed_savefig
+
+    if cprofile is not None:
+        import cProfile
+        _RECORDER.profiler = cProfile.Profile()
+        _RECORDER.profiler.enable()
+
+    atexit.register(write_report)
+    return _RECORDER
+
+
+def add_arguments(parser):
+
+    parser.add_argument('--instrument', default=None,
+                        help='write a timing/IO/memory report to this .json or .csv file')
+    parser.add_argument('--cprofile', default=None,
+                        help='with --instrument, also dump cProfile statistics to this file')
+
+
+def setup(args=None):
+    '''
+    Switch on from the command line options (add_arguments) or the
+    PYDA_INSTRUMENT/PYDA_CPROFILE environment variables
+    '''
+    report = getattr(args, 'instrument', None) or os.environ.get('PYDA_INSTRUMENT')
+    cprofile = getattr(args, 'cprofile', None) or os.environ.get('PYDA_CPROFILE')
+    if report is not None or cprofile is not None:
+        enable(report, cprofile)
+
+
+def write_report():
+
+    recorder = _RECORDER
+    if recorder is None:
+        return
+    if recorder.profiler is not None:
+        recorder.profiler.disable()
+        recorder.profiler.dump_stats(recorder.cprofile)
+        recorder.profiler = None
+    if recorder.report is None:
+        return
+
+    total = {'wall_s': round(time.perf_counter() - recorder.start, 6),
+             'cpu_s': round(time.process_time() - recorder.start_cpu, 6),
+             'peak_rss_mb': _peak_rss_mb(resource.RUSAGE_SELF),
+             'children_peak_rss_mb': _peak_rss_mb(resource.RUSAGE_CHILDREN)}
+    reads = [{'file': fname, 'variable': vname, 'bytes': entry[0], 'calls': entry[1],
+              'wall_s': round(entry[2], 6)} for (fname, vname), entry in sorted(recorder.reads.items())]
+    total['bytes_read'] = sum([rr['bytes'] for rr in reads])
+
+    tmpname = recorder.report + '.' + str(os.getpid())
+    with open(tmpname, 'w') as f:
+        if recorder.report.endswith('.csv'):
+            columns = ['kind','name','file','variable','start_s','wall_s','cpu_s','bytes','calls','rss_mb','pid']
+            rows = [dict(rr, kind='read') for rr in reads] + recorder.spans + \
+                   [dict(total, kind='total', name=os.path.basename(sys.argv[0]), rss_mb=total['peak_rss_mb'],
+                         bytes=total['bytes_read'])]
+            # extra span information (unit, obstype, ...) in columns of its own
+            columns += sorted(set([key for row in recorder.spans for key in row]) - set(columns))
+            f.write(','.join(columns) + '\n')
+            for row in rows:
+                f.write(','.join(['' if row.get(cc) is None else str(row[cc]).replace(',', ';') for cc in columns]) + '\n')
+        else:
+            json.dump({'script': os.path.basename(sys.argv[0]), 'argv': sys.argv[1:],
+                       'started': recorder.started, 'total': total,
+                       'spans': recorder.spans, 'reads': reads}, f, indent=1)
+    os.replace(tmpname, recorder.report)
+
+
+#%%============================================================================
+#  Spans (stages, units, files, ...)
+# =============================================================================
+def span(kind, name, **info):
+    '''
+    Context timing one stage/unit/file: with span('stage', 'get_data'): ...
+    '''
+    if _RECORDER is None:
+        return _NULL
+    return _Span(_RECORDER, kind, name, info)
+
+
+def mark():
+    '''
+    On a worker process, before a unit: position in the span list, and the
+    reads start again from zero
+    '''
+    if _RECORDER is None:
+        return None
+    _RECORDER.reads = {}
+    return len(_RECORDER.spans)
+
+
+def since(position):
+    '''
+    On a worker process, after a unit: (spans, reads) of the unit, for merge()
+    '''
+    if position is None or _RECORDER is None:
+        return None
+    return _RECORDER.spans[position:], _RECORDER.reads
+
+
+def merge(records):
+    '''
+    Add the records of a unit run on a worker process (since()) to this one
+    '''
+    if records is None or _RECORDER is None:
+        return
+    spans, reads = records
+    _RECORDER.spans.extend(spans)
+    for (fname, vname), entry in reads.items():
+        _RECORDER.add_read(fname, vname, entry[0], entry[2], entry[1])
+
+
+#%%============================================================================
+#  NetCDF reads
+# =============================================================================
+class _Variable:
+
+    def __init__(self, var, fname):
+        self.__dict__['_var'] = var
+        self.__dict__['_fname'] = fname
+
+    def __getattr__(self, name):
+        return getattr(self._var, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._var, name, value)
+
+    def __len__(self):
+        return len(self._var)
+
+    def __getitem__(self, index):
+        start = time.perf_counter()
+        data = self._var[index]
+        _RECORDER.add_read(self._fname, self._var.name, np.ma.getdata(data).nbytes, time.perf_counter() - start)
+        return data
+
+    def __setitem__(self, index, value):
+        self._var[index] = value
+
+
+class _Variables(Mapping):
+
+    def __init__(self, variables, fname):
+        self._variables = variables
+        self._fname = fname
+
+    def __getitem__(self, name):
+        return _Variable(self._variables[name], self._fname)
+
+    def __iter__(self):
+        return iter(self._variables)
+
+    def __len__(self):
+        return len(self._variables)
+
+    def __contains__(self, name):
+        return name in self._variables
+
+
+class _Dataset:
+
+    def __init__(self, nc, fname):
+        self.__dict__['_nc'] = nc
+        self.__dict__['variables'] = _Variables(nc.variables, fname)
+
+    def __getattr__(self, name):
+        return getattr(self._nc, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._nc, name, value)
+
+    def __getitem__(self, name):
+        return self.variables[name]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._nc.close()
+        return False
+
+
+def nc_open(fname, mode='r', **kwargs):
+    '''
+    netCDF4.Dataset(fname, mode); when instrumented, one that counts the
+    bytes read from each variable
+    '''
+    nc = Dataset(fname, mode, **kwargs)
+    if _RECORDER is None:
+        return nc
+    return _Dataset(nc, str(fname))
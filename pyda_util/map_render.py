@@ -0,0 +1,255 @@
+'''
+Purpose: Map renderer for the FV3 ensemble maps.  The Lambert conformal
+         projection, the projected mesh and the boundaries (coastlines,
+         states, countries) are built once per grid; every frame after the
+         first only swaps the data of the pcolormesh and saves the figure.
+
+Note:
+   - with cache_dir, the Basemap instance and projected mesh are pickled to
+     disk (keyed by the grid), so later runs skip building them as well
+   - render_store_maps() spreads map frames over worker processes; each
+     worker builds its renderer once and then draws many frames.  A frame is
+     drawn the same way whichever renderer draws it, so the PNGs are
+     byte-identical to the serial ones
+   - its speedup is against a serial estimate: every store and grid set up
+     once plus the CPU time of every frame (CPU times, since the wall time of
+     a frame on an oversubscribed node would overstate it); the setup time
+     of each process is reported apart
+
+History Log:
+   - 2026.10.18: Created
+   - 2026.10.18: Parallel rendering of frames read from the case stores
+   - 2026.10.18: Stippling of a mask (e.g. significant differences) and a
+                 colormap of choice, for the experiment difference maps
+   - 2026.10.18: Speedup against a serial estimate, setup per process apart
+'''
+
+import os
+import time
+import pickle
+import hashlib
+import numpy as np
+import matplotlib as mpl
+import matplotlib.pyplot as plt
+from mpl_toolkits.basemap import Basemap
+
+from pyda_util.ens_store import EnsStore
+from pyda_util.parallel import run_units
+
+
+#%%============================================================================
+#  Projection (built once per grid)
+# =============================================================================
+def _projection_key(lon, lat):
+
+    sha = hashlib.sha1()
+    for arr in (lon, lat):
+        arr = np.ascontiguousarray(np.ma.getdata(arr), dtype=np.float64)
+        sha.update(str(arr.shape).encode())
+        sha.update(arr.tobytes())
+    return sha.hexdigest()[0:16]
+
+
+def build_projection(lon, lat, cache_dir=None):
+    '''
+    Returns (m, LON, LAT): the Basemap instance and the projected grid
+    '''
+    if cache_dir is not None:
+        fname = os.path.join(cache_dir, 'basemap_lcc_' + _projection_key(lon, lat) + '.pkl')
+        if os.path.exists(fname):
+            with open(fname, 'rb') as f:
+                return pickle.load(f)
+
+    # Computing the mean
+    lon_0 = lon.mean()
+    lat_0 = lat.mean()
+
+    m = Basemap(width=5100000,height=2900000,\
+                resolution='l',projection='lcc',\
+                lat_ts=23,lat_0=lat_0+1.25,lon_0=lon_0)
+
+    # Create lon/lat suitable for the projection
+    LON,LAT = m(lon,lat)
+
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmpname = fname + '.' + str(os.getpid())
+        with open(tmpname, 'wb') as f:
+            pickle.dump((m, LON, LAT), f)
+        os.replace(tmpname, fname)
+
+    return m, LON, LAT
+
+
+def map_colormap():
+
+    # 24 discrete colors of jet
+    cmap = plt.get_cmap('jet',24)
+    cmaplist = [cmap(i) for i in range(cmap.N)]
+    return mpl.colors.LinearSegmentedColormap.from_list('Custom cmap', cmaplist, cmap.N)
+
+
+#%%============================================================================
+#  Renderer
+# =============================================================================
+# Stipples across the grid (x) at most; denser masks are thinned by a stride
+STIPPLE_POINTS = 120
+
+
+class MapRenderer:
+
+    def __init__(self, lon, lat, cache_dir=None, cmap=None):
+
+        # cmap: name of a matplotlib colormap (default: the discrete jet)
+        self.m, self.LON, self.LAT = build_projection(lon, lat, cache_dir)
+        self.cmap = cmap
+        self.fig = None
+        self.stipple = None
+
+    def _setup(self, var_2d):
+
+        # Create a figure
+        plt.rcParams.update({'font.size': 14})
+        self.fig = plt.figure(figsize=(11,6))
+
+        ax1 = self.fig.add_subplot(1,1,1)
+        ax1.set_position([0.05, 0.05, 0.80, 0.80])
+        self.ax = ax1
+
+        # Plot 2D variable (the mesh is kept; frames only change its data)
+        cmap = map_colormap() if self.cmap is None else plt.get_cmap(self.cmap, 24)
+        self.mesh = self.m.pcolormesh(self.LON,self.LAT,var_2d,cmap=cmap,shading='auto',ax=ax1)
+        self.title = ax1.set_title(' ')
+
+        # Add boundary
+        self.m.drawcoastlines(ax=ax1)
+        self.m.drawstates(ax=ax1)
+        self.m.drawcountries(ax=ax1)
+
+        # Colorbar
+        cbar_ax = self.fig.add_axes([0.88, 0.05, 0.015, 0.800])
+        self.fig.colorbar(self.mesh, cax=cbar_ax)
+
+    def render(self, var_2d, title, clim, figname, stipple=None):
+        '''
+        clim: (vmin, vmax), or None to scale to the data
+        stipple: (y, x) boolean mask of the grid points to stipple, or None
+        '''
+        if self.fig is None:
+            self._setup(var_2d)
+        else:
+            self.mesh.set_array(var_2d)
+
+        # stipples of the previous frame are removed, the new ones on a
+        # thinned grid (every stride-th point in y and x)
+        if self.stipple is not None:
+            self.stipple.remove()
+            self.stipple = None
+        if stipple is not None:
+            stride = max(1, int(np.ceil(np.shape(stipple)[1] / float(STIPPLE_POINTS))))
+            mask = np.asarray(stipple)[::stride,::stride]
+            self.stipple = self.ax.scatter(self.LON[::stride,::stride][mask], self.LAT[::stride,::stride][mask],
+                                           s=4, c='k', marker='.', linewidths=0, zorder=3)
+
+        if clim is None:
+            self.mesh.set_clim(np.nanmin(var_2d), np.nanmax(var_2d))
+        else:
+            self.mesh.set_clim(clim[0], clim[1])
+        self.title.set_text(title)
+
+        # save Figure
+        self.fig.savefig(figname, bbox_inches='tight', dpi=100)
+
+    def close(self):
+
+        if self.fig is not None:
+            plt.close(self.fig)
+            self.fig = None
+            self.stipple = None
+
+
+#%%============================================================================
+#  Frames read from the case stores, serial or on worker processes
+# =============================================================================
+# Per process: one open store per case store and one renderer per grid
+_stores = {}
+_renderers = {}
+
+
+def _render_store_frame(store_fname, time_str, vname, stat_index, title, clim, figname, cache_dir):
+    '''
+    Returns (pid, setup, seconds): the CPU time of the setup done for this
+    frame, {'store <fname>' or 'grid <key>': seconds} (opening a store,
+    building the renderer and figure of a grid; empty once the process has
+    them), and the CPU time of reading and drawing the frame itself
+    '''
+    setup = {}
+    t0 = time.process_time()
+    if store_fname not in _stores:
+        plt.switch_backend('agg')
+        store = EnsStore(store_fname)
+        lon, lat = store.lonlat()
+        _stores[store_fname] = (store, _projection_key(lon, lat))
+        setup['store ' + store_fname] = time.process_time() - t0
+
+    store, key = _stores[store_fname]
+    t0 = time.process_time()
+    var_2d = store.read_cycle(time_str, vname)[stat_index]
+    seconds = time.process_time() - t0
+
+    if key not in _renderers:
+        t0 = time.process_time()
+        lon, lat = store.lonlat()
+        _renderers[key] = MapRenderer(lon, lat, cache_dir)
+        _renderers[key]._setup(var_2d)
+        setup['grid ' + key] = time.process_time() - t0
+
+    t0 = time.process_time()
+    _renderers[key].render(var_2d, title, clim, figname)
+    seconds += time.process_time() - t0
+
+    return os.getpid(), setup, seconds
+
+
+def _close_store_frames():
+
+    for store_fname in list(_stores):
+        _stores.pop(store_fname)[0].close()
+    for key in list(_renderers):
+        _renderers.pop(key).close()
+
+
+def render_store_maps(frames, workers=1, cache_dir=None):
+    '''
+    frames: list of (store_fname, time_str, vname, stat_index, title, clim, figname)
+
+    Yields (figname, error) in the order of `frames` and finally prints the
+    wall time, the setup time of each process, and the speedup over a serial
+    run estimated from the measured times (each store and grid set up once,
+    plus the CPU time of every frame).
+    '''
+    units = [tuple(frame) + (cache_dir,) for frame in frames]
+
+    t0 = time.perf_counter()
+    busy = 0.0
+    setup_process = {}
+    setup_item = {}
+    for unit, result, error in run_units(_render_store_frame, units, workers):
+        if error is None:
+            pid, setup, seconds = result
+            busy += seconds
+            setup_process[pid] = setup_process.get(pid, 0.0) + sum(setup.values())
+            for item, item_seconds in setup.items():
+                setup_item[item] = min(item_seconds, setup_item.get(item, item_seconds))
+        yield unit[6], error
+    wall = time.perf_counter() - t0
+
+    # renderers of the serial path live in this process
+    _close_store_frames()
+
+    if wall > 0 and len(setup_process) > 0:
+        serial = sum(setup_item.values()) + busy
+        print('Rendered ' + str(len(units)) + ' maps in ' + '%.1f' % wall + ' s on ' + str(max(workers, 1)) +
+              ' process(es); setup per process ' + ', '.join(['%.1f' % tt for tt in setup_process.values()]) +
+              ' s, frames ' + '%.1f' % busy + ' s CPU; serial estimate ' + '%.1f' % serial + ' s, speedup ' +
+              '%.2f' % (serial / wall) + 'x')
@@ -0,0 +1,118 @@
+'''
+Purpose: Read NetCDF variables as plain ndarrays (native dtype, contiguous)
+         plus one validity mask, instead of numpy.ma.MaskedArray.
+
+         The mask is built once, from the same attributes netCDF4 uses for
+         its masked arrays (_FillValue or the default fill value, missing_value,
+         valid_min/valid_max/valid_range), and the hot paths reduce over
+         data[valid] or with np.where(valid, ...) rather than going through
+         the masked-array machinery for every diff, mean and std.
+
+Note:
+   - valid is None when every value is valid, so callers can take the plain
+     numpy path without any mask at all
+   - the data at invalid points is left as read (the fill value)
+   - packed variables (scale_factor/add_offset) are unpacked after the mask
+     has been built from the packed values
+
+History Log:
+   - 2026.10.18: Created
+'''
+
+import numpy as np
+from netCDF4 import default_fillvals
+
+
+def invalid_mask(var, data):
+    '''
+    True where netCDF4 would mask data (the raw values of var); None if nowhere
+    '''
+    if data.dtype.kind not in 'iuf':
+        return None
+
+    invalid = np.zeros(data.shape, dtype=bool)
+    names = var.ncattrs()
+    dtype = data.dtype
+
+    def equal(value):
+        value = np.array(value, dtype)
+        return np.isnan(data) if dtype.kind == 'f' and np.isnan(value) else data == value
+
+    if 'missing_value' in names:
+        for value in np.atleast_1d(var.getncattr('missing_value')):
+            invalid |= equal(value)
+
+    # _FillValue, otherwise the default fill value (of a byte variable only if
+    # filling is on)
+    if '_FillValue' in names:
+        fill = var.getncattr('_FillValue')
+    elif dtype.str[1:] not in ('i1', 'u1'):
+        fill = default_fillvals[dtype.str[1:]]
+    else:
+        fill = var.get_fill_value()
+    if fill is not None:
+        invalid |= equal(fill)
+
+    # valid_range, otherwise valid_min/valid_max
+    valid_min = valid_max = None
+    if 'valid_range' in names and np.size(var.getncattr('valid_range')) == 2:
+        valid_min, valid_max = var.getncattr('valid_range')
+    else:
+        if 'valid_min' in names:
+            valid_min = var.getncattr('valid_min')
+        if 'valid_max' in names:
+            valid_max = var.getncattr('valid_max')
+    if valid_min is not None:
+        invalid |= data < np.array(valid_min, dtype)
+    if valid_max is not None:
+        invalid |= data > np.array(valid_max, dtype)
+
+    return invalid if invalid.any() else None
+
+
+def read_valid(var, index=Ellipsis):
+    '''
+    (data, valid) of var[index]: a plain contiguous ndarray and the validity
+    mask (None if every value is valid)
+    '''
+    mask_state, scale_state = var.mask, var.scale
+    var.set_auto_mask(False)
+    var.set_auto_scale(False)
+    try:
+        data = np.ascontiguousarray(var[index])
+    finally:
+        var.set_auto_mask(mask_state)
+        var.set_auto_scale(scale_state)
+
+    invalid = invalid_mask(var, data)
+
+    names = var.ncattrs()
+    if scale_state and ('scale_factor' in names or 'add_offset' in names):
+        data = data * var.getncattr('scale_factor') if 'scale_factor' in names else data.astype(np.float64)
+        if 'add_offset' in names:
+            data = data + var.getncattr('add_offset')
+
+    return data, (None if invalid is None else ~invalid)
+
+
+def combine_valid(*masks):
+    '''
+    Valid where all the masks are (None: valid everywhere)
+    '''
+    masks = [mask for mask in masks if mask is not None]
+    if len(masks) == 0:
+        return None
+    valid = masks[0].copy()
+    for mask in masks[1:]:
+        valid &= mask
+    return valid
+
+
+def as_masked(data, valid):
+    '''
+    The masked array of (data, valid), for the few places (printing, plotting)
+    that still want one; no copy of data
+    '''
+    if valid is None:
+        return data
+    return np.ma.array(data, mask=~valid)
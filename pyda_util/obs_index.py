@@ -0,0 +1,251 @@
+'''
+Purpose: Sidecar index of a UFO/IODA file for station, obs-type and spatial
+         queries without scanning every row:
+            station_id@MetaData (decoded)  -> rows
+            <var>@ObsType                  -> rows, for every variable
+            lat/lon bucket (BUCKET deg)    -> rows
+
+Layout (<file>.idx.npz):
+   each key is stored as a permutation of the rows sorted by the key, the
+   distinct values and the offsets of each value in the permutation, so the
+   rows of one value are perm[offsets[i]:offsets[i+1]]
+
+Note:
+   - the sidecar records the size and mtime of the file it was built from;
+     ObsIndex.open() rebuilds it when the file has changed
+   - if the sidecar cannot be written (read-only directory), the index is
+     kept in memory for this run only
+
+History Log:
+   - 2026.10.18: Created
+   - 2026.10.18: Reads go through pyda_util.instrument.nc_open (counted when instrumented)
+'''
+
+import os
+import numpy as np
+from netCDF4 import chartostring
+
+from pyda_util.cache import file_fingerprint
+from pyda_util.instrument import nc_open
+
+
+# Size of the lat/lon buckets [deg]
+BUCKET = 1.0
+
+# Bumped when the layout changes (older sidecars are rebuilt)
+INDEX_VERSION = 1
+
+EARTH_RADIUS = 6371.0   # km
+
+
+def index_name(filename):
+
+    return filename + '.idx.npz'
+
+
+def _group(keys):
+
+    # rows sorted by key, the distinct keys and their offsets (int32 rows
+    # keep the sidecar small)
+    perm = np.argsort(keys, kind='stable')
+    values, starts = np.unique(keys[perm], return_index=True)
+    offsets = np.append(starts, len(keys))
+    if len(keys) < 2**31:
+        perm = perm.astype(np.int32)
+    return perm, values, offsets
+
+
+def _bucket(lat, lon, size):
+
+    ilat = np.floor((np.asarray(lat, dtype=np.float64) + 90.0) / size).astype(np.int64)
+    ilon = np.floor((np.asarray(lon, dtype=np.float64) % 360.0) / size).astype(np.int64)
+    return ilat, ilon
+
+
+class ObsIndex:
+
+    def __init__(self, arrays):
+
+        self.arrays = arrays
+        self.bucket = float(arrays['bucket'])
+        self.nlon = int(np.ceil(360.0 / self.bucket))
+        self.lat = arrays['lat']
+        self.lon = arrays['lon']
+
+    # -------------------------------------------------------------------------
+    #   Building, saving and opening
+    # -------------------------------------------------------------------------
+    @classmethod
+    def build(cls, filename, bucket=BUCKET):
+
+        arrays = {'version': INDEX_VERSION, 'bucket': bucket,
+                  'source': np.array([str(x) for x in file_fingerprint(filename)])}
+
+        with nc_open(filename, mode='r') as f:
+            lat = np.ma.filled(f.variables['latitude@MetaData'][:].astype(np.float64), np.nan)
+            lon = np.ma.filled(f.variables['longitude@MetaData'][:].astype(np.float64), np.nan)
+            arrays['lat'] = lat.astype(np.float32)
+            arrays['lon'] = lon.astype(np.float32)
+
+            if 'station_id@MetaData' in f.variables:
+                sid = np.char.strip(chartostring(f.variables['station_id@MetaData'][:]))
+                arrays['station_perm'], arrays['station_values'], arrays['station_offsets'] = _group(sid)
+
+            variables = []
+            for name in f.variables:
+                if name.endswith('@ObsType'):
+                    vname = name.split('@')[0]
+                    otype = np.ma.filled(f.variables[name][:], -999).astype(np.int64)
+                    arrays['obstype_' + vname + '_perm'], arrays['obstype_' + vname + '_values'], \
+                        arrays['obstype_' + vname + '_offsets'] = _group(otype)
+                    variables.append(vname)
+            arrays['variables'] = np.array(variables)
+
+        ilat, ilon = _bucket(lat, lon, bucket)
+        key = ilat * int(np.ceil(360.0 / bucket)) + ilon
+        key[~(np.isfinite(lat) & np.isfinite(lon))] = -1
+        arrays['bucket_perm'], arrays['bucket_values'], arrays['bucket_offsets'] = _group(key)
+
+        return cls(arrays)
+
+    def save(self, fname):
+
+        tmpname = fname + '.' + str(os.getpid()) + '.npz'
+        np.savez(tmpname, **self.arrays)
+        os.replace(tmpname, fname)
+
+    @classmethod
+    def open(cls, filename, bucket=BUCKET):
+        '''
+        The index of filename: the sidecar if it is current, otherwise rebuilt
+        (and the sidecar rewritten)
+        '''
+        fname = index_name(filename)
+        source = [str(x) for x in file_fingerprint(filename)]
+        if os.path.exists(fname):
+            with np.load(fname) as f:
+                arrays = {key: f[key] for key in f.files}
+            if int(arrays['version']) == INDEX_VERSION and float(arrays['bucket']) == bucket and \
+               list(arrays['source']) == source:
+                return cls(arrays)
+
+        index = cls.build(filename, bucket)
+        try:
+            index.save(fname)
+        except OSError as err:
+            print('WARNING: index of ' + filename + ' not saved (' + str(err) + ')')
+        return index
+
+    # -------------------------------------------------------------------------
+    #   Queries (rows are returned sorted)
+    # -------------------------------------------------------------------------
+    def _rows(self, name, value):
+
+        values = self.arrays[name + '_values']
+        ii = np.searchsorted(values, value)
+        if ii >= len(values) or values[ii] != value:
+            return np.zeros(0, dtype=np.int64)
+        offsets = self.arrays[name + '_offsets']
+        return np.sort(self.arrays[name + '_perm'][offsets[ii]:offsets[ii+1]])
+
+    def variables(self):
+        return [str(vname) for vname in self.arrays['variables']]
+
+    def station(self, sid):
+        '''
+        All obs of station sid (e.g. 'KCBK')
+        '''
+        if 'station_values' not in self.arrays:
+            return np.zeros(0, dtype=np.int64)
+        return self._rows('station', sid.strip())
+
+    def obstype(self, code, variable=None):
+        '''
+        All obs of type code (of variable; default: the first variable in the file)
+        '''
+        if variable is None:
+            variable = self.variables()[0]
+        return self._rows('obstype_' + variable, code)
+
+    def box(self, lat0, lat1, lon0, lon1, obstype=None, variable=None):
+        '''
+        Obs with lat0 <= lat <= lat1 and lon0 <= lon <= lon1 (optionally of one
+        type); lon in degrees east, the box may cross 0E (lon0 > lon1)
+        '''
+        lon0 = lon0 % 360.0
+        lon1 = lon1 % 360.0
+        ilat0, ilon0 = _bucket(lat0, lon0, self.bucket)
+        ilat1, ilon1 = _bucket(lat1, lon1, self.bucket)
+        if ilon1 >= ilon0:
+            ilons = np.arange(ilon0, ilon1+1)
+        else:
+            ilons = np.concatenate([np.arange(ilon0, self.nlon), np.arange(0, ilon1+1)])
+        keys = (np.arange(ilat0, ilat1+1)[:,None] * self.nlon + ilons[None,:]).ravel()
+        rows = self._bucket_rows(keys)
+
+        # exact test within the buckets on the edge
+        lat = self.lat[rows]
+        lon = self.lon[rows] % 360.0
+        inside = (lat >= lat0) & (lat <= lat1)
+        if lon1 >= lon0:
+            inside &= (lon >= lon0) & (lon <= lon1)
+        else:
+            inside &= (lon >= lon0) | (lon <= lon1)
+        rows = rows[inside]
+
+        if obstype is not None:
+            rows = np.intersect1d(rows, self.obstype(obstype, variable), assume_unique=True)
+        return rows
+
+    def _bucket_rows(self, keys):
+
+        values  = self.arrays['bucket_values']
+        offsets = self.arrays['bucket_offsets']
+        perm    = self.arrays['bucket_perm']
+        ii = np.searchsorted(values, keys)
+        found = (ii < len(values))
+        found[found] = values[ii[found]] == keys[found]
+        chunks = [perm[offsets[jj]:offsets[jj+1]] for jj in ii[found]]
+        if len(chunks) == 0:
+            return np.zeros(0, dtype=np.int64)
+        return np.sort(np.concatenate(chunks))
+
+    def nearest(self, lat, lon, k=1):
+        '''
+        The k obs nearest to (lat, lon): rows and great-circle distances [km],
+        nearest first
+        '''
+        ilat, ilon = _bucket(lat, lon, self.bucket)
+        nlat = int(np.ceil(180.0 / self.bucket))
+
+        # grow a square of buckets until it holds k obs ...
+        ring = 0
+        while True:
+            lats = np.arange(max(ilat-ring, 0), min(ilat+ring, nlat-1)+1)
+            lons = np.arange(ilon-ring, ilon+ring+1) % self.nlon
+            rows = self._bucket_rows(np.unique((lats[:,None] * self.nlon + lons[None,:]).ravel()))
+            if len(rows) >= k or ring >= max(nlat, self.nlon):
+                break
+            ring = 2*ring + 1
+        if len(rows) == 0:
+            return rows, np.zeros(0)
+
+        # ... then take every bucket within the k-th distance found so far
+        reach = np.rad2deg(np.sort(self._distance(lat, lon, rows))[min(k, len(rows))-1] / EARTH_RADIUS)
+        lat0, lat1 = max(lat - reach, -90.0), min(lat + reach, 90.0)
+        coslat = np.cos(np.deg2rad(max(abs(lat0), abs(lat1))))
+        if lat0 <= -90.0 or lat1 >= 90.0 or reach >= 180.0 * coslat:
+            rows = self.box(lat0, lat1, 0.0, 359.9999)
+        else:
+            rows = self.box(lat0, lat1, lon - reach / coslat, lon + reach / coslat)
+
+        dist = self._distance(lat, lon, rows)
+        order = np.argsort(dist, kind='stable')[0:k]
+        return rows[order], dist[order]
+
+    def _distance(self, lat, lon, rows):
+
+        phi0, lam0 = np.deg2rad(lat), np.deg2rad(lon)
+        phi, lam = np.deg2rad(self.lat[rows].astype(np.float64)), np.deg2rad(self.lon[rows].astype(np.float64))
+        a = np.sin((phi - phi0)/2)**2 + np.cos(phi0)*np.cos(phi)*np.sin((lam - lam0)/2)**2
+        return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
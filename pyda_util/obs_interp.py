@@ -0,0 +1,193 @@
+'''
+Purpose: Bilinear interpolation of FV3 fields to observation locations, as a
+         sparse (nobs, ny*nx) weight matrix built once per (grid, obs set)
+         and cached on disk.  All the members of a field are then
+         interpolated with one sparse matrix product, for the ensemble mean
+         and spread at the obs (spread-skill) and the rank of each obs in the
+         ensemble (rank histogram).
+
+         The weights are found on the curvilinear lat/lon grid: the nearest
+         grid point of every obs comes from a KD-tree (scipy.spatial) of the
+         grid points on the unit sphere, the four cells around it are tested
+         by inverting their bilinear map in the tangent plane at the obs
+         (a few vectorised Newton steps), and the cell holding the obs gives
+         its four weights.
+
+Note:
+   - obs outside the grid get no weights (their row of the matrix is empty);
+     inside() tells them apart
+   - the cache file (interp_<key>.npz) is keyed on the grid lat/lon and the
+     obs lat/lon, so another grid or obs file gets weights of its own
+   - the spread is the std over the members with ddof=0, as in the maps
+
+History Log:
+   - 2026.10.18: Created
+'''
+
+import os
+import hashlib
+import numpy as np
+import scipy.sparse
+from scipy.spatial import cKDTree
+
+
+# Tolerance on the cell coordinates (s, t in [0, 1]) of an obs on a cell edge
+EDGE_TOL = 1.0e-6
+
+# Newton steps inverting the bilinear map of a cell
+NEWTON_STEPS = 8
+
+
+#%%============================================================================
+#  Weights
+# =============================================================================
+def _unit_vectors(lat, lon):
+
+    lat = np.deg2rad(np.asarray(lat, dtype=np.float64))
+    lon = np.deg2rad(np.asarray(lon, dtype=np.float64))
+    return np.stack([np.cos(lat)*np.cos(lon), np.cos(lat)*np.sin(lon), np.sin(lat)], axis=-1)
+
+
+def _cell_coordinates(p00, p01, p11, p10):
+
+    # (s, t) of the origin in the cell p00 -> p01 (s) -> p11 -> p10 (t),
+    # corners (n, 2) in the tangent plane of each obs
+    s = np.full(len(p00), 0.5)
+    t = np.full(len(p00), 0.5)
+    for step in range(NEWTON_STEPS):
+        f = ((1-s)*(1-t))[:,None]*p00 + (s*(1-t))[:,None]*p01 + (s*t)[:,None]*p11 + ((1-s)*t)[:,None]*p10
+        ds = (1-t)[:,None]*(p01 - p00) + t[:,None]*(p11 - p10)
+        dt = (1-s)[:,None]*(p10 - p00) + s[:,None]*(p11 - p01)
+        det = ds[:,0]*dt[:,1] - ds[:,1]*dt[:,0]
+        det = np.where(det == 0.0, np.nan, det)
+        s = s - ( dt[:,1]*f[:,0] - dt[:,0]*f[:,1]) / det
+        t = t - (-ds[:,1]*f[:,0] + ds[:,0]*f[:,1]) / det
+    return s, t
+
+
+def bilinear_weights(lat, lon, obs_lat, obs_lon):
+    '''
+    Sparse (nobs, ny*nx) matrix of the bilinear weights of the grid (lat, lon:
+    (ny, nx) in degrees) at the obs points
+    '''
+    lat = np.asarray(np.ma.getdata(lat), dtype=np.float64)
+    lon = np.asarray(np.ma.getdata(lon), dtype=np.float64)
+    ny, nx = lat.shape
+    grid = _unit_vectors(lat, lon).reshape(-1, 3)
+    obs_lat = np.asarray(obs_lat, dtype=np.float64)
+    obs_lon = np.asarray(obs_lon, dtype=np.float64)
+    nobs = len(obs_lat)
+
+    # tangent plane (east, north) at every obs
+    rlat = np.deg2rad(obs_lat)
+    rlon = np.deg2rad(obs_lon)
+    point = _unit_vectors(obs_lat, obs_lon)
+    east  = np.stack([-np.sin(rlon), np.cos(rlon), np.zeros(nobs)], axis=-1)
+    north = np.stack([-np.sin(rlat)*np.cos(rlon), -np.sin(rlat)*np.sin(rlon), np.cos(rlat)], axis=-1)
+
+    def plane(flat, rows):
+        xyz = grid[flat] - point[rows]
+        return np.stack([np.sum(xyz*east[rows], axis=1), np.sum(xyz*north[rows], axis=1)], axis=-1)
+
+    # nearest grid point; obs more than 60 deg (chord 1) away from the grid
+    # are not looked at (the tangent plane would fold the cells over)
+    near = np.isfinite(obs_lat) & np.isfinite(obs_lon)
+    nearest = np.zeros(nobs, dtype=np.int64)
+    if near.any():
+        dist, nearest[near] = cKDTree(grid).query(point[near])
+        near[near] = dist < 1.0
+    jn, in_ = np.divmod(nearest, nx)
+
+    # the four cells around the nearest grid point, until one holds the obs
+    found = np.zeros(nobs, dtype=bool)
+    cols = np.zeros((nobs, 4), dtype=np.int64)
+    weights = np.zeros((nobs, 4))
+    for dj, di in [(0, 0), (-1, 0), (0, -1), (-1, -1)]:
+        rows = np.flatnonzero(near & ~found)
+        if len(rows) == 0:
+            break
+        j0 = np.clip(jn[rows] + dj, 0, ny - 2)
+        i0 = np.clip(in_[rows] + di, 0, nx - 2)
+        corners = [j0*nx + i0, j0*nx + i0 + 1, (j0+1)*nx + i0 + 1, (j0+1)*nx + i0]
+        s, t = _cell_coordinates(*[plane(cc, rows) for cc in corners])
+        ok = (s >= -EDGE_TOL) & (s <= 1 + EDGE_TOL) & (t >= -EDGE_TOL) & (t <= 1 + EDGE_TOL)
+
+        rows = rows[ok]
+        s = np.clip(s[ok], 0.0, 1.0)
+        t = np.clip(t[ok], 0.0, 1.0)
+        cols[rows] = np.stack([cc[ok] for cc in corners], axis=-1)
+        weights[rows] = np.stack([(1-s)*(1-t), s*(1-t), s*t, (1-s)*t], axis=-1)
+        found[rows] = True
+
+    rows = np.flatnonzero(found)
+    return scipy.sparse.csr_matrix((weights[rows].ravel(), (np.repeat(rows, 4), cols[rows].ravel())),
+                                   shape=(nobs, ny*nx))
+
+
+def _array_key(*arrays):
+
+    sha = hashlib.sha1()
+    for arr in arrays:
+        arr = np.ascontiguousarray(np.ma.getdata(arr), dtype=np.float64)
+        sha.update(str(arr.shape).encode())
+        sha.update(arr.tobytes())
+    return sha.hexdigest()[0:16]
+
+
+def interp_weights(lat, lon, obs_lat, obs_lon, cache_dir=None):
+    '''
+    bilinear_weights(), read from (or saved to) cache_dir/interp_<key>.npz
+    '''
+    if cache_dir is None:
+        return bilinear_weights(lat, lon, obs_lat, obs_lon)
+
+    fname = os.path.join(cache_dir, 'interp_' + _array_key(lat, lon) + '_' + _array_key(obs_lat, obs_lon) + '.npz')
+    if os.path.exists(fname):
+        return scipy.sparse.load_npz(fname).tocsr()
+
+    weights = bilinear_weights(lat, lon, obs_lat, obs_lon)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmpname = fname + '.' + str(os.getpid()) + '.npz'
+    scipy.sparse.save_npz(tmpname, weights)
+    os.replace(tmpname, fname)
+    return weights
+
+
+def inside(weights):
+    '''
+    True for the obs inside the grid (the ones with weights)
+    '''
+    return np.diff(weights.indptr) > 0
+
+
+#%%============================================================================
+#  Ensemble at the obs
+# =============================================================================
+def interp_members(weights, members):
+    '''
+    members: (ny*nx, member) array, one column per member -> (nobs, member),
+    in one sparse matrix product
+    '''
+    return weights @ np.ma.getdata(members)
+
+
+def ens_at_obs(hx):
+    '''
+    Ensemble mean and spread (std, ddof=0) of hx (nobs, member)
+    '''
+    return np.mean(hx, axis=1), np.std(hx, axis=1)
+
+
+def obs_rank(hx, obs):
+    '''
+    Rank of every obs among its members (0: below all, member: above all);
+    members equal to the obs count half below, half above
+    '''
+    below = np.sum(hx < obs[:,None], axis=1)
+    equal = np.sum(hx == obs[:,None], axis=1)
+    return below + equal // 2
+
+
+def rank_histogram(rank, size_member):
+
+    return np.bincount(rank, minlength=size_member + 1)
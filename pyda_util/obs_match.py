@@ -0,0 +1,267 @@
+'''
+Purpose: Match the observations of a GSI diag file and a JEDI (UFO/IODA) file
+         on their keys instead of their row order:
+            station id and obs type           exactly
+            lat, lon, pressure/height, time   within tolerances
+
+         Both sets are sorted on (station/type group, vertical coordinate);
+         every obs of one set gets the window of the other set within the
+         vertical tolerance by np.searchsorted, the candidate pairs are
+         checked against the other tolerances, and pairs are accepted one to
+         one, best first.  Everything is vectorised (no Python loop over obs).
+
+Note:
+   - GSI pressure is in hPa and JEDI air_pressure in Pa; both are used in hPa
+   - GSI Time is in hours from the analysis time; JEDI time@MetaData is used,
+     or datetime@MetaData relative to the diag file's date_time.  Without a
+     time on both sides the time tolerance is not checked
+   - obs without a vertical coordinate are never matched
+
+History Log:
+   - 2026.10.18: Created
+   - 2026.10.18: Reads go through pyda_util.instrument.nc_open (counted when instrumented)
+'''
+
+import numpy as np
+from netCDF4 import chartostring
+
+from pyda_util.instrument import nc_open
+
+
+# Tolerances of the match
+TOLERANCE = {'lat': 0.01, 'lon': 0.01, 'vcoord': 0.1, 'time': 0.01}   # deg, deg, hPa or m, hours
+
+# Diag-file prefix of the wind components
+GSI_PREFIX = {'eastward_wind': 'u_', 'northward_wind': 'v_'}
+
+# Candidate pairs looked at in one go (bounds the memory of a match)
+MAX_CANDIDATES = 20000000
+
+
+#%%============================================================================
+#  Readers
+# =============================================================================
+def _filled(arr):
+    return np.ma.filled(np.ma.asarray(arr).astype(np.float64), np.nan)
+
+
+def _station_id(chars):
+
+    # (nobs, nchar) characters -> bytes strings without the trailing blanks;
+    # decoding millions of ids to str would cost more than the whole match
+    if chars.ndim == 1:
+        return np.char.rstrip(np.asarray(chars).astype('S'))
+    chars = np.ma.filled(chars, b'').copy()
+    blank = chars == b' '
+    chars[np.flip(np.logical_and.accumulate(np.flip(blank, axis=1), axis=1), axis=1)] = b''
+    return chars.view('S' + str(chars.shape[1])).ravel()
+
+
+def read_gsi_obs(filename, VarName, vcoord='pressure'):
+    '''
+    The keys and hofx (without bias correction) of a GSI diag file
+    '''
+    prefix = GSI_PREFIX.get(VarName, '')
+    with nc_open(filename, mode='r') as f:
+        names = f.variables.keys()
+        obs = {}
+        obs['sid']   = _station_id(f.variables['Station_ID'][:])
+        obs['otype'] = np.ma.filled(f.variables['Observation_Type'][:], -999).astype(np.int64)
+        obs['lat']   = _filled(f.variables['Latitude'][:])
+        obs['lon']   = _filled(f.variables['Longitude'][:])
+        obs['vcoord'] = _filled(f.variables['Pressure' if vcoord == 'pressure' else 'Height'][:])
+        obs['time']  = _filled(f.variables['Time'][:])
+        if prefix + 'Forecast_unadjusted' in names:
+            obs['hofx'] = _filled(f.variables[prefix + 'Forecast_unadjusted'][:])
+        else:
+            obs['hofx'] = _filled(f.variables[prefix + 'Observation'][:]) - \
+                          _filled(f.variables[prefix + 'Obs_Minus_Forecast_unadjusted'][:])
+        obs['date_time'] = str(getattr(f, 'date_time', ''))
+    return obs
+
+
+def read_jedi_obs(filename, VarName, vcoord='pressure', date_time=''):
+    '''
+    The keys and hofx of a JEDI file; date_time (YYYYMMDDHH) is the reference
+    of datetime@MetaData
+    '''
+    with nc_open(filename, mode='r') as f:
+        names = f.variables.keys()
+        obs = {}
+        obs['sid']   = _station_id(f.variables['station_id@MetaData'][:])
+        obs['otype'] = np.ma.filled(f.variables[VarName + '@ObsType'][:], -999).astype(np.int64)
+        obs['lat']   = _filled(f.variables['latitude@MetaData'][:])
+        obs['lon']   = _filled(f.variables['longitude@MetaData'][:])
+        if vcoord == 'pressure':
+            obs['vcoord'] = _filled(f.variables['air_pressure@MetaData'][:]) / 100.0
+        else:
+            obs['vcoord'] = _filled(f.variables['height@MetaData'][:])
+
+        if 'time@MetaData' in names:
+            obs['time'] = _filled(f.variables['time@MetaData'][:])
+        elif 'datetime@MetaData' in names and len(date_time) == 10:
+            stamps = chartostring(f.variables['datetime@MetaData'][:]) if f.variables['datetime@MetaData'].ndim > 1 \
+                     else f.variables['datetime@MetaData'][:]
+            stamps = np.char.rstrip(np.asarray(stamps, dtype=str), 'Z').astype('datetime64[s]')
+            ref = np.datetime64(date_time[0:4] + '-' + date_time[4:6] + '-' + date_time[6:8] + 'T' + date_time[8:10] + ':00:00')
+            obs['time'] = (stamps - ref).astype(np.float64) / 3600.0
+        else:
+            obs['time'] = np.full(len(obs['otype']), np.nan)
+
+        hofx = [VarName + '@' + group for group in ['hofx','hofx0'] if VarName + '@' + group in names]
+        obs['hofx'] = _filled(f.variables[hofx[0]][:])
+    return obs
+
+
+#%%============================================================================
+#  Matching
+# =============================================================================
+def _sid_codes(sid):
+
+    # station ids up to 8 characters as one 64-bit integer each (much faster
+    # to sort than strings); longer ids sorted as they are
+    if sid.dtype.itemsize <= 8:
+        sid = sid.astype('S8').view(np.uint64)
+    return np.unique(sid, return_inverse=True)[1]
+
+
+def _groups(a, b):
+
+    # one integer per (station id, obs type), common to both sets
+    sid_codes = _sid_codes(np.concatenate([a['sid'], b['sid']]))
+    otype = np.concatenate([a['otype'], b['otype']])
+    omin = otype.min()
+    codes = sid_codes.astype(np.int64) * (otype.max() - omin + 1) + (otype - omin)
+    codes = np.unique(codes, return_inverse=True)[1]
+    return codes[0:len(a['sid'])], codes[len(a['sid']):]
+
+
+def _one_to_one(ia, ib, cost):
+
+    # accept pairs that are each other's best, drop the pairs they exclude, repeat
+    # pairs whose obs have no other candidate need no sorting
+    alone = (np.bincount(ia)[ia] == 1) & (np.bincount(ib)[ib] == 1) if len(ia) > 0 else np.zeros(0, dtype=bool)
+    keep_a = [ia[alone]]
+    keep_b = [ib[alone]]
+    ia, ib, cost = ia[~alone], ib[~alone], cost[~alone]
+    while len(ia) > 0:
+        order = np.argsort(cost, kind='stable')
+        ia, ib, cost = ia[order], ib[order], cost[order]
+        best_b = np.zeros(len(ia), dtype=bool)
+        best_b[np.unique(ib, return_index=True)[1]] = True
+        best_a = np.zeros(len(ia), dtype=bool)
+        best_a[np.unique(ia, return_index=True)[1]] = True
+        mutual = best_a & best_b
+        used_a = np.zeros(ia.max()+1, dtype=bool)
+        used_b = np.zeros(ib.max()+1, dtype=bool)
+        keep_a.append(ia[mutual])
+        keep_b.append(ib[mutual])
+        used_a[ia[mutual]] = True
+        used_b[ib[mutual]] = True
+        rest = ~used_a[ia] & ~used_b[ib]
+        ia, ib, cost = ia[rest], ib[rest], cost[rest]
+    return np.concatenate(keep_a), np.concatenate(keep_b)
+
+
+def match_obs(a, b, tolerance=TOLERANCE):
+    '''
+    a, b: dicts of sid, otype, lat, lon, vcoord, time (read_gsi_obs/read_jedi_obs)
+
+    Returns (ia, ib, unmatched_a, unmatched_b): a[ia[i]] matches b[ib[i]]
+    '''
+    tol = dict(TOLERANCE)
+    tol.update(tolerance)
+    ga, gb = _groups(a, b)
+
+    # group and vertical coordinate in one sortable number
+    va = a['vcoord']
+    vb = b['vcoord']
+    valid_a = np.flatnonzero(np.isfinite(va))
+    valid_b = np.flatnonzero(np.isfinite(vb))
+    if len(valid_a) == 0 or len(valid_b) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.arange(len(va)), np.arange(len(vb))
+    vmin = min(va[valid_a].min(), vb[valid_b].min())
+    span = max(va[valid_a].max(), vb[valid_b].max()) - vmin + 4*tol['vcoord'] + 1.0
+    ka = ga[valid_a] * span + (va[valid_a] - vmin)
+    kb = gb[valid_b] * span + (vb[valid_b] - vmin)
+
+    # both sides sorted (sort-merge: the searches below then walk a in order)
+    order = np.argsort(ka)
+    ka = ka[order]
+    sorted_a = valid_a[order]
+    order = np.argsort(kb)
+    kb = kb[order]
+    valid_b = valid_b[order]
+
+    # window of a within the vertical tolerance, for every obs of b
+    lo = np.searchsorted(ka, kb - tol['vcoord'], side='left')
+    hi = np.searchsorted(ka, kb + tol['vcoord'], side='right')
+    nwin = hi - lo
+
+    pairs_a = []
+    pairs_b = []
+    costs   = []
+    # candidate pairs in chunks of b, so a dense window cannot exhaust memory
+    cum = np.cumsum(nwin)
+    start = 0
+    while start < len(kb):
+        stop = int(np.searchsorted(cum, (cum[start-1] if start > 0 else 0) + MAX_CANDIDATES, side='right'))
+        stop = max(stop, start+1)
+        n = nwin[start:stop]
+        ib = np.repeat(valid_b[start:stop], n)
+        first = np.repeat(lo[start:stop], n)
+        offset = np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)
+        ia = sorted_a[first + offset]
+
+        dlat = np.abs(a['lat'][ia] - b['lat'][ib])
+        dlon = np.abs((a['lon'][ia] - b['lon'][ib] + 180.0) % 360.0 - 180.0)
+        dver = np.abs(a['vcoord'][ia] - b['vcoord'][ib])
+        dtim = np.abs(a['time'][ia] - b['time'][ib])
+        dtim = np.where(np.isnan(dtim), 0.0, dtim)
+        ok = (dlat <= tol['lat']) & (dlon <= tol['lon']) & (dver <= tol['vcoord']) & (dtim <= tol['time'])
+
+        cost = (dlat/tol['lat'])**2 + (dlon/tol['lon'])**2 + (dver/tol['vcoord'])**2 + (dtim/tol['time'])**2
+        pairs_a.append(ia[ok])
+        pairs_b.append(ib[ok])
+        costs.append(cost[ok])
+        start = stop
+
+    ia, ib = _one_to_one(np.concatenate(pairs_a), np.concatenate(pairs_b), np.concatenate(costs))
+
+    matched = np.zeros(len(va), dtype=bool)
+    matched[ia] = True
+    unmatched_a = np.flatnonzero(~matched)
+    matched = np.zeros(len(vb), dtype=bool)
+    matched[ib] = True
+    unmatched_b = np.flatnonzero(~matched)
+    return ia, ib, unmatched_a, unmatched_b
+
+
+#%%============================================================================
+#  Unmatched obs
+# =============================================================================
+UNMATCHED_COLUMNS = ['side','row','sid','otype','lat','lon','vcoord','time']
+
+
+def format_obs(obs, rows):
+
+    return ["row= " + str(r) + "  SID=" + obs['sid'][r].decode() + "  otype= " + str(obs['otype'][r]) +
+            "  lat= " + str(obs['lat'][r]) + "  lon= " + str(obs['lon'][r]) +
+            "  vcoord= " + str(obs['vcoord'][r]) + "  time= " + str(obs['time'][r]) for r in rows]
+
+
+def write_unmatched(outname, sides):
+    '''
+    sides: [(name, obs, rows), ...] -> one CSV of the unmatched rows; the
+    columns are gathered in bulk and formatted with one format string
+    '''
+    line = '%s,%d,%s,%d,%.7g,%.7g,%.7g,%.7g'
+    with open(outname, 'w') as f:
+        f.write(','.join(UNMATCHED_COLUMNS) + '\n')
+        for name, obs, rows in sides:
+            if len(rows) == 0:
+                continue
+            rows = np.asarray(rows)
+            columns = [[name] * len(rows), rows.tolist(), obs['sid'][rows].astype(str).tolist(),
+                       obs['otype'][rows].tolist()] + [obs[key][rows].tolist() for key in ['lat','lon','vcoord','time']]
+            f.write('\n'.join(map(line.__mod__, zip(*columns))) + '\n')
@@ -0,0 +1,119 @@
+'''
+Purpose: Mergeable statistics of the hofx difference (GSI - UFO), so that the
+         output files of all MPI tasks (ufo_*_0000.nc4, _0001, ...) can be
+         reduced one by one, on any worker, without concatenating them.
+
+         count, sum, sum of squares, min/max and a fixed-bin histogram give
+         the global bias, RMS, STD, range and histogram.
+
+History Log:
+   - 2026.10.18: Created
+   - 2026.10.18: add() takes a validity mask; ufo_diff_stat reads plain arrays
+                 (pyda_util.nc_read)
+   - 2026.10.18: Reads go through pyda_util.instrument.nc_open (counted when instrumented)
+'''
+
+import glob
+import numpy as np
+
+from pyda_util.nc_read import read_valid, combine_valid
+from pyda_util.instrument import nc_open
+
+
+# Histogram of the difference (the bins of plt_ufo_omb.py)
+HIST_BINS  = 50
+HIST_RANGE = (-2.0, 2.0)
+
+
+class DiffStat:
+
+    def __init__(self, bins=HIST_BINS, range=HIST_RANGE, threshold=None):
+        '''
+        threshold: (abs, rel) to count |diff| > abs + rel*|gsi|, or None
+        '''
+        self.edges = np.linspace(range[0], range[1], bins+1)
+        self.threshold = threshold
+        self.count = 0
+        self.sum   = 0.0
+        self.sumsq = 0.0
+        self.min   = np.inf
+        self.max   = -np.inf
+        self.hist  = np.zeros(bins, dtype=np.int64)
+        self.above = 0
+
+    def add(self, diff, gsi=None, valid=None):
+
+        # missing (masked, or valid False) and non-finite values are left out
+        if valid is None:
+            valid = combine_valid(None if not np.ma.is_masked(diff) else ~np.ma.getmaskarray(diff),
+                                  None if not np.ma.is_masked(gsi) else ~np.ma.getmaskarray(gsi))
+        values = np.ma.getdata(diff)
+        values = (values if valid is None else values[valid]).astype(np.float64)
+        finite = np.isfinite(values)
+        if not finite.all():
+            values = values[finite]
+        else:
+            finite = None
+        if len(values) == 0:
+            return
+
+        self.count += len(values)
+        self.sum   += values.sum()
+        self.sumsq += np.dot(values, values)
+        self.min    = min(self.min, values.min())
+        self.max    = max(self.max, values.max())
+        self.hist  += np.histogram(values, self.edges)[0]
+
+        if self.threshold is not None:
+            gsi_values = np.ma.getdata(gsi)
+            if valid is not None:
+                gsi_values = gsi_values[valid]
+            if finite is not None:
+                gsi_values = gsi_values[finite]
+            self.above += np.count_nonzero(np.abs(values) > self.threshold[0] + self.threshold[1]*np.abs(gsi_values))
+
+    def merge(self, other):
+
+        if not np.array_equal(self.edges, other.edges) or self.threshold != other.threshold:
+            raise ValueError('statistics with different bins or thresholds cannot be merged')
+        self.count += other.count
+        self.sum   += other.sum
+        self.sumsq += other.sumsq
+        self.min    = min(self.min, other.min)
+        self.max    = max(self.max, other.max)
+        self.hist  += other.hist
+        self.above += other.above
+        return self
+
+    def bias(self):
+        return self.sum / self.count if self.count > 0 else np.nan
+
+    def rms(self):
+        return np.sqrt(self.sumsq / self.count) if self.count > 0 else np.nan
+
+    def std(self):
+        if self.count == 0:
+            return np.nan
+        return np.sqrt(max(self.sumsq / self.count - self.bias()**2, 0.0))
+
+
+def task_files(pattern):
+    '''
+    The MPI-task files matching a glob pattern, sorted
+    '''
+    files = sorted(glob.glob(pattern))
+    if len(files) == 0:
+        raise ValueError('no file matches ' + pattern)
+    return files
+
+
+def ufo_diff_stat(filename, VarName, gsi_group='GsiHofXBc', bins=HIST_BINS, range=HIST_RANGE, threshold=None):
+    '''
+    DiffStat of VarName@<gsi_group> - VarName@hofx in one UFO file (one work unit)
+    '''
+    with nc_open(filename, mode='r') as f:
+        gsi, gsi_valid = read_valid(f.variables[VarName + '@' + gsi_group])
+        ufo, ufo_valid = read_valid(f.variables[VarName + '@hofx'])
+    stat = DiffStat(bins, range, threshold)
+    stat.add(gsi - ufo, gsi, combine_valid(gsi_valid, ufo_valid))
+    return stat
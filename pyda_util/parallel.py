@@ -0,0 +1,70 @@
+'''
+Purpose: Run independent work units (e.g. one case/cycle of the ensemble
+         statistics) serially or across a process pool.
+
+History Log:
+   - 2026.10.18: Created
+   - 2026.10.18: Units are timed when instrumented (pyda_util.instrument)
+'''
+
+from concurrent.futures import ProcessPoolExecutor
+
+from pyda_util import instrument
+
+
+def _label(unit):
+
+    return ' '.join([str(x) for x in unit if isinstance(x, (str, int, float))])
+
+
+def _call(func, unit):
+
+    # A failing unit (missing or corrupt member file, ...) is reported, not raised
+    with instrument.span('unit', func.__name__, unit=_label(unit) if instrument.enabled() else None):
+        try:
+            return unit, func(*unit), None
+        except Exception as err:
+            return unit, None, type(err).__name__ + ': ' + str(err)
+
+
+def _call_worker(func, unit):
+
+    # on a worker process: the spans and reads of the unit go back with its result
+    position = instrument.mark()
+    return _call(func, unit) + (instrument.since(position),)
+
+
+def run_units(func, units, workers=1):
+    '''
+    Run func(*unit) for every unit; in a process pool when workers > 1.
+
+    Yields (unit, result, error) in the order of `units`, so progress output
+    and results are the same as for a serial run.  A unit that fails gives
+    result None and an error message; the other units keep going.
+    '''
+    units = list(units)
+
+    if workers <= 1:
+        for unit in units:
+            yield _call(func, unit)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_call_worker, func, unit) for unit in units]
+        for unit, future in zip(units, futures):
+            try:
+                unit, result, error, records = future.result()
+                instrument.merge(records)
+                yield unit, result, error
+            except Exception as err:
+                # the worker process itself died (e.g. killed for memory)
+                yield unit, None, type(err).__name__ + ': ' + str(err)
+
+
+def report_failures(failed):
+
+    if len(failed) == 0:
+        return
+    print('WARNING: ' + str(len(failed)) + ' unit(s) failed and were skipped')
+    for label, error in failed:
+        print('  - ' + label + ': ' + error)
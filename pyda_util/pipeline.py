@@ -0,0 +1,166 @@
+'''
+Purpose: Small stage runner for the scripts, in place of the SWITCH_* flags.
+         A YAML config declares the stages, the data each one needs and
+         makes, and which stages to run.
+
+Config (YAML):
+   stages:
+     - name: get_data
+       makes: [ens_maps, ens_dm]
+     - name: plot_ts
+       needs: [ens_dm]
+   run: [get_data, plot_ts]
+   settings:                # optional, used by the script itself
+     workers: 4
+
+Note:
+   - stages run in dependency order; what a stage returns is handed in memory
+     to the stages after it
+   - a stage whose outputs are up to date is skipped; if a later stage needs
+     its data, the data is loaded back from disk instead
+   - an input made by a stage that is not in the run list is loaded as well,
+     unless that stage cannot load it or its outputs are not up to date (e.g.
+     a fresh output directory): the stage is then added to the run
+
+History Log:
+   - 2026.10.18: Created
+   - 2026.10.18: Stages are timed when instrumented (pyda_util.instrument)
+   - 2026.10.18: The producer of an input that cannot be loaded is run as well
+'''
+
+import yaml
+
+from pyda_util import instrument
+
+
+def load_config(fname):
+
+    with open(fname) as f:
+        config = yaml.safe_load(f)
+    if config is None or 'stages' not in config:
+        raise ValueError('no stages declared in ' + fname)
+    if config.get('settings') is None:
+        config['settings'] = {}
+    return config
+
+
+class Stage:
+    '''
+    run(data)      -> dict of the data the stage makes (data: dict of its inputs)
+    is_current()   -> True if the outputs on disk are up to date (optional)
+    load()         -> dict of the data the stage makes, read back from disk (optional)
+    '''
+
+    def __init__(self, name, run, needs=(), makes=(), is_current=None, load=None):
+        self.name = name
+        self.run = run
+        self.needs = list(needs)
+        self.makes = list(makes)
+        self.is_current = is_current
+        self.load = load
+
+
+class Pipeline:
+
+    def __init__(self, config, functions):
+        '''
+        config:    the loaded YAML config
+        functions: {stage name: {'run': ..., 'is_current': ..., 'load': ...}}
+        '''
+        self.stages = {}
+        self.producer = {}
+        for decl in config['stages']:
+            name = decl['name']
+            if name not in functions:
+                raise ValueError('stage ' + name + ' is declared but not implemented')
+            stage = Stage(name, needs=decl.get('needs') or [], makes=decl.get('makes') or [], **functions[name])
+            self.stages[name] = stage
+            for item in stage.makes:
+                if item in self.producer:
+                    raise ValueError(item + ' is made by both ' + self.producer[item] + ' and ' + name)
+                self.producer[item] = name
+
+        for stage in self.stages.values():
+            for item in stage.needs:
+                if item not in self.producer:
+                    raise ValueError('stage ' + stage.name + ' needs ' + item + ', which no stage makes')
+
+        self.default_run = config.get('run') or list(self.stages)
+        self.current = {}
+
+    def is_current(self, name):
+        '''
+        True if the outputs of the stage are up to date (checked once per run)
+        '''
+        if name not in self.current:
+            stage = self.stages[name]
+            self.current[name] = stage.is_current is not None and stage.is_current()
+        return self.current[name]
+
+    def loadable(self, name):
+        '''
+        True if the outputs of the stage can be read back from disk instead of
+        running it
+        '''
+        stage = self.stages[name]
+        return stage.load is not None and (stage.is_current is None or self.is_current(name))
+
+    def order(self, names):
+        '''
+        The stages in `names`, each after the stages making its inputs; a
+        stage not in `names` whose outputs cannot be loaded is added
+        '''
+        for name in names:
+            if name not in self.stages:
+                raise ValueError('unknown stage ' + name + ' (declared: ' + ', '.join(self.stages) + ')')
+
+        ordered = []
+        visiting = []
+
+        def visit(name):
+            if name in ordered:
+                return
+            if name in visiting:
+                raise ValueError('circular stage dependency: ' + ' -> '.join(visiting + [name]))
+            visiting.append(name)
+            for item in self.stages[name].needs:
+                upstream = self.producer[item]
+                if upstream in names or not self.loadable(upstream):
+                    visit(upstream)
+            visiting.pop()
+            ordered.append(name)
+
+        for name in names:
+            visit(name)
+        return ordered
+
+    def run(self, names=None, force=False):
+
+        if names is None:
+            names = self.default_run
+
+        self.current = {}
+        data = {}
+        for name in self.order(names):
+            stage = self.stages[name]
+
+            if name not in names:
+                print('Stage ' + name + ': added, its outputs are needed and cannot be loaded from disk')
+            elif not force and self.is_current(name):
+                print('Stage ' + name + ': up to date, skipped')
+                continue
+
+            # inputs not handed over in memory are read back from disk
+            for item in stage.needs:
+                if item not in data:
+                    upstream = self.stages[self.producer[item]]
+                    if upstream.load is None:
+                        raise RuntimeError('stage ' + name + ' needs ' + item + ', but ' + upstream.name +
+                                           ' did not run and cannot load it from disk')
+                    data.update(upstream.load())
+
+            print('Stage ' + name)
+            with instrument.span('stage', name):
+                data.update(stage.run(data) or {})
+
+        return data
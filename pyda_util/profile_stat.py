@@ -0,0 +1,81 @@
+'''
+Purpose: Vertical-profile statistics of observations: every observation is
+         put in a pressure (or height) bin by one np.digitize, and count,
+         mean, RMS and STD per bin (optionally per ObsType) come from
+         weighted np.bincount, so the cost is linear in the number of obs.
+
+Note:
+   - bins are right-closed, edges[i] < x <= edges[i+1]; obs outside all bins
+     and missing/non-finite values are left out
+   - statistics from several files can be added up with merge_profile_stat()
+
+History Log:
+   - 2026.10.18: Created
+'''
+
+import numpy as np
+
+
+def profile_bins(coord, edges):
+    '''
+    Bin index of each value of coord (-1: outside the bins or missing)
+    '''
+    data = np.ma.getdata(coord).astype(np.float64)
+    bins = np.digitize(data, edges, right=True) - 1
+    bins[(bins < 0) | (bins >= len(edges) - 1)] = -1
+    bins[np.ma.getmaskarray(coord) | ~np.isfinite(data)] = -1
+    return bins
+
+
+def profile_stat(bins, nbins, values, groups=None):
+    '''
+    bins:   bin index of each obs (profile_bins)
+    values: the quantity (e.g. ombg); masked/non-finite values are left out
+    groups: optional group of each obs (e.g. ObsType)
+
+    Returns {group: {'count','sum','sumsq'}} each of size nbins; group is
+    'all' without groups
+    '''
+    data  = np.ma.getdata(values).astype(np.float64)
+    valid = (bins >= 0) & ~np.ma.getmaskarray(values) & np.isfinite(data)
+
+    if groups is None:
+        keys, index = np.array(['all']), np.zeros(np.count_nonzero(valid), dtype=np.intp)
+    else:
+        keys, index = np.unique(np.ma.getdata(groups)[valid], return_inverse=True)
+
+    # one bincount per moment over (group, bin)
+    flat = index * nbins + bins[valid]
+    size = len(keys) * nbins
+    v = data[valid]
+    count = np.bincount(flat, minlength=size).reshape(len(keys), nbins)
+    total = np.bincount(flat, weights=v, minlength=size).reshape(len(keys), nbins)
+    sumsq = np.bincount(flat, weights=v*v, minlength=size).reshape(len(keys), nbins)
+
+    out = {}
+    for kk, key in enumerate(keys.tolist()):
+        out[key] = {'count': count[kk], 'sum': total[kk], 'sumsq': sumsq[kk]}
+    return out
+
+
+def merge_profile_stat(stat, other):
+
+    for key, moments in other.items():
+        if key not in stat:
+            stat[key] = {name: value.copy() for name, value in moments.items()}
+        else:
+            for name in moments:
+                stat[key][name] = stat[key][name] + moments[name]
+    return stat
+
+
+def profile_summary(moments):
+    '''
+    count, mean, RMS and STD per bin (NaN for empty bins)
+    '''
+    count = moments['count']
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = moments['sum'] / count
+        rms  = np.sqrt(moments['sumsq'] / count)
+        std  = np.sqrt(np.maximum(moments['sumsq'] / count - mean * mean, 0.0))
+    return count, mean, rms, std
@@ -0,0 +1,218 @@
+'''
+Purpose: Area-weighted statistics over verification regions (NW/SW/NC/SC/
+         NE/SE CONUS, land/water, elevation bands) of the FV3 grid.
+
+         The regions are turned once per grid into one flattened index array
+         (region after region) and cos(lat) weights, and cached on disk.  A
+         field (or a stack of fields) is then reduced for all regions at once
+         with a segment sum (np.add.reduceat) over the gathered points.
+
+Input: lat/lon (and hgtsfc) of an FV3 dyn file; land of the matching phy file
+
+Note:
+   - regions may overlap (e.g. NW and land); a point is gathered once for
+     every region it belongs to
+   - land/water need the phy file next to the dyn file, elevation bands need
+     hgtsfc; regions that cannot be built (or are empty) are left out
+
+History Log:
+   - 2026.10.18: Created
+   - 2026.10.18: Reads go through pyda_util.instrument.nc_open (counted when instrumented)
+   - 2026.10.18: reduce() takes the validity masks of the fields; the statistics are over
+                 the valid points of each region (NaN for a region without any)
+'''
+
+import os
+import hashlib
+import numpy as np
+
+from pyda_util.cache import digest
+from pyda_util.instrument import nc_open
+
+
+#%%============================================================================
+#  Region definitions
+# =============================================================================
+# CONUS sub-regions: [lon_min, lon_max, lat_min, lat_max] (lon in -180..180)
+CONUS_BOXES = {'NW': [-125.0, -103.0, 37.0, 50.0],
+               'SW': [-125.0, -103.0, 25.0, 37.0],
+               'NC': [-103.0,  -90.0, 37.0, 50.0],
+               'SC': [-103.0,  -90.0, 25.0, 37.0],
+               'NE': [ -90.0,  -67.0, 37.0, 50.0],
+               'SE': [ -90.0,  -67.0, 25.0, 37.0]}
+
+# Elevation bands [m]
+ELEVATION_BANDS = {'elev_0000_0500': [0.0, 500.0],
+                   'elev_0500_1500': [500.0, 1500.0],
+                   'elev_1500_up':   [1500.0, np.inf]}
+
+
+def region_masks(lat, lon, land=None, hgt=None):
+    '''
+    Returns {region name: boolean mask on the grid}
+    '''
+    lon180 = (np.asarray(lon) + 180.0) % 360.0 - 180.0
+    lat = np.asarray(lat)
+
+    masks = {'domain': np.ones(lat.shape, dtype=bool)}
+    for name, (lon0, lon1, lat0, lat1) in CONUS_BOXES.items():
+        masks[name] = (lon180 >= lon0) & (lon180 < lon1) & (lat >= lat0) & (lat < lat1)
+
+    if land is not None:
+        # 0: water, 1: land, 2: sea ice
+        land = np.rint(np.asarray(land))
+        masks['land']  = land == 1
+        masks['water'] = land != 1
+
+    if hgt is not None:
+        hgt = np.asarray(hgt)
+        for name, (h0, h1) in ELEVATION_BANDS.items():
+            masks[name] = (hgt >= h0) & (hgt < h1)
+
+    return masks
+
+
+#%%============================================================================
+#  Region index
+# =============================================================================
+class RegionIndex:
+
+    def __init__(self, names, index, offsets, weights, shape):
+
+        self.names   = list(names)
+        self.index   = index      # flattened grid points, region after region
+        self.offsets = offsets    # region ii is index[offsets[ii]:offsets[ii+1]]
+        self.weights = weights    # cos(lat) at index
+        self.shape   = tuple(shape)
+        self.wsum    = np.add.reduceat(weights, offsets[:-1])
+
+    @classmethod
+    def build(cls, lat, lon, land=None, hgt=None):
+
+        weights_2d = np.cos(np.deg2rad(np.asarray(lat, dtype=np.float64))).ravel()
+
+        names = []
+        index = []
+        for name, mask in region_masks(lat, lon, land, hgt).items():
+            points = np.flatnonzero(mask)
+            if len(points) == 0:
+                continue
+            names.append(name)
+            index.append(points)
+
+        offsets = np.concatenate([[0], np.cumsum([len(points) for points in index])])
+        index = np.concatenate(index)
+        return cls(names, index, offsets, weights_2d[index], np.shape(lat))
+
+    def save(self, fname):
+
+        tmpname = fname + '.' + str(os.getpid()) + '.npz'
+        np.savez(tmpname, names=np.array(self.names), index=self.index, offsets=self.offsets,
+                 weights=self.weights, shape=np.array(self.shape))
+        os.replace(tmpname, fname)
+
+    @classmethod
+    def load(cls, fname):
+
+        with np.load(fname) as f:
+            return cls([str(name) for name in f['names']], f['index'], f['offsets'], f['weights'], f['shape'])
+
+    def reduce(self, fields, valid=None):
+        '''
+        Area-weighted mean and std of each field over the valid points of
+        each region (NaN for a region without any).
+
+        fields: (ny, nx) or (nfield, ny, nx)
+        valid:  validity mask of the same shape, or one mask (or None) per
+                field; None: valid everywhere
+        Returns mean, std, each (nregion,) or (nfield, nregion)
+        '''
+        fields = np.ma.getdata(fields)
+        single = fields.ndim == 2
+        nfield = 1 if single else fields.shape[0]
+        values = fields.reshape((nfield, -1))[:, self.index].astype(np.float64)
+
+        if valid is not None and not isinstance(valid, np.ndarray):
+            if all([mask is None for mask in valid]):
+                valid = None
+            else:
+                valid = np.stack([np.ones(self.shape, dtype=bool) if mask is None else mask for mask in valid])
+
+        if valid is None:
+            weights = self.weights
+            wsum = self.wsum
+        else:
+            # invalid points (fill values) get no weight and no value
+            use = np.asarray(valid).reshape((nfield, -1))[:, self.index]
+            values[~use] = 0.0
+            weights = use * self.weights
+            wsum = np.add.reduceat(weights, self.offsets[:-1], axis=1)
+
+        # one segment sum over all regions
+        weighted = values * weights
+        s1 = np.add.reduceat(weighted, self.offsets[:-1], axis=1)
+        weighted *= values
+        s2 = np.add.reduceat(weighted, self.offsets[:-1], axis=1)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = s1 / wsum
+            std  = np.sqrt(np.maximum(s2 / wsum - mean * mean, 0.0))
+        if single:
+            return mean[0], std[0]
+        return mean, std
+
+
+#%%============================================================================
+#  Building the index from an FV3 file, cached per grid
+# =============================================================================
+def read_region_fields(dyn_fname):
+
+    # lat/lon/hgtsfc from the dyn file, land from the phy file next to it
+    with nc_open(dyn_fname) as f:
+        lat = np.squeeze(f.variables['lat'][:])
+        lon = np.squeeze(f.variables['lon'][:])
+        hgt = np.squeeze(f.variables['hgtsfc'][:]) if 'hgtsfc' in f.variables else None
+
+    land = None
+    phy_fname = os.path.join(os.path.dirname(dyn_fname), os.path.basename(dyn_fname).replace('dyn', 'phy'))
+    if phy_fname != dyn_fname and os.path.exists(phy_fname):
+        with nc_open(phy_fname) as f:
+            if 'land' in f.variables:
+                land = np.squeeze(f.variables['land'][:])
+
+    return lat, lon, land, hgt
+
+
+def region_index_file(dyn_fname, cache_dir):
+    '''
+    Build (or find) the region index of the grid of `dyn_fname`; returns the
+    name of the cached index file.  The grid fields are read and hashed, so
+    it is called once per case, not per cycle.
+    '''
+    lat, lon, land, hgt = read_region_fields(dyn_fname)
+
+    key = digest([_array_digest(lat), _array_digest(lon), _array_digest(land), _array_digest(hgt),
+                  CONUS_BOXES, ELEVATION_BANDS])
+    fname = os.path.join(cache_dir, 'regions_' + key + '.npz')
+    if not os.path.exists(fname):
+        os.makedirs(cache_dir, exist_ok=True)
+        RegionIndex.build(lat, lon, land, hgt).save(fname)
+    return fname
+
+
+def _array_digest(arr):
+
+    if arr is None:
+        return None
+    return hashlib.sha1(np.ascontiguousarray(np.ma.getdata(arr), dtype=np.float64).tobytes()).hexdigest()
+
+
+# Per process: indexes already loaded
+_loaded = {}
+
+
+def load_region_index(fname):
+
+    if fname not in _loaded:
+        _loaded[fname] = RegionIndex.load(fname)
+    return _loaded[fname]
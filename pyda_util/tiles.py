@@ -0,0 +1,100 @@
+'''
+Purpose: Tiled, thread-parallel reductions over the FV3 grid, for the 3 km
+         (1799 x 1059) grids where one whole-grid NumPy call keeps a single
+         core busy.
+
+         The (y, x) grid is cut into TILE_SHAPE tiles, taken from the shape of
+         the field read from the file (no grid dimensions in the scripts).
+         Each tile is reduced on a thread pool: NumPy releases the GIL in its
+         element-wise and reduction loops, so the tiles run on all the
+         threads, and the results are written into (or combined from) views
+         of the whole-grid arrays.
+
+Note:
+   - element-wise statistics (the ensemble mean/std maps of
+     pyda_util.ens_stat) are the same for any tiling and number of threads
+   - domain means/stds are accumulated in float64 from the tiles (two
+     passes, like np.std), so they do not depend on the number of threads
+   - threads x worker processes (--workers) should not exceed the cores
+
+History Log:
+   - 2026.10.18: Created
+'''
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+# Tile size (y, x) in grid points: ~60 tiles on the 3 km grid, 2 on the 13 km one
+TILE_SHAPE = (128, 256)
+
+
+def grid_tiles(shape, tile_shape=TILE_SHAPE):
+    '''
+    (y slice, x slice) of every tile of a (..., y, x) grid, row by row
+    '''
+    ny, nx = shape[-2:]
+    ty, tx = tile_shape
+    return [(slice(y0, min(y0 + ty, ny)), slice(x0, min(x0 + tx, nx)))
+            for y0 in range(0, ny, ty) for x0 in range(0, nx, tx)]
+
+
+class TilePool:
+    '''
+    Runs a function on every tile of a grid, on `threads` threads (serially
+    for threads <= 1)
+    '''
+
+    def __init__(self, threads=1, tile_shape=TILE_SHAPE):
+
+        self.threads = max(int(threads), 1)
+        self.tile_shape = tile_shape
+        self._executor = ThreadPoolExecutor(max_workers=self.threads) if self.threads > 1 else None
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def map(self, func, shape):
+        '''
+        [func(tile) for every tile of the grid of `shape`], in tile order
+        '''
+        tiles = grid_tiles(shape, self.tile_shape)
+        if self._executor is None or len(tiles) == 1:
+            return [func(tile) for tile in tiles]
+        return list(self._executor.map(func, tiles))
+
+
+def mean_std(field, valid=None, pool=None):
+    '''
+    Mean and std (ddof=0) of a 2-D field over its valid points, reduced tile
+    by tile on pool (a TilePool; serial if None)
+    '''
+    pool = pool or TilePool(1)
+
+    def points(tile):
+        return field[tile] if valid is None else field[tile][valid[tile]]
+
+    def count_sum(tile):
+        values = points(tile)
+        return values.size, np.sum(values, dtype=np.float64)
+
+    parts = pool.map(count_sum, field.shape)
+    count = sum([part[0] for part in parts])
+    if count == 0:
+        return np.nan, np.nan
+    mean = sum([part[1] for part in parts]) / count
+
+    def sum_squares(tile):
+        dev = np.subtract(points(tile), mean, dtype=np.float64)
+        return np.sum(dev * dev)
+
+    return mean, np.sqrt(sum(pool.map(sum_squares, field.shape)) / count)
@@ -0,0 +1,124 @@
+'''
+Purpose: Reading UFO (JEDI) output files for the list/plot drivers, and the
+         batch manifests that run many (file, obstype, variable, subtask) jobs
+         in one process.
+
+Manifest (one job per line, '#' starts a comment, $VARIABLES are expanded):
+   $taskdir/ufo_sfc_2021010612_t_0000.nc4   surface  air_temperature  exp3
+   $taskdir/ufo_sfc_2021010612_uv_0000.nc4  surface  eastward_wind    exp3
+
+Note:
+   - a UfoFile keeps the file open and every variable it has read, so jobs on
+     the same file (e.g. eastward_wind and northward_wind) share the MetaData
+     arrays and open the file only once
+
+History Log:
+   - 2026.10.18: Created
+   - 2026.10.18: read_rows() for the rows selected by a query (pyda_util.obs_index)
+   - 2026.10.18: read_valid(): plain arrays and validity masks (pyda_util.nc_read)
+   - 2026.10.18: Reads go through pyda_util.instrument.nc_open (counted when instrumented)
+'''
+
+import os
+import numpy as np
+from netCDF4 import chartostring
+
+from pyda_util.nc_read import read_valid
+from pyda_util.instrument import nc_open
+
+
+class UfoFile:
+
+    def __init__(self, filename):
+
+        self.filename = filename
+        self.nc = nc_open(filename, mode='r')
+        self._vars = {}
+        self._valid = {}
+
+    def close(self):
+        self.nc.close()
+        self._vars = {}
+        self._valid = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def read(self, name):
+        '''
+        The whole variable (read once)
+        '''
+        if name not in self._vars:
+            self._vars[name] = self.nc.variables[name][:]
+        return self._vars[name]
+
+    def read_rows(self, name, rows):
+        '''
+        The given rows (sorted) of a variable; only the span of the rows is
+        read, unless the whole variable has been read already
+        '''
+        if name in self._vars:
+            return self._vars[name][rows]
+        if len(rows) == 0:
+            return self.nc.variables[name][0:0]
+        return self.nc.variables[name][rows[0]:rows[-1]+1][rows - rows[0]]
+
+    def read_valid(self, name, rows=None):
+        '''
+        (data, valid) of the whole variable (read once) or of the given rows
+        (sorted): a plain ndarray and its validity mask (None: all valid)
+        '''
+        if rows is None:
+            if name not in self._valid:
+                self._valid[name] = read_valid(self.nc.variables[name])
+            return self._valid[name]
+        if name in self._valid:
+            data, valid = self._valid[name]
+        elif len(rows) == 0:
+            return read_valid(self.nc.variables[name], slice(0, 0))
+        else:
+            data, valid = read_valid(self.nc.variables[name], slice(rows[0], rows[-1]+1))
+            rows = rows - rows[0]
+        return data[rows], (None if valid is None else valid[rows])
+
+    def station_id(self, rows=None):
+        '''
+        station_id@MetaData decoded to strings (all rows are read once)
+        '''
+        if rows is not None:
+            if 'station_id' in self._vars:
+                return self._vars['station_id'][rows]
+            return np.char.strip(chartostring(self.read_rows('station_id@MetaData', rows)))
+        if 'station_id' not in self._vars:
+            self._vars['station_id'] = np.char.strip(chartostring(self.read('station_id@MetaData')))
+        return self._vars['station_id']
+
+
+def read_manifest(fname):
+    '''
+    Returns the jobs as a list of (filename, obstype, variable, subtask)
+    '''
+    jobs = []
+    with open(fname) as f:
+        for nline, line in enumerate(f):
+            line = line.split('#')[0].strip()
+            if line == '':
+                continue
+            fields = os.path.expandvars(line).split()
+            if len(fields) != 4:
+                raise ValueError(fname + ', line ' + str(nline+1) + ': expected "file obstype variable subtask"')
+            jobs.append(tuple(fields))
+    return jobs
+
+
+def group_by_file(jobs):
+    '''
+    [(filename, [jobs on that file]), ...] in the order the files first appear
+    '''
+    groups = {}
+    for job in jobs:
+        groups.setdefault(job[0], []).append(job)
+    return list(groups.items())